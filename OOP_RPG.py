@@ -1,14 +1,36 @@
 import random
+import io
 import os
+import shutil
+import struct
 import sys
+import tempfile
 import time
+import zlib
 from abc import ABC, abstractmethod
+from array import array
 from enum import Enum
-from typing import List, Tuple, Optional, Dict, Any
+from functools import lru_cache
+from itertools import accumulate
+from typing import List, Tuple, Optional, Dict, Any, Callable
+import argparse
+import heapq
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+try:
+    import numpy as np
+except ImportError:  # NumPy необязателен: без него работают обычные реализации
+    np = None
 
 # Константы
-MAP_WIDTH = 60
+MAP_WIDTH = 60   # Размер карты по умолчанию
 MAP_HEIGHT = 20
+VIEW_WIDTH = 60   # Видимая на экране часть карты
+VIEW_HEIGHT = 20
+ROOM_PADDING = 2  # Минимальный зазор между комнатами
+ENEMY_BUCKET_SIZE = 8  # Сторона корзины индекса ближайших врагов
 
 # Пул имен врагов
 ENEMY_NAMES = [
@@ -27,92 +49,130 @@ class EnemyType(Enum):
     ELITE = "elite"
     BOSS = "boss"
 
+# Базовые характеристики врага по слову в имени: HP, сила, защита, символ
+ENEMY_KINDS = [
+    ("Голем", 40, 8, 6, 'G'),
+    ("Элементаль", 30, 12, 2, 'E'),
+    ("Лич", 25, 15, 4, 'L'),
+    ("Троль", 50, 10, 3, 'T'),
+]
+DEFAULT_ENEMY_KIND = (20, 6, 2, 'O')
+
+
+def enemy_kind(name: str) -> Tuple[int, int, int, str]:
+    """Базовые HP, сила, защита и символ врага с данным именем"""
+    for keyword, base_hp, base_str, base_arm, symbol in ENEMY_KINDS:
+        if keyword in name:
+            return base_hp, base_str, base_arm, symbol
+    return DEFAULT_ENEMY_KIND
+
+
+@dataclass(frozen=True)
+class EnemyTemplate:
+    """Общие характеристики врагов одного вида (легковес)
+    
+    У элитного шаблона стартовое hp больше max_hp: элитный враг
+    усиливается поверх обычного, а max_hp остается от обычного.
+    """
+    name: str
+    symbol: str
+    hp: int
+    max_hp: int
+    strength: int
+    armor: int
+    exp_reward: int
+    enemy_type: EnemyType
+
+
 # ========== АБСТРАКТНАЯ ФАБРИКА ==========
 class CharacterFactory(ABC):
-    """Абстрактная фабрика для создания персонажей"""
+    """Абстрактная фабрика для создания персонажей
+    
+    Обычные и элитные враги создаются по таблице шаблонов, которая
+    считается один раз на класс фабрики и уровень и общая для всех карт.
+    """
+    
+    _template_tables: Dict[Tuple[type, int], Tuple[Tuple[EnemyTemplate, EnemyTemplate], ...]] = {}
+    
+    def enemy_templates(self) -> Tuple[Tuple[EnemyTemplate, EnemyTemplate], ...]:
+        """Пары (обычный, элитный) шаблонов в порядке ENEMY_NAMES"""
+        key = (type(self), self.level)
+        table = self._template_tables.get(key)
+        if table is None:
+            table = tuple((normal, self._elite_template(normal))
+                          for normal in map(self._normal_template, ENEMY_NAMES))
+            self._template_tables[key] = table
+        return table
+    
+    def create_normal_enemy(self, x: int, y: int) -> 'Enemy':
+        normal, _ = self.rng.choice(self.enemy_templates())
+        return Enemy(normal, x, y, rng=self.rng)
+    
+    def create_elite_enemy(self, x: int, y: int) -> 'Enemy':
+        _, elite = self.rng.choice(self.enemy_templates())
+        return Enemy(elite, x, y, rng=self.rng)
     
     @abstractmethod
-    def create_normal_enemy(self, x: int, y: int) -> 'Hero':
+    def _normal_template(self, name: str) -> EnemyTemplate:
         pass
     
     @abstractmethod
-    def create_elite_enemy(self, x: int, y: int) -> 'Hero':
+    def _elite_template(self, normal: EnemyTemplate) -> EnemyTemplate:
         pass
     
     @abstractmethod
-    def create_boss(self, x: int, y: int) -> 'Hero':
+    def create_boss(self, x: int, y: int) -> 'Boss':
         pass
 
 class TreasureFactory(ABC):
     """Абстрактная фабрика для создания сокровищ"""
     
+    def __init__(self, rng: Optional[random.Random] = None):
+        self.rng = rng if rng is not None else random
+    
     @abstractmethod
-    def create_treasure(self) -> Dict[str, Any]:
+    def create_treasure(self) -> 'Treasure':
         pass
 
 # ========== КОНКРЕТНЫЕ ФАБРИКИ ==========
 class EasyLevelFactory(CharacterFactory):
     """Фабрика для легкого уровня сложности"""
     
-    def __init__(self, level: int = 1):
+    def __init__(self, level: int = 1, rng: Optional[random.Random] = None):
         self.level = level
         self.multiplier = 0.8
+        self.rng = rng if rng is not None else random
     
-    def create_normal_enemy(self, x: int, y: int) -> 'Hero':
-        name = random.choice(ENEMY_NAMES)
-        
-        if "Голем" in name:
-            base_hp, base_str, base_arm = 40, 8, 6
-            symbol = 'G'
-        elif "Элементаль" in name:
-            base_hp, base_str, base_arm = 30, 12, 2
-            symbol = 'E'
-        elif "Лич" in name:
-            base_hp, base_str, base_arm = 25, 15, 4
-            symbol = 'L'
-        elif "Троль" in name:
-            base_hp, base_str, base_arm = 50, 10, 3
-            symbol = 'T'
-        else:
-            base_hp, base_str, base_arm = 20, 6, 2
-            symbol = 'O'
+    def _normal_template(self, name: str) -> EnemyTemplate:
+        base_hp, base_str, base_arm, symbol = enemy_kind(name)
         
         hp = int(base_hp * self.multiplier * (1 + (self.level - 1) * 0.1))
         strength = int(base_str * self.multiplier * (1 + (self.level - 1) * 0.05))
         armor = int(base_arm * self.multiplier)
-        
-        enemy = Hero(name, x, y, symbol, hp, strength, armor)
-        enemy.enemy_type = EnemyType.NORMAL
-        enemy.exp_reward = int(hp * 0.4 + strength * 1.5)
-        return enemy
+        return EnemyTemplate(name, symbol, hp, hp, strength, armor,
+                             int(hp * 0.4 + strength * 1.5), EnemyType.NORMAL)
     
-    def create_elite_enemy(self, x: int, y: int) -> 'Hero':
-        enemy = self.create_normal_enemy(x, y)
-        enemy.name = "ЭЛИТНЫЙ " + enemy.name
-        enemy.hp = int(enemy.hp * 1.3)
-        enemy.strength = int(enemy.strength * 1.2)
-        enemy.armor = int(enemy.armor * 1.1)
-        enemy.enemy_type = EnemyType.ELITE
-        enemy.exp_reward = int(enemy.hp * 0.6 + enemy.strength * 2)
-        return enemy
+    def _elite_template(self, normal: EnemyTemplate) -> EnemyTemplate:
+        hp = int(normal.hp * 1.3)
+        strength = int(normal.strength * 1.2)
+        armor = int(normal.armor * 1.1)
+        return EnemyTemplate("ЭЛИТНЫЙ " + normal.name, normal.symbol, hp, normal.max_hp, strength, armor,
+                             int(hp * 0.6 + strength * 2), EnemyType.ELITE)
     
-    def create_boss(self, x: int, y: int) -> 'Hero':
+    def create_boss(self, x: int, y: int) -> 'Boss':
         boss_types = [
             ("ДРЕВНИЙ ДРАКОН ИГНИС", 'D', 250, 25, 15, "dragon"),
             ("АРХИЛИЧ МОРТОК", 'L', 180, 20, 12, "lich"),
             ("КАМЕННЫЙ ТИТАНУС", 'T', 350, 35, 25, "titan")
         ]
         
-        boss_name, symbol, base_hp, base_str, base_arm, boss_type = random.choice(boss_types)
+        boss_name, symbol, base_hp, base_str, base_arm, boss_type = self.rng.choice(boss_types)
         
         hp = int(base_hp * (1 + (self.level // 3 - 1) * 0.15))
         strength = int(base_str * (1 + (self.level // 3 - 1) * 0.1))
         armor = int(base_arm * (1 + (self.level // 3 - 1) * 0.05))
         
-        boss = Hero(boss_name, x, y, symbol, hp, strength, armor)
-        boss.is_boss = True
-        boss.enemy_type = EnemyType.BOSS
-        boss.boss_type = boss_type
+        boss = Boss(boss_name, x, y, symbol, hp, strength, armor, rng=self.rng, boss_type=boss_type)
         boss.exp_reward = 800 * (self.level // 3)
         
         # Особые механики босса
@@ -128,65 +188,41 @@ class EasyLevelFactory(CharacterFactory):
 class NormalLevelFactory(CharacterFactory):
     """Фабрика для нормального уровня сложности"""
     
-    def __init__(self, level: int = 1):
+    def __init__(self, level: int = 1, rng: Optional[random.Random] = None):
         self.level = level
         self.multiplier = 1.0
+        self.rng = rng if rng is not None else random
     
-    def create_normal_enemy(self, x: int, y: int) -> 'Hero':
-        name = random.choice(ENEMY_NAMES)
-        
-        if "Голем" in name:
-            base_hp, base_str, base_arm = 40, 8, 6
-            symbol = 'G'
-        elif "Элементаль" in name:
-            base_hp, base_str, base_arm = 30, 12, 2
-            symbol = 'E'
-        elif "Лич" in name:
-            base_hp, base_str, base_arm = 25, 15, 4
-            symbol = 'L'
-        elif "Троль" in name:
-            base_hp, base_str, base_arm = 50, 10, 3
-            symbol = 'T'
-        else:
-            base_hp, base_str, base_arm = 20, 6, 2
-            symbol = 'O'
+    def _normal_template(self, name: str) -> EnemyTemplate:
+        base_hp, base_str, base_arm, symbol = enemy_kind(name)
         
         hp = int(base_hp * self.multiplier * (1 + (self.level - 1) * 0.15))
         strength = int(base_str * self.multiplier * (1 + (self.level - 1) * 0.1))
         armor = int(base_arm * self.multiplier * (1 + (self.level - 1) * 0.05))
-        
-        enemy = Hero(name, x, y, symbol, hp, strength, armor)
-        enemy.enemy_type = EnemyType.NORMAL
-        enemy.exp_reward = int(hp * 0.5 + strength * 2)
-        return enemy
+        return EnemyTemplate(name, symbol, hp, hp, strength, armor,
+                             int(hp * 0.5 + strength * 2), EnemyType.NORMAL)
     
-    def create_elite_enemy(self, x: int, y: int) -> 'Hero':
-        enemy = self.create_normal_enemy(x, y)
-        enemy.name = "ЭЛИТНЫЙ " + enemy.name
-        enemy.hp = int(enemy.hp * 1.5)
-        enemy.strength = int(enemy.strength * 1.3)
-        enemy.armor = int(enemy.armor * 1.2)
-        enemy.enemy_type = EnemyType.ELITE
-        enemy.exp_reward = int(enemy.hp * 0.8 + enemy.strength * 3)
-        return enemy
+    def _elite_template(self, normal: EnemyTemplate) -> EnemyTemplate:
+        hp = int(normal.hp * 1.5)
+        strength = int(normal.strength * 1.3)
+        armor = int(normal.armor * 1.2)
+        return EnemyTemplate("ЭЛИТНЫЙ " + normal.name, normal.symbol, hp, normal.max_hp, strength, armor,
+                             int(hp * 0.8 + strength * 3), EnemyType.ELITE)
     
-    def create_boss(self, x: int, y: int) -> 'Hero':
+    def create_boss(self, x: int, y: int) -> 'Boss':
         boss_types = [
             ("ДРЕВНИЙ ДРАКОН ИГНИС", 'D', 300, 30, 20, "dragon"),
             ("АРХИЛИЧ МОРТОК", 'L', 200, 25, 15, "lich"),
             ("КАМЕННЫЙ ТИТАНУС", 'T', 400, 40, 30, "titan")
         ]
         
-        boss_name, symbol, base_hp, base_str, base_arm, boss_type = random.choice(boss_types)
+        boss_name, symbol, base_hp, base_str, base_arm, boss_type = self.rng.choice(boss_types)
         
         hp = int(base_hp * (1 + (self.level // 3 - 1) * 0.2))
         strength = int(base_str * (1 + (self.level // 3 - 1) * 0.15))
         armor = int(base_arm * (1 + (self.level // 3 - 1) * 0.1))
         
-        boss = Hero(boss_name, x, y, symbol, hp, strength, armor)
-        boss.is_boss = True
-        boss.enemy_type = EnemyType.BOSS
-        boss.boss_type = boss_type
+        boss = Boss(boss_name, x, y, symbol, hp, strength, armor, rng=self.rng, boss_type=boss_type)
         boss.exp_reward = 1000 * (self.level // 3)
         
         # Особые механики босса
@@ -205,65 +241,41 @@ class NormalLevelFactory(CharacterFactory):
 class HardLevelFactory(CharacterFactory):
     """Фабрика для сложного уровня сложности"""
     
-    def __init__(self, level: int = 1):
+    def __init__(self, level: int = 1, rng: Optional[random.Random] = None):
         self.level = level
         self.multiplier = 1.3
+        self.rng = rng if rng is not None else random
     
-    def create_normal_enemy(self, x: int, y: int) -> 'Hero':
-        name = random.choice(ENEMY_NAMES)
-        
-        if "Голем" in name:
-            base_hp, base_str, base_arm = 40, 8, 6
-            symbol = 'G'
-        elif "Элементаль" in name:
-            base_hp, base_str, base_arm = 30, 12, 2
-            symbol = 'E'
-        elif "Лич" in name:
-            base_hp, base_str, base_arm = 25, 15, 4
-            symbol = 'L'
-        elif "Троль" in name:
-            base_hp, base_str, base_arm = 50, 10, 3
-            symbol = 'T'
-        else:
-            base_hp, base_str, base_arm = 20, 6, 2
-            symbol = 'O'
+    def _normal_template(self, name: str) -> EnemyTemplate:
+        base_hp, base_str, base_arm, symbol = enemy_kind(name)
         
         hp = int(base_hp * self.multiplier * (1 + (self.level - 1) * 0.2))
         strength = int(base_str * self.multiplier * (1 + (self.level - 1) * 0.15))
         armor = int(base_arm * self.multiplier * (1 + (self.level - 1) * 0.1))
-        
-        enemy = Hero(name, x, y, symbol, hp, strength, armor)
-        enemy.enemy_type = EnemyType.NORMAL
-        enemy.exp_reward = int(hp * 0.6 + strength * 2.5)
-        return enemy
+        return EnemyTemplate(name, symbol, hp, hp, strength, armor,
+                             int(hp * 0.6 + strength * 2.5), EnemyType.NORMAL)
     
-    def create_elite_enemy(self, x: int, y: int) -> 'Hero':
-        enemy = self.create_normal_enemy(x, y)
-        enemy.name = "ЭЛИТНЫЙ " + enemy.name
-        enemy.hp = int(enemy.hp * 1.7)
-        enemy.strength = int(enemy.strength * 1.5)
-        enemy.armor = int(enemy.armor * 1.4)
-        enemy.enemy_type = EnemyType.ELITE
-        enemy.exp_reward = int(enemy.hp * 1.0 + enemy.strength * 4)
-        return enemy
+    def _elite_template(self, normal: EnemyTemplate) -> EnemyTemplate:
+        hp = int(normal.hp * 1.7)
+        strength = int(normal.strength * 1.5)
+        armor = int(normal.armor * 1.4)
+        return EnemyTemplate("ЭЛИТНЫЙ " + normal.name, normal.symbol, hp, normal.max_hp, strength, armor,
+                             int(hp * 1.0 + strength * 4), EnemyType.ELITE)
     
-    def create_boss(self, x: int, y: int) -> 'Hero':
+    def create_boss(self, x: int, y: int) -> 'Boss':
         boss_types = [
             ("ДРЕВНИЙ ДРАКОН ИГНИС", 'D', 350, 35, 25, "dragon"),
             ("АРХИЛИЧ МОРТОК", 'L', 250, 30, 20, "lich"),
             ("КАМЕННЫЙ ТИТАНУС", 'T', 450, 45, 35, "titan")
         ]
         
-        boss_name, symbol, base_hp, base_str, base_arm, boss_type = random.choice(boss_types)
+        boss_name, symbol, base_hp, base_str, base_arm, boss_type = self.rng.choice(boss_types)
         
         hp = int(base_hp * (1 + (self.level // 3 - 1) * 0.25))
         strength = int(base_str * (1 + (self.level // 3 - 1) * 0.2))
         armor = int(base_arm * (1 + (self.level // 3 - 1) * 0.15))
         
-        boss = Hero(boss_name, x, y, symbol, hp, strength, armor)
-        boss.is_boss = True
-        boss.enemy_type = EnemyType.BOSS
-        boss.boss_type = boss_type
+        boss = Boss(boss_name, x, y, symbol, hp, strength, armor, rng=self.rng, boss_type=boss_type)
         boss.exp_reward = 1200 * (self.level // 3)
         
         # Особые механики босса
@@ -286,93 +298,40 @@ class HardLevelFactory(CharacterFactory):
 class EasyTreasureFactory(TreasureFactory):
     """Фабрика сокровищ для легкого уровня"""
     
-    def create_treasure(self) -> Dict[str, Any]:
-        treasures = [
-            ("Золотой слиток", "Добавляет 70 опыта", lambda p: p.gain_exp(70)),
-            ("Малое зелье здоровья", "Восстанавливает 30 HP", lambda p: p.heal(30)),
-            ("Большое зелье здоровья", "Восстанавливает 70 HP", lambda p: p.heal(70)),
-            ("Эликсир силы", "+3 к силе", lambda p: setattr(p, 'strength', p.strength + 3)),
-            ("Эликсир защиты", "+4 к защите", lambda p: setattr(p, 'armor', p.armor + 4)),
-            ("Броня дракона", "+10 к максимальному HP", lambda p: setattr(p, 'max_hp', p.max_hp + 10)),
-            ("Свиток телепортации", "Переносит в случайную комнату", lambda p: None),
-            ("Зачарованный меч", "+4 к силе на следующий бой", lambda p: setattr(p, 'temp_strength_bonus', 4)),
-            ("Щит стража", "+5 к защите на следующий бой", lambda p: setattr(p, 'temp_armor_bonus', 5)),
-            ("Королевский амулет", "+1 ко всем характеристикам", lambda p: [
-                setattr(p, 'strength', p.strength + 1),
-                setattr(p, 'armor', p.armor + 1),
-                setattr(p, 'max_hp', p.max_hp + 5),
-                p.heal(5)
-            ])
-        ]
-        return random.choice(treasures)
+    def create_treasure(self) -> 'Treasure':
+        return EASY_TREASURES.pick(self.rng)
 
 class NormalTreasureFactory(TreasureFactory):
     """Фабрика сокровищ для нормального уровня"""
     
-    def create_treasure(self) -> Dict[str, Any]:
-        treasures = [
-            ("Золотой слиток", "Добавляет 50 опыта", lambda p: p.gain_exp(50)),
-            ("Малое зелье здоровья", "Восстанавливает 20 HP", lambda p: p.heal(20)),
-            ("Большое зелье здоровья", "Восстанавливает 50 HP", lambda p: p.heal(50)),
-            ("Эликсир силы", "+2 к силе", lambda p: setattr(p, 'strength', p.strength + 2)),
-            ("Эликсир защиты", "+3 к защите", lambda p: setattr(p, 'armor', p.armor + 3)),
-            ("Броня дракона", "+5 к максимальному HP", lambda p: setattr(p, 'max_hp', p.max_hp + 5)),
-            ("Свиток телепортации", "Переносит в случайную комнату", lambda p: None),
-            ("Зачарованный меч", "+3 к силе на следующий бой", lambda p: setattr(p, 'temp_strength_bonus', 3)),
-            ("Щит стража", "+4 к защите на следующий бой", lambda p: setattr(p, 'temp_armor_bonus', 4))
-        ]
-        return random.choice(treasures)
+    def create_treasure(self) -> 'Treasure':
+        return NORMAL_TREASURES.pick(self.rng)
 
 class HardTreasureFactory(TreasureFactory):
     """Фабрика сокровищ для сложного уровня"""
     
-    def create_treasure(self) -> Dict[str, Any]:
-        treasures = [
-            ("Золотой слиток", "Добавляет 30 опыта", lambda p: p.gain_exp(30)),
-            ("Малое зелье здоровья", "Восстанавливает 15 HP", lambda p: p.heal(15)),
-            ("Большое зелье здоровья", "Восстанавливает 40 HP", lambda p: p.heal(40)),
-            ("Эликсир силы", "+1 к силе", lambda p: setattr(p, 'strength', p.strength + 1)),
-            ("Эликсир защиты", "+2 к защите", lambda p: setattr(p, 'armor', p.armor + 2)),
-            ("Броня дракона", "+3 к максимальному HP", lambda p: setattr(p, 'max_hp', p.max_hp + 3)),
-            ("Свиток телепортации", "Переносит в случайную комнату", lambda p: None),
-            ("Зачарованный меч", "+2 к силе на следующий бой", lambda p: setattr(p, 'temp_strength_bonus', 2)),
-            ("Щит стража", "+3 к защите на следующий бой", lambda p: setattr(p, 'temp_armor_bonus', 3)),
-            ("Проклятый артефакт", "+5 к силе, но -20 HP", lambda p: [
-                setattr(p, 'strength', p.strength + 5),
-                setattr(p, 'hp', max(1, p.hp - 20))
-            ])
-        ]
-        return random.choice(treasures)
+    def create_treasure(self) -> 'Treasure':
+        return HARD_TREASURES.pick(self.rng)
 
-# ========== КЛАСС ГЕРОЯ (остается без изменений, но добавлены фабричные методы) ==========
-class Hero:
-    def __init__(self, name: str, x: int, y: int, symbol: str, hp: int, strength: int, armor: int):
-        self.name = name
-        self.hp = hp
-        self.max_hp = hp
-        self.strength = strength
-        self.armor = armor
-        self.x = x
-        self.y = y
-        self.symbol = symbol
-        self.level = 1
-        self.exp = 0
-        self.next_level_exp = 100
-        self.inventory = []
-        self.enemy_type = EnemyType.NORMAL
-        self.is_boss = False
-        self.enraged = False
-        self.abilities_used = []
-        self.cooldowns = {}
-        self.minions = []
+# ========== УЧАСТНИКИ БОЯ ==========
+class Combatant:
+    """Участник боя: позиция, текущее HP и атака
+    
+    Общая основа героя, врагов, боссов и слуг. Поля (x, y, hp, rng, name,
+    symbol, max_hp, strength, armor) задают наследники - своими слотами,
+    через общий шаблон или через хранилище врагов карты.
+    """
+    __slots__ = ()
+    is_boss = False
+    enemy_type = EnemyType.NORMAL
     
     @property
     def is_alive(self):
         return self.hp > 0
     
-    def attack(self, target: 'Hero') -> Tuple[int, bool]:
+    def attack(self, target: 'Combatant') -> Tuple[int, bool]:
         """Атака цели, возвращает урон и был ли критический удар"""
-        crit_chance = random.random()
+        crit_chance = self.rng.random()
         is_critical = crit_chance < 0.15  # 15% шанс крита
         
         base_damage = self.strength
@@ -381,7 +340,7 @@ class Hero:
             if self.is_boss:
                 base_damage = int(base_damage * 1.5)  # Криты босса сильнее
         
-        variance = random.randint(-2, 2)
+        variance = self.rng.randint(-2, 2)
         damage = max(1, base_damage + variance - (target.armor // 3))
         
         target.hp -= damage
@@ -392,6 +351,28 @@ class Hero:
         old_hp = self.hp
         self.hp = min(self.max_hp, self.hp + amount)
         return self.hp - old_hp
+
+
+# ========== КЛАСС ГЕРОЯ (остается без изменений, но добавлены фабричные методы) ==========
+class Hero(Combatant):
+    """Герой игрока: опыт, уровни, инвентарь и временные бонусы"""
+    
+    def __init__(self, name: str, x: int, y: int, symbol: str, hp: int, strength: int, armor: int,
+                 rng: Optional[random.Random] = None):
+        self.name = name
+        self.hp = hp
+        self.max_hp = hp
+        self.strength = strength
+        self.armor = armor
+        self.x = x
+        self.y = y
+        self.symbol = symbol
+        self.level = 1
+        self.exp = 0
+        self.next_level_exp = 100
+        self.inventory = []
+        self.verbose = True  # Печатать ли сообщения (отключается в симуляции)
+        self.rng = rng if rng is not None else random  # Источник случайности для атак
     
     def gain_exp(self, amount: int):
         """Получение опыта"""
@@ -408,8 +389,9 @@ class Hero:
         self.hp = self.max_hp
         self.strength += 3
         self.armor += 1
-        print(f"\n✨ {self.name} достиг {self.level} уровня!")
-        print(f"Увеличено здоровье, сила и защита!")
+        if self.verbose:
+            print(f"\n✨ {self.name} достиг {self.level} уровня!")
+            print(f"Увеличено здоровье, сила и защита!")
     
     def get_stats(self) -> str:
         """Получение строки со статистикой"""
@@ -428,13 +410,80 @@ class Hero:
 ╚{'═' * 40}╝
 """
 
+
+class Enemy(Combatant):
+    """Враг, созданный фабрикой по шаблону
+    
+    Имя, символ и характеристики берутся из общего EnemyTemplate, у
+    экземпляра свои только позиция, текущее HP и генератор случайности.
+    """
+    __slots__ = ("template", "x", "y", "hp", "rng")
+    
+    def __init__(self, template: EnemyTemplate, x: int, y: int, rng: Optional[random.Random] = None):
+        self.template = template
+        self.x = x
+        self.y = y
+        self.hp = template.hp
+        self.rng = rng if rng is not None else random
+    
+    name = property(lambda self: self.template.name)
+    symbol = property(lambda self: self.template.symbol)
+    max_hp = property(lambda self: self.template.max_hp)
+    strength = property(lambda self: self.template.strength)
+    armor = property(lambda self: self.template.armor)
+    exp_reward = property(lambda self: self.template.exp_reward)
+    enemy_type = property(lambda self: self.template.enemy_type)
+
+
+class Fighter(Combatant):
+    """Боец со своими характеристиками: слуги босса и одиночные противники"""
+    __slots__ = ("name", "symbol", "x", "y", "hp", "max_hp", "strength", "armor", "enemy_type", "rng")
+    
+    def __init__(self, name: str, x: int, y: int, symbol: str, hp: int, strength: int, armor: int,
+                 rng: Optional[random.Random] = None):
+        self.name = name
+        self.symbol = symbol
+        self.x = x
+        self.y = y
+        self.hp = hp
+        self.max_hp = hp
+        self.strength = strength
+        self.armor = armor
+        self.enemy_type = EnemyType.NORMAL
+        self.rng = rng if rng is not None else random
+
+
+class Boss(Fighter):
+    """Босс: тип, награда, состояние ярости, способности и слуги"""
+    __slots__ = ("boss_type", "exp_reward", "enraged", "abilities", "minions",
+                 "fire_resistant", "undead", "stone_skin", "flying", "magic_immune", "stun_chance")
+    is_boss = True
+    
+    def __init__(self, name: str, x: int, y: int, symbol: str, hp: int, strength: int, armor: int,
+                 rng: Optional[random.Random] = None, boss_type: str = ""):
+        super().__init__(name, x, y, symbol, hp, strength, armor, rng)
+        self.enemy_type = EnemyType.BOSS
+        self.boss_type = boss_type
+        self.exp_reward = 0
+        self.enraged = False
+        self.abilities: List[str] = []
+        self.minions: List[Fighter] = []
+        # Особые свойства, которые задают фабрики
+        self.fire_resistant = False
+        self.undead = False
+        self.stone_skin = False
+        self.flying = False
+        self.magic_immune = False
+        self.stun_chance = 0.0
+
+
 class Room:
-    def __init__(self, x: int, y: int, w: int, h: int):
+    def __init__(self, x: int, y: int, w: int, h: int, rng: Optional[random.Random] = None):
         self.x = x
         self.y = y
         self.w = w
         self.h = h
-        self.has_treasure = random.random() < 0.3
+        self.has_treasure = (rng if rng is not None else random).random() < 0.3
         self.has_trap = False
     
     @property
@@ -445,707 +494,4219 @@ class Room:
     def center_y(self):
         return self.y + self.h // 2
 
-class GameMap:
-    def __init__(self, level: int = 1, difficulty: int = 2):
-        self.level = level
-        self.difficulty = difficulty
-        
-        # Инициализация фабрик в зависимости от сложности
-        if difficulty == 1:  # Легкий
-            self.character_factory = EasyLevelFactory(level)
-            self.treasure_factory = EasyTreasureFactory()
-        elif difficulty == 2:  # Нормальный
-            self.character_factory = NormalLevelFactory(level)
-            self.treasure_factory = NormalTreasureFactory()
-        else:  # Сложный
-            self.character_factory = HardLevelFactory(level)
-            self.treasure_factory = HardTreasureFactory()
-        
-        self.grid = []
-        self.enemies = []
-        self.rooms = []
-        self.treasures = []
-        self.traps = []
-        self.boss = None
-        self.generate_dungeon()
-    
-    def generate_dungeon(self):
-        """Генерация подземелья с учетом уровня"""
-        # Инициализация сетки
-        self.grid = [['#' for _ in range(MAP_WIDTH)] for _ in range(MAP_HEIGHT)]
-        self.rooms = []
-        self.enemies = []
-        self.treasures = []
-        self.traps = []
-        self.boss = None
-        
-        # Параметры, зависящие от уровня
-        room_count = random.randint(4 + self.level // 2, 7 + self.level)
-        min_room_size = max(3, 3 + self.level // 3)
-        max_room_size = min(10, 7 + self.level // 2)
-        
-        # Генерация комнат
-        for _ in range(room_count):
-            attempts = 0
-            while attempts < 100:
-                w = random.randint(min_room_size, max_room_size)
-                h = random.randint(min_room_size, max_room_size)
-                x = random.randint(1, MAP_WIDTH - w - 2)
-                y = random.randint(1, MAP_HEIGHT - h - 2)
-                
-                new_room = Room(x, y, w, h)
-                
-                # Проверка на пересечение с другими комнатами
-                if not any(self.rooms_overlap(new_room, existing_room) for existing_room in self.rooms):
-                    self.create_room(new_room)
-                    
-                    if self.rooms:
-                        last_room = self.rooms[-1]
-                        self.create_tunnel(last_room, new_room)
-                    
-                    self.rooms.append(new_room)
-                    break
-                attempts += 1
-        
-        # Спавн врагов, сокровищ и ловушек с использованием фабрик
-        self.spawn_enemies()
-        self.spawn_treasures()
-        
-        # Добавляем босса на каждом 3-м уровне
-        if self.level % 3 == 0:
-            self.spawn_boss()
-        
-        # Добавляем ловушки на высоких уровнях
-        if self.level >= 2:
-            self.spawn_traps()
+# ========== СОКРОВИЩА ==========
+TELEPORT = "teleport"  # Особый эффект: перенос героя в случайную комнату
+NEXT_BATTLE = 1  # Длительность бонуса "на следующий бой"
+
+
+@dataclass(frozen=True)
+class TreasureEffect:
+    """Одно действие сокровища над героем
     
-    def rooms_overlap(self, room1: Room, room2: Room, padding: int = 2) -> bool:
-        """Проверка на пересечение комнат"""
-        return not (room1.x + room1.w + padding < room2.x or
-                   room2.x + room2.w + padding < room1.x or
-                   room1.y + room1.h + padding < room2.y or
-                   room2.y + room2.h + padding < room1.y)
+    stat - характеристика героя ("exp", "hp", "strength", "armor", "max_hp"),
+    delta - прибавка (для "hp" положительная лечит, отрицательная ранит, но
+    не убивает), duration - 0 навсегда или NEXT_BATTLE для временного бонуса,
+    special - особое действие (TELEPORT), которое выполняет игровой цикл.
+    """
+    stat: str
+    delta: int = 0
+    duration: int = 0
+    special: str = ""
+
+
+@dataclass(frozen=True)
+class Treasure:
+    """Сокровище: название, описание для игрока и эффекты по порядку применения"""
+    name: str
+    description: str
+    effects: Tuple[TreasureEffect, ...]
     
-    def create_room(self, room: Room):
-        """Создание комнаты на карте"""
-        for y in range(room.y, room.y + room.h):
-            for x in range(room.x, room.x + room.w):
-                if 0 <= y < MAP_HEIGHT and 0 <= x < MAP_WIDTH:
-                    self.grid[y][x] = '.'
+    @property
+    def teleport(self) -> bool:
+        """Является ли сокровище свитком телепортации"""
+        return any(effect.special == TELEPORT for effect in self.effects)
+
+
+def apply_treasure(player: Hero, treasure: Treasure):
+    """Применение эффектов сокровища к герою
     
-    def create_tunnel(self, room1: Room, room2: Room):
-        """Создание туннеля между комнатами (L-образный, без диагоналей)"""
-        x1, y1 = room1.center_x, room1.center_y
-        x2, y2 = room2.center_x, room2.center_y
-        
-        # Случайно выбираем: сначала горизонтально или вертикально
-        if random.choice([True, False]):
-            # Горизонтально, затем вертикально
-            for x in range(min(x1, x2), max(x1, x2) + 1):
-                if 0 <= y1 < MAP_HEIGHT and 0 <= x < MAP_WIDTH:
-                    self.grid[y1][x] = '.'
-            for y in range(min(y1, y2), max(y1, y2) + 1):
-                if 0 <= y < MAP_HEIGHT and 0 <= x2 < MAP_WIDTH:
-                    self.grid[y][x2] = '.'
+    Особые эффекты (телепортация) здесь пропускаются - их выполняет
+    вызывающий код, которому известна карта.
+    """
+    for effect in treasure.effects:
+        if effect.special:
+            continue
+        if effect.duration:
+            # Бонус на следующий бой: temp_strength_bonus, temp_armor_bonus
+            setattr(player, f"temp_{effect.stat}_bonus", effect.delta)
+        elif effect.stat == "exp":
+            player.gain_exp(effect.delta)
+        elif effect.stat == "hp":
+            if effect.delta >= 0:
+                player.heal(effect.delta)
+            else:
+                player.hp = max(1, player.hp + effect.delta)
         else:
-            # Вертикально, затем горизонтально
-            for y in range(min(y1, y2), max(y1, y2) + 1):
-                if 0 <= y < MAP_HEIGHT and 0 <= x1 < MAP_WIDTH:
-                    self.grid[y][x1] = '.'
-            for x in range(min(x1, x2), max(x1, x2) + 1):
-                if 0 <= y2 < MAP_HEIGHT and 0 <= x < MAP_WIDTH:
-                    self.grid[y2][x] = '.'
+            setattr(player, effect.stat, getattr(player, effect.stat) + effect.delta)
+
+
+class TreasureTable:
+    """Таблица выпадения сокровищ, собранная один раз при импорте
     
-    def spawn_enemies(self):
-        """Спавн врагов с использованием фабрики"""
-        # Базовое количество врагов
-        base_count = 3
-        level_bonus = min(self.level * 2, 10)  # Ограничиваем максимальный бонус
-        enemy_count = random.randint(base_count, base_count + level_bonus)
-        
-        # Шанс появления элитных врагов
-        elite_chance = min(0.1 + (self.level - 1) * 0.05, 0.3)
-        
-        for i in range(enemy_count):
-            if len(self.rooms) > 1:
-                room = random.choice(self.rooms[1:])  # Не спавним в стартовой комнате
-            else:
-                room = self.rooms[0]
-            
-            # Выбираем позицию в комнате
-            ex = random.randint(max(room.x, 0), min(room.x + room.w - 1, MAP_WIDTH - 1))
-            ey = random.randint(max(room.y, 0), min(room.y + room.h - 1, MAP_HEIGHT - 1))
-            
-            # Определяем, элитный ли враг
-            is_elite = random.random() < elite_chance and self.level >= 2
-            
-            # Создаем врага через фабрику
-            if is_elite:
-                enemy = self.character_factory.create_elite_enemy(ex, ey)
-            else:
-                enemy = self.character_factory.create_normal_enemy(ex, ey)
-            
-            self.enemies.append(enemy)
+    weights - веса выпадения (по умолчанию равные). Таблица с равными весами
+    выбирает через rng.choice, как прежние списки сокровищ, поэтому
+    записанные сеансы и журналы повторяются с теми же находками.
+    """
     
-    def spawn_boss(self):
-        """Создание босса через фабрику"""
-        # Босс появляется в последней комнате
-        boss_room = self.rooms[-1]
-        
-        # Создаем босса через фабрику
-        self.boss = self.character_factory.create_boss(boss_room.center_x, boss_room.center_y)
+    def __init__(self, treasures: List[Treasure], weights: Optional[List[int]] = None):
+        self.treasures = tuple(treasures)
+        self.weights = tuple(weights) if weights is not None else (1,) * len(self.treasures)
+        if len(self.weights) != len(self.treasures):
+            raise ValueError("Число весов не совпадает с числом сокровищ")
+        self.cum_weights = tuple(accumulate(self.weights))
+        self.uniform = len(set(self.weights)) == 1
     
-    def spawn_treasures(self):
-        """Размещение сокровищ на карте"""
-        treasure_count = random.randint(2 + self.level // 2, 5 + self.level // 2)
-        
-        for _ in range(treasure_count):
-            if self.rooms:
-                room = random.choice(self.rooms)
-                tx = random.randint(max(room.x, 0), min(room.x + room.w - 1, MAP_WIDTH - 1))
-                ty = random.randint(max(room.y, 0), min(room.y + room.h - 1, MAP_HEIGHT - 1))
-                self.treasures.append((tx, ty))
+    def pick(self, rng) -> Treasure:
+        """Случайное сокровище с учетом весов"""
+        if self.uniform:
+            return rng.choice(self.treasures)
+        return rng.choices(self.treasures, cum_weights=self.cum_weights)[0]
+
+
+def _standard_treasures(exp: int, small_heal: int, big_heal: int, strength: int, armor: int,
+                        max_hp: int, sword: int, shield: int) -> List[Treasure]:
+    """Сокровища, общие для всех сложностей, с силой эффектов сложности"""
+    return [
+        Treasure("Золотой слиток", f"Добавляет {exp} опыта", (TreasureEffect("exp", exp),)),
+        Treasure("Малое зелье здоровья", f"Восстанавливает {small_heal} HP", (TreasureEffect("hp", small_heal),)),
+        Treasure("Большое зелье здоровья", f"Восстанавливает {big_heal} HP", (TreasureEffect("hp", big_heal),)),
+        Treasure("Эликсир силы", f"+{strength} к силе", (TreasureEffect("strength", strength),)),
+        Treasure("Эликсир защиты", f"+{armor} к защите", (TreasureEffect("armor", armor),)),
+        Treasure("Броня дракона", f"+{max_hp} к максимальному HP", (TreasureEffect("max_hp", max_hp),)),
+        Treasure("Свиток телепортации", "Переносит в случайную комнату", (TreasureEffect("", special=TELEPORT),)),
+        Treasure("Зачарованный меч", f"+{sword} к силе на следующий бой",
+                 (TreasureEffect("strength", sword, NEXT_BATTLE),)),
+        Treasure("Щит стража", f"+{shield} к защите на следующий бой",
+                 (TreasureEffect("armor", shield, NEXT_BATTLE),)),
+    ]
+
+
+EASY_TREASURES = TreasureTable(_standard_treasures(70, 30, 70, 3, 4, 10, 4, 5) + [
+    Treasure("Королевский амулет", "+1 ко всем характеристикам",
+             (TreasureEffect("strength", 1), TreasureEffect("armor", 1), TreasureEffect("max_hp", 5),
+              TreasureEffect("hp", 5))),
+])
+NORMAL_TREASURES = TreasureTable(_standard_treasures(50, 20, 50, 2, 3, 5, 3, 4))
+HARD_TREASURES = TreasureTable(_standard_treasures(30, 15, 40, 1, 2, 3, 2, 3) + [
+    Treasure("Проклятый артефакт", "+5 к силе, но -20 HP",
+             (TreasureEffect("strength", 5), TreasureEffect("hp", -20))),
+])
+
+
+# ========== СЕТКА ТАЙЛОВ ==========
+TILE_WALL = '#'
+TILE_FLOOR = '.'
+TILE_TRAP = '^'
+
+
+class TileGrid(ABC):
+    """Прямоугольная сетка тайлов карты
     
-    def spawn_traps(self):
-        """Размещение ловушек на высоких уровнях"""
-        trap_count = random.randint(1, 2 + self.level // 2)
-        
-        for _ in range(trap_count):
-            if len(self.rooms) > 1:
-                room = random.choice(self.rooms[1:])  # Не в стартовой комнате
-                tx = random.randint(max(room.x, 0), min(room.x + room.w - 1, MAP_WIDTH - 1))
-                ty = random.randint(max(room.y, 0), min(room.y + room.h - 1, MAP_HEIGHT - 1))
-                self.traps.append((tx, ty))
-                self.grid[ty][tx] = '^'  # Символ ловушки
+    Тайлы - односимвольные строки (TILE_WALL, TILE_FLOOR, TILE_TRAP).
+    Прямоугольники и линии, выходящие за край, обрезаются по границам.
+    """
     
-    def check_trap(self, x: int, y: int, player: Hero) -> Tuple[bool, int]:
-        """Проверка на ловушку"""
-        if (x, y) in self.traps:
-            trap_damage = 5 + self.level * 2
-            player.hp -= trap_damage
-            self.traps.remove((x, y))
-            self.grid[y][x] = '.'
-            return True, trap_damage
-        return False, 0
+    def __init__(self, width: int, height: int):
+        self.width = width
+        self.height = height
+        self.version = 0  # Растет при каждом изменении тайлов (для кэшей поверх сетки)
+        self._snapshot = None
+        self._snapshot_version = None
     
-    def draw(self, player: Hero):
-        """Отрисовка карты и информации"""
-        os.system('cls' if os.name == 'nt' else 'clear')
-        
-        # Рисуем верхнюю границу
-        print("╔" + "═" * MAP_WIDTH + "╗")
-        
-        # Рисуем карту
-        for y in range(MAP_HEIGHT):
-            print("║", end="")
-            for x in range(MAP_WIDTH):
-                char = self.grid[y][x]
-                
-                # Игрок
-                if player.x == x and player.y == y:
-                    print(f"\033[1;32m{player.symbol}\033[0m", end="")
-                
-                # Босс
-                elif self.boss and self.boss.x == x and self.boss.y == y and self.boss.is_alive:
-                    print(f"\033[1;35m{self.boss.symbol}\033[0m", end="")  # Фиолетовый для босса
-                
-                # Враги
-                elif any(e.x == x and e.y == y and e.is_alive for e in self.enemies):
-                    enemy = next(e for e in self.enemies if e.x == x and e.y == y and e.is_alive)
-                    if enemy.enemy_type == EnemyType.ELITE:
-                        print(f"\033[1;33m{enemy.symbol}\033[0m", end="")  # Желтый для элитных
-                    else:
-                        print(f"\033[1;31m{enemy.symbol}\033[0m", end="")  # Красный для обычных
-                
-                # Сокровища
-                elif (x, y) in self.treasures:
-                    print(f"\033[1;33m$\033[0m", end="")  # Желтый
-                
-                # Ловушки
-                elif char == '^':
-                    print(f"\033[1;31m^\033[0m", end="")  # Красный
-                
-                # Стены и пол
-                elif char == '#':
-                    print(f"\033[90m▓\033[0m", end="")  # Серые стены
-                elif char == '.':
-                    print(f"\033[37m·\033[0m", end="")  # Светлые точки пола
-                else:
-                    print(char, end="")
-            print("║")
-        
-        # Рисуем нижнюю границу
-        print("╚" + "═" * MAP_WIDTH + "╝")
-        
-        # Статистика игрока
-        print(player.get_stats())
-        
-        # Информация об уровне
-        print(f"Уровень подземелья: {self.level}")
-        print(f"Сложность: {'Легкий' if self.difficulty == 1 else 'Нормальный' if self.difficulty == 2 else 'Сложный'}")
-        
-        # Ближайшие враги
-        nearby_enemies = []
-        for enemy in self.enemies:
-            if enemy.is_alive:
-                distance = abs(enemy.x - player.x) + abs(enemy.y - player.y)
-                if distance <= 8:
-                    nearby_enemies.append((enemy, distance))
-        
-        # Босс
-        if self.boss and self.boss.is_alive:
-            boss_distance = abs(self.boss.x - player.x) + abs(self.boss.y - player.y)
-            if boss_distance <= 12:
-                hp_percent = (self.boss.hp / self.boss.max_hp) * 100
-                print(f"\n⚠️  БОСС ПРИБЛИЖАЕТСЯ: {self.boss.name}")
-                print(f"   Здоровье: {self.boss.hp}/{self.boss.max_hp} ({hp_percent:.1f}%)")
-                print(f"   Расстояние: {boss_distance} клеток")
-        
-        # Ближайшие враги
-        if nearby_enemies:
-            print(f"\nБлижайшие враги:")
-            for enemy, distance in nearby_enemies[:3]:  # Показываем только 3 ближайших
-                health_percent = (enemy.hp / enemy.max_hp) * 100
-                health_bar_length = 5
-                filled = int(health_percent // (100 / health_bar_length))
-                health_bar = f"{'█' * filled}{'░' * (health_bar_length - filled)}"
-                
-                type_indicator = ""
-                if enemy.enemy_type == EnemyType.ELITE:
-                    type_indicator = " [ЭЛИТНЫЙ]"
-                
-                print(f"  {enemy.name}{type_indicator} - {health_bar} ({distance} клеток)")
+    @abstractmethod
+    def get(self, x: int, y: int) -> str:
+        pass
     
-    def is_walkable(self, x: int, y: int) -> bool:
+    @abstractmethod
+    def set(self, x: int, y: int, tile: str):
+        pass
+    
+    @abstractmethod
+    def row(self, y: int) -> str:
+        """Строка y целиком (только для чтения)"""
+        pass
+    
+    @abstractmethod
+    def fill_rect(self, x: int, y: int, w: int, h: int, tile: str):
+        pass
+    
+    @property
+    @abstractmethod
+    def nbytes(self) -> int:
+        """Приблизительный объем памяти под тайлы"""
+        pass
+    
+    @abstractmethod
+    def to_bytes(self) -> bytes:
+        """Тайлы построчно, по байту (коду символа) на тайл"""
+        pass
+    
+    @abstractmethod
+    def load_bytes(self, data: bytes):
+        """Замена всех тайлов содержимым to_bytes"""
+        pass
+    
+    def snapshot(self) -> bytes:
+        """То же, что to_bytes, но пересчитывается только после изменения тайлов"""
+        if self._snapshot_version != self.version:
+            self._snapshot = self.to_bytes()
+            self._snapshot_version = self.version
+        return self._snapshot
+    
+    def _check_size(self, data: bytes):
+        if len(data) != self.width * self.height:
+            raise ValueError(f"Ожидалось {self.width * self.height} байт тайлов, получено {len(data)}")
+    
+    def hline(self, x1: int, x2: int, y: int, tile: str):
+        """Горизонтальная линия от x1 до x2 включительно"""
+        self.fill_rect(min(x1, x2), y, abs(x2 - x1) + 1, 1, tile)
+    
+    def vline(self, x: int, y1: int, y2: int, tile: str):
+        """Вертикальная линия от y1 до y2 включительно"""
+        self.fill_rect(x, min(y1, y2), 1, abs(y2 - y1) + 1, tile)
+    
+    def _clip(self, x: int, y: int, w: int, h: int) -> Tuple[int, int, int, int]:
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + w, self.width), min(y + h, self.height)
+        return x0, y0, x1, y1
+    
+    def __getitem__(self, y: int) -> str:
+        return self.row(y)
+    
+    def __len__(self) -> int:
+        return self.height
+
+
+class ListTileGrid(TileGrid):
+    """Сетка в виде списка строк-списков (исходное представление)"""
+    
+    def __init__(self, width: int, height: int, fill: str = TILE_WALL):
+        super().__init__(width, height)
+        self.rows = [[fill] * width for _ in range(height)]
+    
+    def get(self, x: int, y: int) -> str:
+        return self.rows[y][x]
+    
+    def set(self, x: int, y: int, tile: str):
+        self.version += 1
+        self.rows[y][x] = tile
+    
+    def row(self, y: int) -> str:
+        return "".join(self.rows[y])
+    
+    def fill_rect(self, x: int, y: int, w: int, h: int, tile: str):
+        self.version += 1
+        x0, y0, x1, y1 = self._clip(x, y, w, h)
+        if x0 >= x1:
+            return
+        for row in self.rows[y0:y1]:
+            row[x0:x1] = [tile] * (x1 - x0)
+    
+    @property
+    def nbytes(self) -> int:
+        # Строки-символы интернированы, память занимают списки указателей
+        return sys.getsizeof(self.rows) + sum(sys.getsizeof(row) for row in self.rows)
+    
+    def to_bytes(self) -> bytes:
+        return "".join("".join(row) for row in self.rows).encode("ascii")
+    
+    def load_bytes(self, data: bytes):
+        self._check_size(data)
+        self.version += 1
+        text = bytes(data).decode("ascii")
+        self.rows = [list(text[y * self.width:(y + 1) * self.width]) for y in range(self.height)]
+
+
+class ByteTileGrid(TileGrid):
+    """Компактная сетка: один байт (код символа) на тайл в bytearray"""
+    
+    def __init__(self, width: int, height: int, fill: str = TILE_WALL):
+        super().__init__(width, height)
+        self.cells = bytearray(fill.encode("ascii") * (width * height))
+    
+    def get(self, x: int, y: int) -> str:
+        return chr(self.cells[y * self.width + x])
+    
+    def set(self, x: int, y: int, tile: str):
+        self.version += 1
+        self.cells[y * self.width + x] = ord(tile)
+    
+    def row(self, y: int) -> str:
+        start = y * self.width
+        return self.cells[start:start + self.width].decode("ascii")
+    
+    def fill_rect(self, x: int, y: int, w: int, h: int, tile: str):
+        self.version += 1
+        x0, y0, x1, y1 = self._clip(x, y, w, h)
+        if x0 >= x1 or y0 >= y1:
+            return
+        code = ord(tile)
+        if x1 - x0 == 1:
+            # Вертикальная полоса - одно срезовое присваивание с шагом width
+            start = y0 * self.width + x0
+            self.cells[start:y1 * self.width:self.width] = bytes([code]) * (y1 - y0)
+            return
+        segment = bytes([code]) * (x1 - x0)
+        for y in range(y0, y1):
+            start = y * self.width + x0
+            self.cells[start:start + (x1 - x0)] = segment
+    
+    @property
+    def nbytes(self) -> int:
+        return sys.getsizeof(self.cells)
+    
+    def to_bytes(self) -> bytes:
+        return bytes(self.cells)
+    
+    def load_bytes(self, data: bytes):
+        self._check_size(data)
+        self.version += 1
+        self.cells[:] = data
+
+
+class NumpyTileGrid(TileGrid):
+    """Компактная сетка на массиве NumPy uint8 (если NumPy установлен)"""
+    
+    def __init__(self, width: int, height: int, fill: str = TILE_WALL):
+        super().__init__(width, height)
+        self.cells = np.full((height, width), ord(fill), dtype=np.uint8)
+    
+    def get(self, x: int, y: int) -> str:
+        return chr(self.cells[y, x])
+    
+    def set(self, x: int, y: int, tile: str):
+        self.version += 1
+        self.cells[y, x] = ord(tile)
+    
+    def row(self, y: int) -> str:
+        return self.cells[y].tobytes().decode("ascii")
+    
+    def fill_rect(self, x: int, y: int, w: int, h: int, tile: str):
+        self.version += 1
+        x0, y0, x1, y1 = self._clip(x, y, w, h)
+        if x0 < x1 and y0 < y1:
+            self.cells[y0:y1, x0:x1] = ord(tile)
+    
+    @property
+    def nbytes(self) -> int:
+        return self.cells.nbytes
+    
+    def to_bytes(self) -> bytes:
+        return self.cells.tobytes()
+    
+    def load_bytes(self, data: bytes):
+        self._check_size(data)
+        self.version += 1
+        self.cells = np.frombuffer(data, dtype=np.uint8).reshape(self.height, self.width).copy()
+
+
+def make_tile_grid(width: int, height: int, kind: str = "list", fill: str = TILE_WALL) -> TileGrid:
+    """Создание сетки тайлов
+    
+    kind: "list" - списки символов, "bytes" - bytearray, "numpy" - массив
+    NumPy, "compact" - NumPy, если он установлен, иначе bytearray.
+    """
+    if kind == "compact":
+        kind = "numpy" if np is not None else "bytes"
+    if kind == "list":
+        return ListTileGrid(width, height, fill)
+    if kind == "bytes":
+        return ByteTileGrid(width, height, fill)
+    if kind == "numpy":
+        if np is None:
+            raise ValueError("Для сетки 'numpy' требуется установленный NumPy")
+        return NumpyTileGrid(width, height, fill)
+    raise ValueError(f"Неизвестный вид сетки тайлов: {kind}")
+
+
+# ========== ХРАНИЛИЩЕ ВРАГОВ ==========
+class EnemyStore(ABC):
+    """Враги карты
+    
+    Ведет себя как последовательность врагов (обход, len, индекс) и
+    отвечает на вопросы, которые карта задает каждый ход: сколько врагов
+    живо и кто рядом с героем.
+    """
+    
+    @abstractmethod
+    def add(self, enemy: Combatant) -> Combatant:
+        """Добавить врага; возвращает объект, который теперь его представляет"""
+        pass
+    
+    @abstractmethod
+    def alive_count(self) -> int:
+        pass
+    
+    def has_alive(self) -> bool:
+        return self.alive_count() > 0
+    
+    @abstractmethod
+    def nearby(self, x: int, y: int, radius: int) -> List[Tuple[Combatant, int]]:
+        """Живые враги не дальше radius по манхэттенскому расстоянию, в порядке добавления"""
+        pass
+    
+    @abstractmethod
+    def __len__(self) -> int:
+        pass
+    
+    @abstractmethod
+    def __getitem__(self, index: int) -> Combatant:
+        pass
+    
+    def __iter__(self):
+        return (self[index] for index in range(len(self)))
+
+
+class ObjectEnemyStore(EnemyStore):
+    """Список объектов врагов: каждый запрос - проход по всем врагам"""
+    
+    def __init__(self):
+        self._enemies: List[Combatant] = []
+        self.scans = 0  # Число полных проходов по врагам (для замеров)
+    
+    def add(self, enemy: Combatant) -> Combatant:
+        self._enemies.append(enemy)
+        return enemy
+    
+    def alive_count(self) -> int:
+        self.scans += 1
+        return sum(1 for enemy in self._enemies if enemy.is_alive)
+    
+    def has_alive(self) -> bool:
+        self.scans += 1
+        return any(enemy.is_alive for enemy in self._enemies)
+    
+    def nearby(self, x: int, y: int, radius: int) -> List[Tuple[Combatant, int]]:
+        self.scans += 1
+        result = []
+        for enemy in self._enemies:
+            if enemy.is_alive:
+                distance = abs(enemy.x - x) + abs(enemy.y - y)
+                if distance <= radius:
+                    result.append((enemy, distance))
+        return result
+    
+    def __len__(self) -> int:
+        return len(self._enemies)
+    
+    def __getitem__(self, index: int) -> Combatant:
+        return self._enemies[index]
+    
+    def __iter__(self):
+        return iter(self._enemies)
+
+
+class StoredEnemy(Combatant):
+    """Враг из ArrayEnemyStore: чтение и запись полей идут в массивы хранилища"""
+    __slots__ = ("store", "index")
+    
+    def __init__(self, store: 'ArrayEnemyStore', index: int):
+        self.store = store
+        self.index = index
+    
+    @property
+    def hp(self) -> int:
+        return int(self.store.hp[self.index])
+    
+    @hp.setter
+    def hp(self, value: int):
+        self.store.set_hp(self.index, value)
+    
+    @property
+    def x(self) -> int:
+        return int(self.store.x[self.index])
+    
+    @x.setter
+    def x(self, value: int):
+        self.store.x[self.index] = value
+    
+    @property
+    def y(self) -> int:
+        return int(self.store.y[self.index])
+    
+    @y.setter
+    def y(self, value: int):
+        self.store.y[self.index] = value
+    
+    max_hp = property(lambda self: int(self.store.max_hp[self.index]))
+    strength = property(lambda self: int(self.store.strength[self.index]))
+    armor = property(lambda self: int(self.store.armor[self.index]))
+    enemy_type = property(lambda self: ArrayEnemyStore.TYPES[self.store.kind[self.index]])
+    name = property(lambda self: self.store.templates[self.index].name)
+    symbol = property(lambda self: self.store.templates[self.index].symbol)
+    exp_reward = property(lambda self: self.store.templates[self.index].exp_reward)
+    rng = property(lambda self: self.store.rngs[self.index])
+
+
+class ArrayEnemyStore(EnemyStore):
+    """Структура массивов: x, y, hp, max_hp, сила, защита и тип врагов
+    
+    Каждое поле - отдельный массив, врагу соответствует индекс. Счетчик
+    живых обновляется при каждой записи hp, поэтому проверка очистки
+    уровня не перебирает врагов. С NumPy массивы растут удвоением емкости,
+    а поиск поблизости считается векторно; без NumPy используются
+    array.array и обычный цикл. Имя, символ и награда берутся из шаблона.
+    """
+    TYPES = list(EnemyType)
+    COLUMNS = ("x", "y", "hp", "max_hp", "strength", "armor", "kind")
+    
+    def __init__(self, capacity: int = 64):
+        for column in self.COLUMNS:
+            setattr(self, column, np.zeros(capacity, dtype=np.int64) if np is not None else array('q'))
+        self.templates: List[EnemyTemplate] = []
+        self.rngs = []
+        self._views: List[StoredEnemy] = []
+        self._alive = 0
+        self.scans = 0  # Число полных проходов по врагам (для замеров)
+    
+    def add(self, enemy: Combatant) -> Combatant:
+        index = len(self._views)
+        values = (enemy.x, enemy.y, enemy.hp, enemy.max_hp, enemy.strength, enemy.armor,
+                  self.TYPES.index(enemy.enemy_type))
+        if np is not None:
+            if index == len(self.x):
+                for column in self.COLUMNS:
+                    setattr(self, column, np.concatenate([getattr(self, column), np.zeros_like(getattr(self, column))]))
+            for column, value in zip(self.COLUMNS, values):
+                getattr(self, column)[index] = value
+        else:
+            for column, value in zip(self.COLUMNS, values):
+                getattr(self, column).append(value)
+        
+        template = getattr(enemy, "template", None)
+        if template is None:
+            exp_reward = getattr(enemy, "exp_reward", enemy.max_hp // 2 + enemy.strength * 2)
+            template = EnemyTemplate(enemy.name, enemy.symbol, enemy.hp, enemy.max_hp, enemy.strength,
+                                     enemy.armor, exp_reward, enemy.enemy_type)
+        self.templates.append(template)
+        self.rngs.append(enemy.rng)
+        if enemy.hp > 0:
+            self._alive += 1
+        view = StoredEnemy(self, index)
+        self._views.append(view)
+        return view
+    
+    def set_hp(self, index: int, value: int):
+        """Запись hp с учетом перехода между живыми и павшими"""
+        was_alive = self.hp[index] > 0
+        self.hp[index] = value
+        if was_alive != (value > 0):
+            self._alive += 1 if value > 0 else -1
+    
+    def alive_count(self) -> int:
+        return self._alive
+    
+    def nearby(self, x: int, y: int, radius: int) -> List[Tuple[Combatant, int]]:
+        self.scans += 1
+        count = len(self._views)
+        if np is None:
+            result = []
+            for index in range(count):
+                if self.hp[index] > 0:
+                    distance = abs(self.x[index] - x) + abs(self.y[index] - y)
+                    if distance <= radius:
+                        result.append((self._views[index], distance))
+            return result
+        
+        distance = np.abs(self.x[:count] - x) + np.abs(self.y[:count] - y)
+        hits = np.flatnonzero((self.hp[:count] > 0) & (distance <= radius))
+        return [(self._views[index], int(distance[index])) for index in hits]
+    
+    def __len__(self) -> int:
+        return len(self._views)
+    
+    def __getitem__(self, index: int) -> Combatant:
+        return self._views[index]
+    
+    def __iter__(self):
+        return iter(self._views)
+
+
+def make_enemy_store(kind: str = "objects") -> EnemyStore:
+    """Создание хранилища врагов: "objects" - список объектов, "arrays" - структура массивов"""
+    if kind == "objects":
+        return ObjectEnemyStore()
+    if kind == "arrays":
+        return ArrayEnemyStore()
+    raise ValueError(f"Неизвестный вид хранилища врагов: {kind}")
+
+
+# ========== ПОИСК ПУТИ ==========
+TRAP_STEP_COST = 20  # Цена шага на ловушку для A*: обходим, если обход не слишком длинный
+
+
+class Pathfinder:
+    """Поиск пути по сетке тайлов карты
+    
+    Поля расстояний (обход в ширину от клетки) кэшируются по клетке и
+    радиусу и сбрасываются, только когда меняется сетка (версия TileGrid
+    растет при каждой записи тайлов, например когда срабатывает ловушка).
+    Ограниченное радиусом поле стоит столько, сколько клеток в радиусе,
+    поэтому преследование игрока не зависит от размера карты. Маршрут
+    между двумя клетками ищется A* с манхэттенской эвристикой.
+    """
+    
+    def __init__(self, game_map: 'GameMap', cache_size: int = 16):
+        self.game_map = game_map
+        self.cache_size = cache_size
+        self._grid = None
+        self._version = None
+        self._fields: 'OrderedDict[Tuple[int, int, Optional[int]], Dict[Tuple[int, int], int]]' = OrderedDict()
+        self.field_builds = 0  # Сколько полей посчитано заново (для замеров)
+    
+    def _snapshot(self) -> bytes:
+        """Тайлы сетки одним bytes; кэш полей сбрасывается при смене сетки"""
+        grid = self.game_map.grid
+        if grid is not self._grid or grid.version != self._version:
+            self._grid, self._version = grid, grid.version
+            self._fields.clear()
+        return grid.snapshot()
+    
+    def distance_field(self, x: int, y: int, max_distance: Optional[int] = None) -> Dict[Tuple[int, int], int]:
+        """Шагов от (x, y) до каждой достижимой клетки, не дальше max_distance"""
+        cells = self._snapshot()
+        key = (x, y, max_distance)
+        field = self._fields.get(key)
+        if field is not None:
+            self._fields.move_to_end(key)
+            return field
+        
+        width, height, wall = self.game_map.width, self.game_map.height, ord(TILE_WALL)
+        field = {(x, y): 0}
+        frontier = [(x, y)]
+        distance = 0
+        while frontier and (max_distance is None or distance < max_distance):
+            distance += 1
+            next_frontier = []
+            for cx, cy in frontier:
+                for dx, dy in MOVE_DELTAS.values():
+                    nx, ny = cx + dx, cy + dy
+                    if (0 <= nx < width and 0 <= ny < height and cells[ny * width + nx] != wall
+                            and (nx, ny) not in field):
+                        field[(nx, ny)] = distance
+                        next_frontier.append((nx, ny))
+            frontier = next_frontier
+        
+        self.field_builds += 1
+        self._fields[key] = field
+        if len(self._fields) > self.cache_size:
+            self._fields.popitem(last=False)
+        return field
+    
+    def nearest(self, x: int, y: int, targets) -> Optional[Tuple[int, int]]:
+        """Ближайшая по пути из клеток targets (при равенстве - первая в targets)"""
+        field = self.distance_field(x, y)
+        best, best_distance = None, None
+        for cell in targets:
+            distance = field.get(cell)
+            if distance is not None and distance > 0 and (best_distance is None or distance < best_distance):
+                best, best_distance = cell, distance
+        return best
+    
+    def step_toward(self, x: int, y: int, target_x: int, target_y: int,
+                    max_distance: Optional[int] = None) -> Optional[Tuple[int, int]]:
+        """Следующая клетка по кратчайшему пути из (x, y) к цели
+        
+        Для преследования: поле считается от цели (игрока) один раз на ход
+        и общее для всех преследователей. None - цель дальше max_distance,
+        недостижима или уже достигнута.
+        """
+        field = self.distance_field(target_x, target_y, max_distance)
+        current = field.get((x, y))
+        if not current:
+            return None
+        for dx, dy in MOVE_DELTAS.values():
+            if field.get((x + dx, y + dy)) == current - 1:
+                return x + dx, y + dy
+        return None
+    
+    def find_path(self, start: Tuple[int, int], goal: Tuple[int, int],
+                  trap_cost: int = TRAP_STEP_COST) -> List[Tuple[int, int]]:
+        """Маршрут A* от start до goal: клетки после start, включая goal
+        
+        Шаг на ловушку стоит trap_cost, поэтому ловушки обходятся, если
+        это не слишком удлиняет путь. Пустой список - пути нет.
+        """
+        cells = self._snapshot()
+        width, height = self.game_map.width, self.game_map.height
+        wall, trap = ord(TILE_WALL), ord(TILE_TRAP)
+        gx, gy = goal
+        if start == goal or not (0 <= gx < width and 0 <= gy < height) or cells[gy * width + gx] == wall:
+            return []
+        
+        came_from = {start: None}
+        cost = {start: 0}
+        # В куче (оценка, номер, клетка): номер делает порядок детерминированным
+        heap = [(abs(start[0] - gx) + abs(start[1] - gy), 0, start)]
+        counter = 0
+        while heap:
+            _, _, cell = heapq.heappop(heap)
+            if cell == goal:
+                path = []
+                while cell != start:
+                    path.append(cell)
+                    cell = came_from[cell]
+                path.reverse()
+                return path
+            cx, cy = cell
+            for dx, dy in MOVE_DELTAS.values():
+                nx, ny = cx + dx, cy + dy
+                if not (0 <= nx < width and 0 <= ny < height):
+                    continue
+                tile = cells[ny * width + nx]
+                if tile == wall:
+                    continue
+                new_cost = cost[cell] + (trap_cost if tile == trap else 1)
+                if new_cost < cost.get((nx, ny), new_cost + 1):
+                    cost[(nx, ny)] = new_cost
+                    came_from[(nx, ny)] = cell
+                    counter += 1
+                    heapq.heappush(heap, (new_cost + abs(nx - gx) + abs(ny - gy), counter, (nx, ny)))
+        return []
+
+
+# ========== ПЛАНИРОВЩИК ХОДОВ ==========
+ACTION_TIME = 100  # Время действия при скорости NORMAL_SPEED
+NORMAL_SPEED = 10  # Скорость героя
+BOSS_SPEED = 8
+CHASE_RADIUS = 8  # Враг ближе этого (по пути) преследует героя, дальше - бродит
+
+# Скорость врагов по слову в имени; элитные на 2 быстрее
+ENEMY_SPEEDS = {"Голем": 7, "Троль": 8, "Элементаль": 12, "Убийца": 13, "Паук": 12, "Феникс": 14}
+
+# Шаги патруля: четыре направления и остановка
+_PATROL_STEPS = ((0, -1), (0, 1), (-1, 0), (1, 0), (0, 0))
+
+
+def enemy_speed(enemy: Combatant) -> int:
+    """Скорость врага или босса в очереди ходов"""
+    if enemy.is_boss:
+        return BOSS_SPEED
+    speed = next((speed for keyword, speed in ENEMY_SPEEDS.items() if keyword in enemy.name), NORMAL_SPEED)
+    return speed + 2 if enemy.enemy_type == EnemyType.ELITE else speed
+
+
+class TurnScheduler:
+    """Очередь ходов героя, врагов и босса по времени (режим с ходами врагов)
+    
+    Каждый участник действует раз в ACTION_TIME * NORMAL_SPEED // скорость
+    единиц времени. В куче лежат пары (время следующего действия, номер
+    участника), поэтому за ход героя обрабатываются только те, чья очередь
+    подошла, по O(log n) на действие. Враг в пределах CHASE_RADIUS идет к
+    герою по полю расстояний GameMap.paths (одному на всех преследователей),
+    остальные бродят; босс не покидает зал, пока герой далеко.
+    
+    Время уровня хранится в GameMap.clock и попадает в сохранение, а
+    расписание каждого участника - кратные его задержки, поэтому очередь
+    восстанавливается по карте без собственного состояния.
+    """
+    
+    def __init__(self, game_map: 'GameMap', player: Hero, chase_radius: int = CHASE_RADIUS):
+        self.game_map = game_map
+        self.player = player
+        self.chase_radius = chase_radius
+        # Номер 0 - герой: при равном времени он ходит первым
+        self.actors: List[Combatant] = [player] + list(game_map.enemies)
+        if game_map.boss is not None:
+            self.actors.append(game_map.boss)
+        self.delays = [ACTION_TIME] + [ACTION_TIME * NORMAL_SPEED // enemy_speed(enemy) for enemy in self.actors[1:]]
+        clock = game_map.clock
+        self._queue = [(-(-clock // delay) * delay, order)
+                       for order, (actor, delay) in enumerate(zip(self.actors, self.delays))
+                       if order and actor.is_alive]
+        heapq.heapify(self._queue)
+        self.actions = 0  # Действий врагов (для замеров)
+    
+    def advance(self) -> List[Combatant]:
+        """Герой потратил ход: действия врагов до его следующего хода
+        
+        Возвращает врагов, которые дошли до героя и нападают.
+        """
+        queue = self._queue
+        heapq.heappush(queue, (self.game_map.clock + self.delays[0], 0))
+        attackers = []
+        while True:
+            time_due, order = heapq.heappop(queue)
+            if order == 0:
+                self.game_map.clock = time_due
+                return attackers
+            actor = self.actors[order]
+            if not actor.is_alive:
+                continue  # Павший враг просто выпадает из очереди
+            self.actions += 1
+            if self._act(actor, time_due):
+                attackers.append(actor)
+            heapq.heappush(queue, (time_due + self.delays[order], order))
+    
+    def _act(self, actor: Combatant, time_due: int) -> bool:
+        """Ход врага: шаг к герою или патруль; True - враг нападает"""
+        game_map, player = self.game_map, self.player
+        step = None
+        if abs(actor.x - player.x) + abs(actor.y - player.y) <= self.chase_radius:
+            step = game_map.paths.step_toward(actor.x, actor.y, player.x, player.y, self.chase_radius)
+        if step is None:
+            if actor.is_boss:
+                return False
+            # Патруль без генератора: направление - хеш времени и клетки врага,
+            # чтобы не сдвигать случайность карты и повторять ход после загрузки
+            # (номера врагов после загрузки другие - павшие в снимок не попадают)
+            mix = time_due * 2654435761 + actor.x * 40503 + actor.y * 69069
+            dx, dy = _PATROL_STEPS[(mix >> 16) % len(_PATROL_STEPS)]
+            step = (actor.x + dx, actor.y + dy)
+        
+        if step == (player.x, player.y):
+            return True
+        if step == (actor.x, actor.y) or not game_map.is_walkable(*step) or game_map.get_enemy_at(*step):
+            return False
+        if actor.is_boss:
+            actor.x, actor.y = step
+        else:
+            game_map.move_enemy(actor, *step)
+        return False
+
+
+# ========== ПОЛЕ ЗРЕНИЯ ==========
+FOV_RADIUS = 8  # Дальность взгляда героя в режиме тумана войны
+
+# Множители координат для восьми октантов теневого заброса: (xx, xy, yx, yy)
+_OCTANTS = ((1, 0, 0, 1), (0, 1, 1, 0), (0, -1, 1, 0), (-1, 0, 0, 1),
+            (-1, 0, 0, -1), (0, -1, -1, 0), (0, 1, -1, 0), (1, 0, 0, -1))
+
+
+class FieldOfView:
+    """Поле зрения героя и память исследованных клеток (туман войны)
+    
+    Видимые клетки считаются рекурсивным теневым забросом (shadowcasting)
+    по восьми октантам: стены закрывают обзор, видимость ограничена кругом
+    радиуса radius. Пересчет идет, только когда герой сменил клетку или
+    изменилась сетка (версия TileGrid), и затрагивает лишь клетки в радиусе.
+    Видимые клетки - множество номеров y * width + x, исследованные -
+    bytearray размером с карту.
+    """
+    
+    def __init__(self, game_map: 'GameMap', radius: int = FOV_RADIUS):
+        self.game_map = game_map
+        self.radius = radius
+        self.visible = set()
+        self.explored = bytearray(game_map.width * game_map.height)
+        self._origin = None  # (x, y, сетка, версия) последнего пересчета
+        self.recomputes = 0  # Сколько раз поле считалось заново (для замеров)
+    
+    def update(self, x: int, y: int):
+        """Пересчет видимых клеток из (x, y), если что-то изменилось"""
+        grid = self.game_map.grid
+        origin = (x, y, grid, grid.version)
+        if origin == self._origin:
+            return
+        self._origin = origin
+        self.recomputes += 1
+        
+        width = self.game_map.width
+        self.visible = {y * width + x}
+        cells = grid.snapshot()
+        for octant in _OCTANTS:
+            self._cast(cells, x, y, 1, 1.0, 0.0, *octant)
+        explored = self.explored
+        for index in self.visible:
+            explored[index] = 1
+    
+    def _cast(self, cells: bytes, cx: int, cy: int, row: int, start: float, end: float,
+              xx: int, xy: int, yx: int, yy: int):
+        """Один октант: строки от row, видимый сектор между наклонами start и end"""
+        if start < end:
+            return
+        width, height = self.game_map.width, self.game_map.height
+        wall = ord(TILE_WALL)
+        radius = self.radius
+        radius_squared = radius * radius + radius  # Чуть шире круга - ровнее край
+        visible = self.visible
+        new_start = start
+        for distance in range(row, radius + 1):
+            dy = -distance
+            blocked = False
+            for dx in range(-distance, 1):
+                left_slope = (dx - 0.5) / (dy + 0.5)
+                right_slope = (dx + 0.5) / (dy - 0.5)
+                if start < right_slope:
+                    continue
+                if end > left_slope:
+                    break
+                
+                map_x = cx + dx * xx + dy * xy
+                map_y = cy + dx * yx + dy * yy
+                inside = 0 <= map_x < width and 0 <= map_y < height
+                if inside and dx * dx + dy * dy <= radius_squared:
+                    visible.add(map_y * width + map_x)
+                opaque = not inside or cells[map_y * width + map_x] == wall
+                
+                if blocked:
+                    if opaque:
+                        new_start = right_slope
+                    else:
+                        blocked = False
+                        start = new_start
+                elif opaque and distance < radius:
+                    # Стена отбрасывает тень: сектор до нее досматриваем рекурсивно
+                    blocked = True
+                    self._cast(cells, cx, cy, distance + 1, start, left_slope, xx, xy, yx, yy)
+                    new_start = right_slope
+            if blocked:
+                break
+    
+    def is_visible(self, x: int, y: int) -> bool:
+        return y * self.game_map.width + x in self.visible
+    
+    def is_explored(self, x: int, y: int) -> bool:
+        return bool(self.explored[y * self.game_map.width + x])
+
+
+# ========== КОНСОЛЬ ==========
+class _DiscardStream(io.TextIOBase):
+    """Поток вывода, который ничего не выводит"""
+    
+    def write(self, text: str) -> int:
+        return len(text)
+
+
+class Console:
+    """Ввод игрока, очистка экрана и паузы интерактивной игры
+    
+    Игра обращается к терминалу только через этот объект. Слушатели
+    получают каждую строку, введенную игроком, а заранее записанные строки
+    можно проиграть как ввод: молча (восстановление партии, быстрый повтор
+    сеанса) или на экране с заданной скоростью.
+    """
+    
+    def __init__(self):
+        self.listeners: List[Callable[[str], None]] = []
+        self.script = deque()
+        self.speed = 1.0  # Ускорение пауз при повторе на экране
+        self.live_after = True  # Переходить ли к вводу игрока, когда строки закончатся
+        # Растет, когда содержимое экрана потеряно и кадр нужно рисовать заново
+        self.screen_epoch = 0
+        self._stdout = None
+    
+    @property
+    def quiet(self) -> bool:
+        """Вывод подавлен: рисовать кадры и ждать незачем"""
+        return self._stdout is not None
+    
+    def input(self, prompt: str = "") -> str:
+        if self.script:
+            text = self.script.popleft()
+            if not self.quiet:
+                # Повтор на экране: ввод виден так, будто его только что набрали
+                print(prompt + text)
+                time.sleep(0.5 / self.speed)
+            if not self.script and self.live_after:
+                self.stop_replay()
+            return text
+        
+        if not self.live_after:
+            self.stop_replay()
+            raise EOFError("Записанный ввод закончился")
+        
+        text = input(prompt)
+        for listener in self.listeners:
+            listener(text)
+        return text
+    
+    def clear(self):
+        if not self.quiet:
+            os.system('cls' if os.name == 'nt' else 'clear')
+        self.screen_epoch += 1
+    
+    def sleep(self, seconds: float):
+        if not self.quiet:
+            time.sleep(seconds / self.speed)
+    
+    def replay(self, lines: List[str], quiet: bool = True, speed: float = 1.0, live_after: bool = True):
+        """Подать строки на ввод
+        
+        quiet - подавить вывод, пока строки не закончатся, иначе показывать
+        игру, ускорив паузы в speed раз. Если live_after ложно, по окончании
+        строк ввод завершается EOFError, а не переходит к игроку.
+        """
+        self.script = deque(lines)
+        self.speed = speed
+        self.live_after = live_after
+        if quiet and self.script and self._stdout is None:
+            self._stdout = sys.stdout
+            sys.stdout = _DiscardStream()
+    
+    def stop_replay(self):
+        self.script.clear()
+        self.speed = 1.0
+        self.live_after = True
+        if self._stdout is not None:
+            sys.stdout = self._stdout
+            self._stdout = None
+            self.screen_epoch += 1
+
+
+console = Console()
+
+
+# ========== ОТРИСОВКА ==========
+class TerminalRenderer:
+    """Вывод кадров в терминал одной записью
+    
+    Хранит предыдущий кадр и выводит только изменившиеся клетки карты и
+    строки информации, перемещая курсор escape-последовательностями.
+    """
+    
+    # Строк под кадром, которые оставляем для сообщений и ввода команды
+    PROMPT_RESERVE = 8
+    
+    def __init__(self, stream=None, rows: Optional[int] = None):
+        self.stream = stream
+        self.rows = rows
+        self.bytes_written = 0
+        self._cells = None
+        self._lines = []
+        self._screen_epoch = console.screen_epoch
+    
+    def invalidate(self):
+        """Забыть предыдущий кадр (экран был очищен или прокручен)"""
+        self._cells = None
+        self._lines = []
+    
+    def render(self, cells: List[List[str]], lines: List[str]):
+        """Вывести кадр: при известном предыдущем кадре - только разницу"""
+        if self._screen_epoch != console.screen_epoch:
+            # Экран очищали или вывод был подавлен - прежнего кадра на нем нет
+            self._screen_epoch = console.screen_epoch
+            self.invalidate()
+        rows = self.rows or shutil.get_terminal_size().lines
+        fits = len(cells) + len(lines) + self.PROMPT_RESERVE <= rows
+        
+        if self._cells is None or not fits or len(self._cells) != len(cells):
+            out = ["\033[2J\033[H"]
+            out.append("\n".join("".join(row) for row in cells))
+            out.append("\n")
+            out.append("\n".join(lines))
+            out.append("\n")
+        else:
+            out = self._diff(cells, lines)
+        
+        # Курсор под кадром, старые сообщения и ввод ниже него стираются
+        out.append(f"\033[{len(cells) + len(lines) + 1};1H\033[J")
+        
+        # Кадр, не помещающийся на экран, прокрутит его - тогда разницу не считаем
+        if fits:
+            self._cells = cells
+            self._lines = lines
+        else:
+            self.invalidate()
+        self._write("".join(out))
+    
+    def _diff(self, cells: List[List[str]], lines: List[str]) -> List[str]:
+        out = []
+        for y, (row, old_row) in enumerate(zip(cells, self._cells)):
+            if row == old_row:
+                continue
+            # Соседние изменившиеся клетки выводим одним отрезком
+            x = 0
+            width = len(row)
+            while x < width:
+                if x < len(old_row) and row[x] == old_row[x]:
+                    x += 1
+                    continue
+                start = x
+                while x < width and (x >= len(old_row) or row[x] != old_row[x]):
+                    x += 1
+                out.append(f"\033[{y + 1};{start + 1}H")
+                out.extend(row[start:x])
+        
+        # Лишние старые строки сотрет очистка экрана ниже кадра
+        top = len(cells) + 1
+        for i, line in enumerate(lines):
+            if i < len(self._lines) and self._lines[i] == line:
+                continue
+            out.append(f"\033[{top + i};1H{line}\033[K")
+        return out
+    
+    def _write(self, text: str):
+        stream = self.stream or sys.stdout
+        stream.write(text)
+        stream.flush()
+        self.bytes_written += len(text.encode("utf-8"))
+
+
+class RoomIndex:
+    """Пространственный индекс комнат на корзинах фиксированного размера
+    
+    Комната заносится во все корзины, которые задевает ее контур, расширенный
+    на padding, поэтому кандидаты на пересечение ищутся только в корзинах
+    самой новой комнаты, а не перебором всех комнат.
+    """
+    
+    def __init__(self, bucket_size: int, padding: int = ROOM_PADDING):
+        self.bucket_size = bucket_size
+        self.padding = padding
+        self.buckets = {}
+    
+    def _bucket_range(self, x0: int, y0: int, x1: int, y1: int):
+        size = self.bucket_size
+        for by in range(y0 // size, y1 // size + 1):
+            for bx in range(x0 // size, x1 // size + 1):
+                yield bx, by
+    
+    def add(self, room: Room):
+        pad = self.padding
+        for key in self._bucket_range(room.x - pad, room.y - pad, room.x + room.w + pad, room.y + room.h + pad):
+            self.buckets.setdefault(key, []).append(room)
+    
+    def candidates(self, room: Room):
+        """Комнаты, которые могут пересекаться с room (возможны повторы)"""
+        for key in self._bucket_range(room.x, room.y, room.x + room.w, room.y + room.h):
+            yield from self.buckets.get(key, ())
+
+
+class EnemyRadar:
+    """Индекс живых врагов на корзинах для поиска ближайших
+    
+    Враг лежит в корзине своей клетки; запрос по радиусу смотрит только
+    корзины, задетые квадратом вокруг точки, поэтому стоимость зависит от
+    числа врагов рядом, а не на всей карте. Павших врагов карта убирает
+    из индекса сразу после боя. При равном расстоянии раньше идет враг,
+    раньше добавленный на карту.
+    """
+    
+    def __init__(self, bucket_size: int = ENEMY_BUCKET_SIZE):
+        self.bucket_size = bucket_size
+        self.buckets = {}  # (bx, by) -> {враг: порядковый номер}
+        self._count = 0
+    
+    def _key(self, x: int, y: int) -> Tuple[int, int]:
+        return x // self.bucket_size, y // self.bucket_size
+    
+    def add(self, enemy: Combatant):
+        self.buckets.setdefault(self._key(enemy.x, enemy.y), {})[enemy] = self._count
+        self._count += 1
+    
+    def remove(self, enemy: Combatant):
+        key = self._key(enemy.x, enemy.y)
+        bucket = self.buckets.get(key)
+        if bucket and bucket.pop(enemy, None) is not None and not bucket:
+            del self.buckets[key]
+    
+    def move(self, enemy: Combatant, x: int, y: int):
+        """Перенос в корзину новой клетки; вызывается до смены координат врага"""
+        old_key, new_key = self._key(enemy.x, enemy.y), self._key(x, y)
+        bucket = self.buckets.get(old_key)
+        if old_key == new_key or not bucket or enemy not in bucket:
+            return
+        order = bucket[enemy]
+        self.remove(enemy)
+        self.buckets.setdefault(new_key, {})[enemy] = order
+    
+    def nearest(self, x: int, y: int, radius: int, limit: Optional[int]) -> List[Tuple[Combatant, int]]:
+        """До limit (None - все) живых врагов не дальше radius (манхэттен), по возрастанию расстояния"""
+        found = []
+        bx0, by0 = self._key(x - radius, y - radius)
+        bx1, by1 = self._key(x + radius, y + radius)
+        for by in range(by0, by1 + 1):
+            for bx in range(bx0, bx1 + 1):
+                bucket = self.buckets.get((bx, by))
+                if not bucket:
+                    continue
+                for enemy, order in bucket.items():
+                    distance = abs(enemy.x - x) + abs(enemy.y - y)
+                    if distance <= radius and enemy.is_alive:
+                        found.append((distance, order, enemy))
+        found.sort()  # Порядковые номера различны, до сравнения врагов не доходит
+        return [(enemy, distance) for distance, _, enemy in found[:limit]]
+
+
+def _take_from_cell(cells: Dict[Tuple[int, int], int], pos: Tuple[int, int]) -> bool:
+    """Уменьшить счетчик предметов в клетке, удалив пустую клетку"""
+    count = cells.get(pos, 0)
+    if not count:
+        return False
+    if count == 1:
+        del cells[pos]
+    else:
+        cells[pos] = count - 1
+    return True
+
+
+class GameMap:
+    def __init__(self, level: int = 1, difficulty: int = 2, rng: Optional[random.Random] = None,
+                 grid_kind: str = "list", width: int = MAP_WIDTH, height: int = MAP_HEIGHT,
+                 generate: bool = True, enemy_store: str = "objects"):
+        self.level = level
+        self.difficulty = difficulty
+        self.width = width
+        self.height = height
+        self.grid_kind = grid_kind  # Представление сетки тайлов, см. make_tile_grid
+        self.enemy_store = enemy_store  # Хранилище врагов, см. make_enemy_store
+        # Собственный генератор позволяет воспроизводить уровень по зерну
+        # и строить карты в разных потоках независимо
+        self.rng = rng if rng is not None else random
+        
+        # Инициализация фабрик в зависимости от сложности
+        if difficulty == 1:  # Легкий
+            self.character_factory = EasyLevelFactory(level, self.rng)
+            self.treasure_factory = EasyTreasureFactory(self.rng)
+        elif difficulty == 2:  # Нормальный
+            self.character_factory = NormalLevelFactory(level, self.rng)
+            self.treasure_factory = NormalTreasureFactory(self.rng)
+        else:  # Сложный
+            self.character_factory = HardLevelFactory(level, self.rng)
+            self.treasure_factory = HardTreasureFactory(self.rng)
+        
+        self.grid = None
+        self.enemies = make_enemy_store(enemy_store)
+        # Живые враги карты: пополняется в add_enemy, убывает в defeat_enemy,
+        # поэтому проверка очистки уровня не перебирает врагов
+        self.alive_enemies = set()
+        self.radar = EnemyRadar()  # Живые враги по корзинам для панели ближайших
+        self.rooms = []
+        # Индексы по клеткам: позиция -> враги в ней / число сокровищ и ловушек
+        self.enemy_cells = {}
+        self.treasures = {}
+        self.traps = {}
+        self.boss = None
+        self.paths = Pathfinder(self)  # Поиск пути, кэш полей расстояний сбрасывается по версии сетки
+        self.clock = 0  # Время уровня в очереди ходов (режим с ходами врагов)
+        self.fov = None  # Поле зрения героя для тумана войны (FieldOfView); None - карта видна целиком
+        if generate:
+            self.generate_dungeon()
+        else:
+            # Пустая карта из одних стен - ее заполнит загрузка сохранения
+            self.grid = make_tile_grid(width, height, grid_kind)
+    
+    def generate_dungeon(self):
+        """Генерация подземелья с учетом уровня"""
+        # Инициализация сетки
+        self.grid = make_tile_grid(self.width, self.height, self.grid_kind)
+        self.rooms = []
+        self.enemies = make_enemy_store(self.enemy_store)
+        self.alive_enemies = set()
+        self.radar = EnemyRadar()
+        self.enemy_cells = {}
+        self.treasures = {}
+        self.traps = {}
+        self.boss = None
+        
+        # Параметры, зависящие от уровня
+        room_count = self.scaled(self.rng.randint(4 + self.level // 2, 7 + self.level))
+        min_room_size = max(3, 3 + self.level // 3)
+        max_room_size = min(10, 7 + self.level // 2)
+        
+        # Корзины индекса не меньше комнаты с зазором: проверяются только соседи
+        room_index = RoomIndex(max_room_size + ROOM_PADDING, ROOM_PADDING)
+        
+        # Генерация комнат
+        for _ in range(room_count):
+            attempts = 0
+            while attempts < 100:
+                w = self.rng.randint(min_room_size, max_room_size)
+                h = self.rng.randint(min_room_size, max_room_size)
+                x = self.rng.randint(1, self.width - w - 2)
+                y = self.rng.randint(1, self.height - h - 2)
+                
+                new_room = Room(x, y, w, h, rng=self.rng)
+                
+                # Проверка на пересечение с соседними комнатами
+                if not any(self.rooms_overlap(new_room, existing_room)
+                           for existing_room in room_index.candidates(new_room)):
+                    self.create_room(new_room)
+                    
+                    if self.rooms:
+                        last_room = self.rooms[-1]
+                        self.create_tunnel(last_room, new_room)
+                    
+                    self.rooms.append(new_room)
+                    room_index.add(new_room)
+                    break
+                attempts += 1
+        
+        # Спавн врагов, сокровищ и ловушек с использованием фабрик
+        self.spawn_enemies()
+        self.spawn_treasures()
+        
+        # Добавляем босса на каждом 3-м уровне
+        if self.level % 3 == 0:
+            self.spawn_boss()
+        
+        # Добавляем ловушки на высоких уровнях
+        if self.level >= 2:
+            self.spawn_traps()
+    
+    def scaled(self, count: int) -> int:
+        """Количество объектов, пропорциональное площади карты"""
+        area_scale = (self.width * self.height) / (MAP_WIDTH * MAP_HEIGHT)
+        if area_scale <= 1:
+            return count
+        return int(count * area_scale)
+    
+    def rooms_overlap(self, room1: Room, room2: Room, padding: int = ROOM_PADDING) -> bool:
+        """Проверка на пересечение комнат"""
+        return not (room1.x + room1.w + padding < room2.x or
+                   room2.x + room2.w + padding < room1.x or
+                   room1.y + room1.h + padding < room2.y or
+                   room2.y + room2.h + padding < room1.y)
+    
+    def create_room(self, room: Room):
+        """Создание комнаты на карте"""
+        self.grid.fill_rect(room.x, room.y, room.w, room.h, TILE_FLOOR)
+    
+    def create_tunnel(self, room1: Room, room2: Room):
+        """Создание туннеля между комнатами (L-образный, без диагоналей)"""
+        x1, y1 = room1.center_x, room1.center_y
+        x2, y2 = room2.center_x, room2.center_y
+        
+        # Случайно выбираем: сначала горизонтально или вертикально
+        if self.rng.choice([True, False]):
+            # Горизонтально, затем вертикально
+            self.grid.hline(x1, x2, y1, TILE_FLOOR)
+            self.grid.vline(x2, y1, y2, TILE_FLOOR)
+        else:
+            # Вертикально, затем горизонтально
+            self.grid.vline(x1, y1, y2, TILE_FLOOR)
+            self.grid.hline(x1, x2, y2, TILE_FLOOR)
+    
+    def spawn_enemies(self):
+        """Спавн врагов с использованием фабрики"""
+        # Базовое количество врагов
+        base_count = 3
+        level_bonus = min(self.level * 2, 10)  # Ограничиваем максимальный бонус
+        enemy_count = self.scaled(self.rng.randint(base_count, base_count + level_bonus))
+        
+        # Шанс появления элитных врагов
+        elite_chance = min(0.1 + (self.level - 1) * 0.05, 0.3)
+        
+        for i in range(enemy_count):
+            if len(self.rooms) > 1:
+                room = self.rooms[self.rng.randrange(1, len(self.rooms))]  # Не спавним в стартовой комнате
+            else:
+                room = self.rooms[0]
+            
+            # Выбираем позицию в комнате
+            ex = self.rng.randint(max(room.x, 0), min(room.x + room.w - 1, self.width - 1))
+            ey = self.rng.randint(max(room.y, 0), min(room.y + room.h - 1, self.height - 1))
+            
+            # Определяем, элитный ли враг
+            is_elite = self.rng.random() < elite_chance and self.level >= 2
+            
+            # Создаем врага через фабрику
+            if is_elite:
+                enemy = self.character_factory.create_elite_enemy(ex, ey)
+            else:
+                enemy = self.character_factory.create_normal_enemy(ex, ey)
+            
+            self.add_enemy(enemy)
+    
+    def spawn_boss(self):
+        """Создание босса через фабрику"""
+        # Босс появляется в последней комнате
+        boss_room = self.rooms[-1]
+        
+        # Создаем босса через фабрику
+        self.boss = self.character_factory.create_boss(boss_room.center_x, boss_room.center_y)
+    
+    def spawn_treasures(self):
+        """Размещение сокровищ на карте"""
+        treasure_count = self.scaled(self.rng.randint(2 + self.level // 2, 5 + self.level // 2))
+        
+        for _ in range(treasure_count):
+            if self.rooms:
+                room = self.rng.choice(self.rooms)
+                tx = self.rng.randint(max(room.x, 0), min(room.x + room.w - 1, self.width - 1))
+                ty = self.rng.randint(max(room.y, 0), min(room.y + room.h - 1, self.height - 1))
+                self.treasures[(tx, ty)] = self.treasures.get((tx, ty), 0) + 1
+    
+    def spawn_traps(self):
+        """Размещение ловушек на высоких уровнях"""
+        trap_count = self.scaled(self.rng.randint(1, 2 + self.level // 2))
+        
+        for _ in range(trap_count):
+            if len(self.rooms) > 1:
+                room = self.rooms[self.rng.randrange(1, len(self.rooms))]  # Не в стартовой комнате
+                tx = self.rng.randint(max(room.x, 0), min(room.x + room.w - 1, self.width - 1))
+                ty = self.rng.randint(max(room.y, 0), min(room.y + room.h - 1, self.height - 1))
+                self.traps[(tx, ty)] = self.traps.get((tx, ty), 0) + 1
+                self.grid.set(tx, ty, TILE_TRAP)
+    
+    def check_trap(self, x: int, y: int, player: Hero) -> Tuple[bool, int]:
+        """Проверка на ловушку"""
+        if (x, y) in self.traps:
+            trap_damage = 5 + self.level * 2
+            player.hp -= trap_damage
+            _take_from_cell(self.traps, (x, y))
+            self.grid.set(x, y, TILE_FLOOR)
+            return True, trap_damage
+        return False, 0
+    
+    def viewport(self, player: Hero) -> Tuple[int, int, int, int]:
+        """Видимая часть карты вокруг игрока: x, y, ширина, высота"""
+        view_w = min(self.width, VIEW_WIDTH)
+        view_h = min(self.height, VIEW_HEIGHT)
+        view_x = min(max(player.x - view_w // 2, 0), self.width - view_w)
+        view_y = min(max(player.y - view_h // 2, 0), self.height - view_h)
+        return view_x, view_y, view_w, view_h
+    
+    def glyph(self, x: int, y: int, char: str) -> str:
+        """Клетка кадра без героя: босс, враг, сокровище, ловушка или местность char"""
+        # Босс
+        if self.boss and self.boss.x == x and self.boss.y == y and self.boss.is_alive:
+            return f"\033[1;35m{self.boss.symbol}\033[0m"  # Фиолетовый для босса
+        
+        # Враги
+        if (x, y) in self.enemy_cells:
+            enemy = self.get_enemy_at(x, y)
+            if enemy:
+                if enemy.enemy_type == EnemyType.ELITE:
+                    return f"\033[1;33m{enemy.symbol}\033[0m"  # Желтый для элитных
+                return f"\033[1;31m{enemy.symbol}\033[0m"  # Красный для обычных
+        
+        # Сокровища
+        if (x, y) in self.treasures:
+            return "\033[1;33m$\033[0m"  # Желтый
+        
+        # Ловушки
+        if char == TILE_TRAP:
+            return "\033[1;31m^\033[0m"  # Красный
+        
+        # Стены и пол
+        if char == TILE_WALL:
+            return "\033[90m▓\033[0m"  # Серые стены
+        if char == TILE_FLOOR:
+            return "\033[37m·\033[0m"  # Светлые точки пола
+        return char
+    
+    def compose_frame(self, player: Hero) -> Tuple[List[List[str]], List[str]]:
+        """Сборка кадра: клетки карты с рамкой и строки информации под ней"""
+        fov = self.fov
+        if fov is not None:
+            fov.update(player.x, player.y)
+        
+        # Верхняя граница
+        view_x, view_y, view_w, view_h = self.viewport(player)
+        cells = [list("╔" + "═" * view_w + "╗")]
+        
+        # Карта
+        for y in range(view_y, view_y + view_h):
+            row = ["║"]
+            tiles = self.grid.row(y)
+            for x in range(view_x, view_x + view_w):
+                char = tiles[x]
+                
+                # Туман войны: вне поля зрения - только запомненная местность
+                if fov is not None and not fov.is_visible(x, y):
+                    if not fov.is_explored(x, y):
+                        row.append(" ")
+                    elif char == TILE_WALL:
+                        row.append("\033[90m▒\033[0m")
+                    else:
+                        row.append(f"\033[90m{'·' if char == TILE_FLOOR else char}\033[0m")
+                
+                # Игрок
+                elif player.x == x and player.y == y:
+                    row.append(f"\033[1;32m{player.symbol}\033[0m")
+                
+                # Босс, враги, сокровища и местность
+                else:
+                    row.append(self.glyph(x, y, char))
+            row.append("║")
+            cells.append(row)
+        
+        # Нижняя граница
+        cells.append(list("╚" + "═" * view_w + "╝"))
+        
+        # Статистика игрока
+        lines = player.get_stats().split("\n")
+        
+        # Информация об уровне
+        lines.append(f"Уровень подземелья: {self.level}")
+        lines.append(f"Сложность: {'Легкий' if self.difficulty == 1 else 'Нормальный' if self.difficulty == 2 else 'Сложный'}")
+        
+        # Ближайшие враги (в тумане войны - только те, кого видно)
+        if fov is None:
+            nearby_enemies = self.radar.nearest(player.x, player.y, 8, 3)
+        else:
+            nearby_enemies = [(enemy, distance)
+                              for enemy, distance in self.radar.nearest(player.x, player.y, 8, None)
+                              if fov.is_visible(enemy.x, enemy.y)][:3]
+        
+        # Босс (в тумане войны - только если его видно)
+        if self.boss and self.boss.is_alive and (fov is None or fov.is_visible(self.boss.x, self.boss.y)):
+            boss_distance = abs(self.boss.x - player.x) + abs(self.boss.y - player.y)
+            if boss_distance <= 12:
+                hp_percent = (self.boss.hp / self.boss.max_hp) * 100
+                lines.append("")
+                lines.append(f"⚠️  БОСС ПРИБЛИЖАЕТСЯ: {self.boss.name}")
+                lines.append(f"   Здоровье: {self.boss.hp}/{self.boss.max_hp} ({hp_percent:.1f}%)")
+                lines.append(f"   Расстояние: {boss_distance} клеток")
+        
+        # Ближайшие враги
+        if nearby_enemies:
+            lines.append("")
+            lines.append("Ближайшие враги:")
+            for enemy, distance in nearby_enemies:  # Три ближайших по возрастанию расстояния
+                health_percent = (enemy.hp / enemy.max_hp) * 100
+                health_bar_length = 5
+                filled = int(health_percent // (100 / health_bar_length))
+                health_bar = f"{'█' * filled}{'░' * (health_bar_length - filled)}"
+                
+                type_indicator = ""
+                if enemy.enemy_type == EnemyType.ELITE:
+                    type_indicator = " [ЭЛИТНЫЙ]"
+                
+                lines.append(f"  {enemy.name}{type_indicator} - {health_bar} ({distance} клеток)")
+        
+        return cells, lines
+    
+    def draw(self, player: Hero, renderer: Optional['TerminalRenderer'] = None):
+        """Отрисовка карты и информации
+        
+        С общим renderer между ходами выводятся только изменившиеся клетки,
+        без него кадр каждый раз выводится целиком.
+        """
+        cells, lines = self.compose_frame(player)
+        (renderer or TerminalRenderer()).render(cells, lines)
+    
+    def is_walkable(self, x: int, y: int) -> bool:
+        """Проверка, можно ли пройти в клетку"""
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            return False
+        return self.grid.get(x, y) != TILE_WALL
+    
+    def get_enemy_at(self, x: int, y: int) -> Optional[Combatant]:
+        """Получение врага в указанной клетке"""
+        for enemy in self.enemy_cells.get((x, y), ()):
+            if enemy.is_alive:
+                return enemy
+        if self.boss and self.boss.is_alive and self.boss.x == x and self.boss.y == y:
+            return self.boss
+        return None
+    
+    def get_treasure_at(self, x: int, y: int) -> bool:
+        """Проверка, есть ли сокровище в клетке"""
+        return (x, y) in self.treasures
+    
+    def take_treasure(self, x: int, y: int) -> bool:
+        """Забрать сокровище из клетки"""
+        return _take_from_cell(self.treasures, (x, y))
+    
+    def add_enemy(self, enemy: Combatant) -> Combatant:
+        """Добавление врага на карту и в индекс клеток
+        
+        Возвращает объект, которым враг представлен на карте (для хранилища
+        массивов это не переданный объект, а его представление в массивах).
+        """
+        enemy = self.enemies.add(enemy)
+        self.enemy_cells.setdefault((enemy.x, enemy.y), []).append(enemy)
+        if enemy.is_alive:
+            self.alive_enemies.add(enemy)
+            self.radar.add(enemy)
+        return enemy
+    
+    def remove_enemy(self, enemy: Combatant):
+        """Удаление врага из индекса клеток (например, после гибели)"""
+        cell = self.enemy_cells.get((enemy.x, enemy.y))
+        if cell and enemy in cell:
+            cell.remove(enemy)
+            if not cell:
+                del self.enemy_cells[(enemy.x, enemy.y)]
+    
+    def defeat_enemy(self, enemy: Combatant):
+        """Учет врага, павшего в бою: убрать из индекса клеток, живых и радара"""
+        self.remove_enemy(enemy)
+        self.alive_enemies.discard(enemy)
+        self.radar.remove(enemy)
+    
+    def is_cleared(self) -> bool:
+        """Уровень очищен: живых врагов нет и босс (если есть) побежден
+        
+        Счетчик живых ведется при добавлении и гибели врагов, поэтому
+        проверка не проходит по врагам и ничего не создает.
+        """
+        if self.alive_enemies:
+            return False
+        return self.boss is None or not self.boss.is_alive
+    
+    def move_enemy(self, enemy: Combatant, x: int, y: int):
+        """Перемещение врага с обновлением индекса клеток"""
+        self.remove_enemy(enemy)
+        self.radar.move(enemy, x, y)
+        enemy.x, enemy.y = x, y
+        self.enemy_cells.setdefault((x, y), []).append(enemy)
+    
+    def teleport(self, player: Hero):
+        """Телепортация игрока в случайную комнату"""
+        room = self.rng.choice(self.rooms)
+        player.x = self.rng.randint(room.x, room.x + room.w - 1)
+        player.y = self.rng.randint(room.y, room.y + room.h - 1)
+
+
+@dataclass
+class BattleTurn:
+    """Итог одного раунда обычного боя"""
+    choice: int
+    damage: int = 0
+    critical: bool = False
+    healed: int = 0
+    full_hp: bool = False
+    escaped: bool = False
+    enemy_damage: Optional[int] = None
+    enemy_critical: bool = False
+    elite_ability: Optional[str] = None
+    elite_value: int = 0
+
+
+def resolve_battle_turn(player: Hero, enemy: Combatant, choice: int) -> BattleTurn:
+    """Правила одного раунда обычного боя (без вывода на экран)"""
+    result = BattleTurn(choice)
+    
+    if choice == 1:
+        result.damage, result.critical = player.attack(enemy)
+        if not enemy.is_alive:
+            return result
+    
+    elif choice == 2:
+        if player.hp < player.max_hp:
+            result.healed = player.heal(30)
+        else:
+            # Ход не тратится, враг не атакует
+            result.full_hp = True
+            return result
+    
+    elif choice == 3:
+        # Шанс сбежать зависит от уровня врага
+        escape_chance = 0.4
+        if enemy.enemy_type == EnemyType.ELITE:
+            escape_chance = 0.2
+        
+        if player.rng.random() < escape_chance:
+            result.escaped = True
+            return result
+    
+    # Ход врага
+    if enemy.is_alive:
+        result.enemy_damage, result.enemy_critical = enemy.attack(player)
+        
+        # Особые способности элитных врагов
+        if enemy.enemy_type == EnemyType.ELITE and enemy.is_alive:
+            if enemy.rng.random() < 0.3:  # 30% шанс на особую способность
+                result.elite_ability = enemy.rng.choice(["сильный удар", "исцеление"])
+                if result.elite_ability == "сильный удар":
+                    result.elite_value = enemy.strength // 2
+                    player.hp -= result.elite_value
+                elif result.elite_ability == "исцеление":
+                    result.elite_value = enemy.max_hp // 10
+                    enemy.heal(result.elite_value)
+    
+    return result
+
+
+def award_battle_victory(player: Hero, enemy: Combatant) -> Tuple[int, Optional[str]]:
+    """Награда за победу над обычным врагом: опыт и, возможно, редкий предмет"""
+    exp_gained = enemy.exp_reward if hasattr(enemy, 'exp_reward') else enemy.max_hp // 2 + enemy.strength * 2
+    player.gain_exp(exp_gained)
+    
+    item = None
+    if enemy.enemy_type == EnemyType.ELITE:
+        # Шанс на получение редкого предмета
+        if player.rng.random() < 0.5:
+            rare_items = ["Руна силы", "Амулет защиты", "Сапфир маны"]
+            item = player.rng.choice(rare_items)
+            player.inventory.append(item)
+    
+    return exp_gained, item
+
+
+def start_battle(player: Hero, enemy: Combatant):
+    """Запуск боя с обычным врагом"""
+    console.clear()
+    
+    print("╔" + "═" * 50 + "╗")
+    print(f"║{'БОЙ НАЧИНАЕТСЯ!':^50}║")
+    
+    if enemy.enemy_type == EnemyType.ELITE:
+        print(f"║{'ВСТРЕЧА С ЭЛИТНЫМ ВРАГОМ!':^50}║")
+    
+    print(f"║{f'{player.name} vs {enemy.name}':^50}║")
+    print("╚" + "═" * 50 + "╝")
+    
+    turn = 0
+    
+    while player.is_alive and enemy.is_alive:
+        turn += 1
+        
+        print(f"\n{'─' * 50}")
+        print(f"РАУНД {turn}")
+        print(f"{'─' * 50}")
+        
+        # Статусы
+        player_health = f"{player.hp}/{player.max_hp} HP"
+        enemy_health = f"{enemy.hp}/{enemy.max_hp} HP"
+        
+        print(f"\n{player.name:25} {player_health:>10}")
+        print(f"{enemy.name:25} {enemy_health:>10}")
+        print(f"{'─' * 50}")
+        
+        # Ход игрока
+        print("\nВыберите действие:")
+        print("1. Атаковать мечом")
+        print("2. Использовать зелье здоровья (+30 HP)")
+        print("3. Попытаться сбежать")
+        
+        try:
+            choice = int(console.input("Ваш выбор: "))
+        except ValueError:
+            choice = 0
+        
+        turn_result = resolve_battle_turn(player, enemy, choice)
+        
+        if choice == 1:
+            if turn_result.critical:
+                print(f"\n✨ КРИТИЧЕСКИЙ УДАР! Вы нанесли {turn_result.damage} урона!")
+            else:
+                print(f"\n⚔️ Вы нанесли {turn_result.damage} урона!")
+            
+            if not enemy.is_alive:
+                break
+        
+        elif choice == 2:
+            if turn_result.full_hp:
+                print("\nУ вас и так полное здоровье!")
+                continue
+            print(f"\n🧪 Вы выпили зелье здоровья и восстановили {turn_result.healed} HP!")
+        
+        elif choice == 3:
+            if turn_result.escaped:
+                print("\n🏃 Вы успешно сбежали из боя!")
+                return True  # Успешно сбежали
+            print("\nВраг блокирует ваш путь к отступлению!")
+        
+        else:
+            print("\nНеверный выбор! Пропускаете ход.")
+        
+        # Ход врага
+        if turn_result.enemy_damage is not None:
+            if turn_result.enemy_critical:
+                print(f"\n💥 {enemy.name} наносит критический удар на {turn_result.enemy_damage} урона!")
+            else:
+                print(f"\n🗡️ {enemy.name} атакует и наносит {turn_result.enemy_damage} урона!")
+            
+            if turn_result.elite_ability == "сильный удар":
+                print(f"💢 {enemy.name} использует СИЛЬНЫЙ УДАР! Дополнительно {turn_result.elite_value} урона!")
+            elif turn_result.elite_ability == "исцеление":
+                print(f"💚 {enemy.name} исцеляется на {turn_result.elite_value} HP!")
+        
+        if not player.is_alive:
+            print(f"\n☠️ {player.name} пал в бою...")
+            break
+    
+    # Результаты боя
+    if not enemy.is_alive:
+        exp_gained, item = award_battle_victory(player, enemy)
+        print(f"\n🎉 {enemy.name} повержен!")
+        print(f"Получено опыта: {exp_gained}")
+        
+        # Дополнительные награды за элитных врагов
+        if enemy.enemy_type == EnemyType.ELITE:
+            print("⭐ Вы победили элитного врага! Получена дополнительная награда!")
+            if item:
+                print(f"🎁 Получен предмет: {item}")
+    
+    console.input("\nНажмите Enter, чтобы продолжить...")
+    return False
+
+
+BOSS_TYPES = ("dragon", "lich", "titan")
+MAX_MINIONS = 3
+SKELETON_STATS = ("Скелет-слуга", 's', 30, 8, 3)  # Имя, символ, HP, сила, защита
+
+BOSS_LEGENDARY_ITEMS = {
+    "dragon": ["Сердце дракона", "Чешуя дракона", "Коготь древнего"],
+    "lich": ["Филоктерия", "Посох некроманта", "Кольцо тьмы"],
+    "titan": ["Камень вечности", "Сердце горы", "Длань титана"]
+}
+
+
+@dataclass
+class BossTurn:
+    """Итог одного хода боя с боссом"""
+    choice: int
+    damage: int = 0
+    critical: bool = False
+    healed: int = 0
+    full_hp: bool = False
+    defending: bool = False
+    special: Optional[str] = None  # Тип босса, если сработала особая способность
+    boss_damage: Optional[int] = None
+    summoned: bool = False
+    stunned: bool = False
+    minion_attacks: List[Tuple[str, int]] = field(default_factory=list)
+
+
+class BossFight:
+    """Правила боя с боссом без вывода на экран
+    
+    Конечный автомат: next_turn() начинает ход и переводит босса в
+    следующую фазу (ярость при 60% HP, финальная фаза при 30%), act()
+    применяет действие героя и ответ босса и его слуг.
+    """
+    
+    def __init__(self, player: Hero, boss: Boss):
+        self.player = player
+        self.boss = boss
+        self.turn = 0
+        self.phase = 1
+    
+    @property
+    def is_over(self) -> bool:
+        return not (self.player.is_alive and self.boss.is_alive)
+    
+    def next_turn(self) -> Optional[int]:
+        """Начать ход; возвращает номер фазы, если босс в нее перешел"""
+        self.turn += 1
+        boss = self.boss
+        boss_hp_percent = boss.hp / boss.max_hp
+        
+        if 0.3 < boss_hp_percent <= 0.6:
+            # Режим ярости при переходе во вторую фазу
+            if self.phase == 1:
+                self.phase = 2
+                boss.enraged = True
+                boss.strength = int(boss.strength * 1.3)
+                return 2
+        elif boss_hp_percent <= 0.3:
+            # Финальная фаза: босс жертвует защитой ради атаки
+            if self.phase == 2:
+                self.phase = 3
+                boss.strength = int(boss.strength * 1.5)
+                boss.armor = int(boss.armor * 0.7)
+                return 3
+        return None
+    
+    def act(self, choice: int) -> BossTurn:
+        """Действие героя (1 - атака, 2 - зелье, 3 - защита) и ответ босса"""
+        player, boss = self.player, self.boss
+        result = BossTurn(choice)
+        
+        if choice == 1:
+            result.damage, result.critical = player.attack(boss)
+        elif choice == 2:
+            if player.hp < player.max_hp:
+                result.healed = player.heal(50)
+            else:
+                # Ход не тратится, босс не атакует
+                result.full_hp = True
+                return result
+        elif choice == 3:
+            result.defending = True
+        
+        if not boss.is_alive:
+            return result
+        
+        # Каждый 3-й ход - особая способность
+        if self.turn % 3 == 0:
+            result.special = boss.boss_type
+            if boss.boss_type == "dragon":
+                result.boss_damage = boss.strength * 2
+            
+            elif boss.boss_type == "lich":
+                # Лич призывает скелетов и проклинает героя
+                if len(boss.minions) < MAX_MINIONS:
+                    name, symbol, hp, strength, armor = SKELETON_STATS
+                    boss.minions.append(Fighter(name, 0, 0, symbol, hp, strength, armor, rng=boss.rng))
+                    result.summoned = True
+                result.boss_damage = boss.strength // 2
+                player.strength = max(1, player.strength - 2)
+            
+            elif boss.boss_type == "titan":
+                result.boss_damage = boss.strength * 3
+                if result.defending:
+                    result.boss_damage //= 2  # Защита уменьшает урон
+                # Оглушение с шансом (пока без эффекта)
+                result.stunned = boss.rng.random() < 0.5
+        else:
+            # Обычная атака босса
+            strength = boss.strength // 2 if result.defending else boss.strength
+            result.boss_damage = max(1, strength - (player.armor // 3))
+        
+        if result.boss_damage is not None:
+            player.hp -= result.boss_damage
+        
+        # Атака миньонов босса
+        for minion in boss.minions[:]:
+            if minion.is_alive:
+                minion_damage = max(1, minion.strength - (player.armor // 3))
+                player.hp -= minion_damage
+                result.minion_attacks.append((minion.name, minion_damage))
+            else:
+                boss.minions.remove(minion)
+        
+        return result
+
+
+def award_boss_victory(player: Hero, boss: Boss) -> List[str]:
+    """Награда за победу над боссом: опыт, легендарные предметы и постоянный бонус"""
+    player.gain_exp(boss.exp_reward)
+    
+    items = []
+    for item in BOSS_LEGENDARY_ITEMS.get(boss.boss_type, []):
+        if player.rng.random() < 0.5:  # 50% шанс на каждый предмет
+            player.inventory.append(item)
+            items.append(item)
+    
+    if boss.boss_type == "dragon":
+        player.max_hp += 30
+        player.hp = min(player.max_hp, player.hp + 30)
+    elif boss.boss_type == "lich":
+        player.strength += 5
+    elif boss.boss_type == "titan":
+        player.armor += 5
+    
+    return items
+
+
+def start_boss_battle(player: Hero, boss: Boss):
+    """Запуск боя с боссом"""
+    console.clear()
+    
+    print("╔" + "═" * 50 + "╗")
+    print(f"║{'БИТВА С БОССОМ!':^50}║")
+    print(f"║{f'{boss.name}':^50}║")
+    print("╚" + "═" * 50 + "╝")
+    
+    print(f"\n⚡ ОСОБЫЕ МЕХАНИКИ БОССА:")
+    
+    if boss.boss_type == "dragon":
+        print("  • Огненное дыхание: наносит урон по площади")
+        print("  • Сопротивление огню: получает меньше урона от огня")
+        print("  • Полёт: может уклоняться от атак")
+    
+    elif boss.boss_type == "lich":
+        print("  • Проклятие: уменьшает вашу силу")
+        print("  • Призыв скелетов: вызывает помощников")
+        print("  • Нежить: невосприимчив к ядам")
+    
+    elif boss.boss_type == "titan":
+        print("  • Землетрясение: оглушает на 1 ход")
+        print("  • Каменная кожа: уменьшает получаемый урон")
+        print("  • Сокрушение: наносит двойной урон при низком HP")
+    
+    print(f"\n⚠️  НЕЛЬЗЯ СБЕЖАТЬ ОТ БОССА!")
+    print(f"{'─' * 50}")
+    
+    console.input("\nНажмите Enter, чтобы начать бой...")
+    
+    fight = BossFight(player, boss)
+    
+    while not fight.is_over:
+        new_phase = fight.next_turn()
+        console.clear()
+        
+        # Отображение статуса
+        print(f"\nХОД {fight.turn}")
+        print(f"{'─' * 50}")
+        
+        if new_phase == 2:
+            print(f"⚡ {boss.name} впадает в ЯРОСТЬ! Его сила увеличивается!")
+            console.input("\nНажмите Enter, чтобы продолжить...")
+        elif new_phase == 3:
+            print(f"💀 {boss.name} в ФИНАЛЬНОЙ ФАЗЕ! Сила резко возрастает!")
+            console.input("\nНажмите Enter, чтобы продолжить...")
+        
+        # Индикатор здоровья босса
+        boss_hp_percent = boss.hp / boss.max_hp
+        boss_bar_length = 40
+        boss_filled = int(boss_hp_percent * boss_bar_length)
+        
+        if boss_hp_percent > 0.6:
+            phase, phase_color = "I", "🟢"
+        elif boss_hp_percent > 0.3:
+            phase, phase_color = "II", "🟡"
+        else:
+            phase, phase_color = "III", "🔴"
+        
+        print(f"\nБОСС [{phase}] {boss.name}")
+        print(f"HP: [{phase_color * boss_filled}{'⬜' * (boss_bar_length - boss_filled)}] "
+              f"{boss.hp}/{boss.max_hp}")
+        
+        # Здоровье игрока
+        player_hp_percent = player.hp / player.max_hp
+        player_bar_length = 40
+        player_filled = int(player_hp_percent * player_bar_length)
+        player_color = "🟢" if player_hp_percent > 0.3 else "🔴"
+        
+        print(f"\nИГРОК {player.name}")
+        print(f"HP: [{player_color * player_filled}{'⬜' * (player_bar_length - player_filled)}] "
+              f"{player.hp}/{player.max_hp}")
+        
+        print(f"{'─' * 50}")
+        
+        # Ход игрока
+        print("\nВыберите действие:")
+        print("1. Атаковать")
+        print("2. Использовать зелье здоровья (+50 HP)")
+        print("3. Защищаться (уменьшает получаемый урон)")
+        
+        try:
+            choice = int(console.input("Ваш выбор: "))
+        except ValueError:
+            choice = 0
+        
+        turn_result = fight.act(choice)
+        
+        if choice == 1:
+            if turn_result.critical:
+                print(f"\n✨ КРИТИЧЕСКИЙ УДАР! Вы нанесли {turn_result.damage} урона!")
+            else:
+                print(f"\n⚔️ Вы нанесли {turn_result.damage} урона!")
+        
+        elif choice == 2:
+            if turn_result.full_hp:
+                print("\nУ вас и так полное здоровье!")
+                continue
+            print(f"\n🧪 Вы выпили зелье здоровья и восстановили {turn_result.healed} HP!")
+        
+        elif choice == 3:
+            print(f"\n🛡️ Вы принимаете защитную стойку. Следующая атака будет слабее.")
+        
+        else:
+            print("\nНеверный выбор! Пропускаете ход.")
+        
+        # Ход босса
+        if turn_result.special == "dragon":
+            print(f"\n🔥 {boss.name} использует ОГНЕННОЕ ДЫХАНИЕ! Нанесено {turn_result.boss_damage} урона!")
+        
+        elif turn_result.special == "lich":
+            if turn_result.summoned:
+                print(f"\n💀 {boss.name} призывает Скелета-слугу!")
+            print(f"\n☠️ {boss.name} накладывает ПРОКЛЯТИЕ! Нанесено {turn_result.boss_damage} урона, "
+                  f"ваша сила уменьшена!")
+        
+        elif turn_result.special == "titan":
+            if turn_result.defending:
+                print(f"\n🛡️ Ваша защита смягчает удар!")
+            print(f"\n🌋 {boss.name} вызывает ЗЕМЛЕТРЯСЕНИЕ! Нанесено {turn_result.boss_damage} урона!")
+            if turn_result.stunned:
+                print(f"💫 Вы оглушены и пропустите следующий ход!")
+        
+        elif turn_result.boss_damage is not None:
+            print(f"\n👊 {boss.name} атакует и наносит {turn_result.boss_damage} урона!")
+        
+        for minion_name, minion_damage in turn_result.minion_attacks:
+            print(f"  💀 {minion_name} атакует! Нанесено {minion_damage} урона")
+        
+        console.sleep(2)
+    
+    # Результат битвы с боссом
+    if not boss.is_alive:
+        print(f"\n{'🎉' * 25}")
+        print(f"        ПОБЕДА НАД {boss.name}!")
+        print(f"{'🎉' * 25}")
+        
+        items = award_boss_victory(player, boss)
+        print(f"\n✨ Получено опыта: {boss.exp_reward}")
+        for item in items:
+            print(f"🏆 Получен легендарный предмет: {item}")
+        
+        # Постоянные бонусы
+        if boss.boss_type == "dragon":
+            print(f"🌟 Постоянный бонус: +30 к максимальному здоровью (Сердце дракона)")
+        elif boss.boss_type == "lich":
+            print(f"🌟 Постоянный бонус: +5 к силе (Знания некроманта)")
+        elif boss.boss_type == "titan":
+            print(f"🌟 Постоянный бонус: +5 к защите (Кожа титана)")
+    
+    console.input("\nНажмите Enter, чтобы продолжить...")
+
+
+# ========== РАСЧЕТ ИСХОДА БОЯ ==========
+@lru_cache(maxsize=None)
+def damage_distribution(strength: int, target_armor: int, is_boss: bool = False) -> Tuple[Tuple[int, float], ...]:
+    """Распределение урона Hero.attack: пары (урон, вероятность) по возрастанию урона"""
+    distribution = {}
+    for critical, chance in ((False, 0.85), (True, 0.15)):
+        base_damage = strength
+        if critical:
+            base_damage *= 2
+            if is_boss:
+                base_damage = int(base_damage * 1.5)
+        for variance in range(-2, 3):
+            damage = max(1, base_damage + variance - (target_armor // 3))
+            distribution[damage] = distribution.get(damage, 0.0) + chance / 5
+    return tuple(sorted(distribution.items()))
+
+
+@lru_cache(maxsize=4096)
+def _hits_to_kill(hp: int, damage: Tuple[Tuple[int, float], ...]) -> Tuple[float, ...]:
+    """Вероятности того, что цель с hp падает ровно от n-го удара (индекс n)"""
+    result = [0.0]
+    alive = {hp: 1.0}
+    while alive:
+        killed = 0.0
+        remaining = {}
+        for left, p in alive.items():
+            for amount, q in damage:
+                if amount >= left:
+                    killed += p * q
+                else:
+                    remaining[left - amount] = remaining.get(left - amount, 0.0) + p * q
+        result.append(killed)
+        alive = remaining
+    return tuple(result)
+
+
+@lru_cache(maxsize=4096)
+def _survival(hp: int, damage: Tuple[Tuple[int, float], ...], hits: int) -> Tuple[float, ...]:
+    """Вероятности пережить первые k ударов (индекс k) при запасе hp"""
+    result = [1.0]
+    alive = {hp: 1.0}
+    for _ in range(hits):
+        remaining = {}
+        for left, p in alive.items():
+            for amount, q in damage:
+                if amount < left:
+                    remaining[left - amount] = remaining.get(left - amount, 0.0) + p * q
+        alive = remaining
+        result.append(sum(alive.values()))
+    return tuple(result)
+
+
+@dataclass
+class BattleOdds:
+    """Точные шансы обычного боя при заданной тактике героя"""
+    win: float = 0.0
+    death: float = 0.0
+    escape: float = 0.0
+    unresolved: float = 0.0  # Бой не закончился за max_rounds раундов
+    kill_rounds: Dict[int, float] = field(default_factory=dict)  # Раунд победы -> вероятность
+    
+    @property
+    def expected_kill_round(self) -> float:
+        """Средний раунд победы (при условии победы)"""
+        if not self.win:
+            return 0.0
+        return sum(turn * p for turn, p in self.kill_rounds.items()) / self.win
+
+
+def battle_odds(player: Hero, enemy: Combatant, escape_below: int = 0, heal_below: int = 0,
+                max_rounds: int = 1000, tolerance: float = 1e-12) -> BattleOdds:
+    """Точный расчет исхода start_battle для героя и врага
+    
+    Тактика героя: бежать, если HP не больше escape_below, иначе пить зелье,
+    если HP меньше heal_below (и меньше максимума), иначе атаковать. Правила
+    раунда - как в resolve_battle_turn, включая особые способности элитных
+    врагов и ограничение лечения максимумом HP. В общем случае расчет идет
+    динамикой по парам (HP героя, HP врага) раунд за раундом (на массиве
+    NumPy, если он установлен). При постоянной атаке HP героя только
+    убывает, и хватает распределений урона по каждой стороне отдельно.
+    """
+    hit = damage_distribution(player.strength, enemy.armor, player.is_boss)
+    counter = damage_distribution(enemy.strength, player.armor, enemy.is_boss)
+    elite = enemy.enemy_type == EnemyType.ELITE
+    
+    if escape_below <= 0 and heal_below <= 0:
+        if elite:
+            return _elite_attack_only_odds(player.hp, enemy.hp, enemy.max_hp, enemy.max_hp // 10,
+                                           enemy.strength // 2, hit, counter)
+        return _attack_only_odds(player.hp, enemy.hp, hit, counter)
+    
+    if np is not None:
+        return _battle_odds_grid(player, enemy, hit, counter, escape_below, heal_below, max_rounds, tolerance)
+    
+    escape_chance = 0.2 if elite else 0.4
+    strong_hit = enemy.strength // 2
+    enemy_heal = enemy.max_hp // 10
+    odds = BattleOdds()
+    states = {(player.hp, enemy.hp): 1.0}
+    
+    for turn in range(1, max_rounds + 1):
+        if not states:
+            break
+        next_states = {}
+        
+        def enemy_turn(player_hp: int, enemy_hp: int, p: float):
+            """Ход врага из resolve_battle_turn"""
+            for amount, q in counter:
+                left = player_hp - amount
+                if not elite:
+                    outcomes = ((left, enemy_hp, p * q),)
+                else:
+                    # 70% без способности, по 15% - сильный удар и исцеление
+                    outcomes = ((left, enemy_hp, p * q * 0.7),
+                                (left - strong_hit, enemy_hp, p * q * 0.15),
+                                (left, min(enemy.max_hp, enemy_hp + enemy_heal), p * q * 0.15))
+                for hp_after, enemy_after, w in outcomes:
+                    if hp_after <= 0:
+                        odds.death += w
+                    else:
+                        key = (hp_after, enemy_after)
+                        next_states[key] = next_states.get(key, 0.0) + w
+        
+        for (player_hp, enemy_hp), p in states.items():
+            if player_hp <= escape_below:
+                odds.escape += p * escape_chance
+                enemy_turn(player_hp, enemy_hp, p * (1 - escape_chance))
+            elif player_hp < heal_below and player_hp < player.max_hp:
+                enemy_turn(min(player.max_hp, player_hp + 30), enemy_hp, p)
+            else:
+                for amount, q in hit:
+                    if amount >= enemy_hp:
+                        odds.win += p * q
+                        odds.kill_rounds[turn] = odds.kill_rounds.get(turn, 0.0) + p * q
+                    else:
+                        enemy_turn(player_hp, enemy_hp - amount, p * q)
+        
+        # Отбрасываем исчезающе редкие состояния, иначе лечение тянет бой бесконечно
+        states = {key: p for key, p in next_states.items() if p > tolerance}
+    
+    odds.unresolved = max(0.0, 1.0 - odds.win - odds.death - odds.escape)
+    return odds
+
+
+def _battle_odds_grid(player: Hero, enemy: Combatant, hit: Tuple[Tuple[int, float], ...],
+                      counter: Tuple[Tuple[int, float], ...], escape_below: int, heal_below: int,
+                      max_rounds: int, tolerance: float) -> BattleOdds:
+    """Та же динамика, что в battle_odds, на массиве NumPy: строки - HP героя, столбцы - HP врага"""
+    elite = enemy.enemy_type == EnemyType.ELITE
+    escape_chance = 0.2 if elite else 0.4
+    player_top = max(player.hp, player.max_hp)
+    enemy_top = max(enemy.hp, enemy.max_hp)
+    
+    # Тактика зависит только от HP героя - доли строк под каждое действие
+    hp = np.arange(player_top + 1)
+    escape_rows = hp <= escape_below
+    heal_rows = ~escape_rows & (hp < heal_below) & (hp < player.max_hp)
+    attack_rows = ~escape_rows & ~heal_rows
+    heal_target = np.minimum(player.max_hp, hp + 30)
+    
+    if elite:
+        # 70% без способности, по 15% - сильный удар и исцеление (с потолком max_hp)
+        enemy_heal_target = np.minimum(enemy.max_hp, np.arange(enemy_top + 1) + enemy.max_hp // 10)
+        branches = ((0.7, 0, False), (0.15, enemy.strength // 2, False), (0.15, 0, True))
+    else:
+        branches = ((1.0, 0, False),)
+    
+    odds = BattleOdds()
+    states = np.zeros((player_top + 1, enemy_top + 1))
+    states[player.hp, enemy.hp] = 1.0
+    
+    for turn in range(1, max_rounds + 1):
+        # Действие героя
+        before_enemy = np.zeros_like(states)
+        if escape_rows.any():
+            fleeing = states[escape_rows]
+            odds.escape += fleeing.sum() * escape_chance
+            before_enemy[escape_rows] += fleeing * (1 - escape_chance)
+        if heal_rows.any():
+            np.add.at(before_enemy, heal_target[heal_rows], states[heal_rows])
+        attacking = np.where(attack_rows[:, None], states, 0.0)
+        killed = 0.0
+        for amount, q in hit:
+            killed += attacking[:, 1:amount + 1].sum() * q
+            if amount < enemy_top:
+                before_enemy[:, 1:enemy_top + 1 - amount] += attacking[:, amount + 1:] * q
+        if killed:
+            odds.win += killed
+            odds.kill_rounds[turn] = killed
+        
+        # Ход врага
+        states = np.zeros_like(before_enemy)
+        for weight, extra, heals in branches:
+            source = before_enemy
+            if heals:
+                source = np.zeros_like(before_enemy)
+                np.add.at(source.T, enemy_heal_target, before_enemy.T)
+            for amount, q in counter:
+                lost = amount + extra
+                odds.death += source[1:lost + 1].sum() * weight * q
+                if lost < player_top:
+                    states[1:player_top + 1 - lost] += source[lost + 1:] * (weight * q)
+        
+        if states.sum() < tolerance:
+            break
+    
+    odds.win, odds.death, odds.escape = float(odds.win), float(odds.death), float(odds.escape)
+    odds.kill_rounds = {turn: float(p) for turn, p in odds.kill_rounds.items()}
+    odds.unresolved = max(0.0, 1.0 - odds.win - odds.death - odds.escape)
+    return odds
+
+
+def _elite_attack_only_odds(player_hp: int, enemy_hp: int, enemy_max_hp: int, enemy_heal: int,
+                            strong_hit: int, hit: Tuple[Tuple[int, float], ...],
+                            counter: Tuple[Tuple[int, float], ...]) -> BattleOdds:
+    """Постоянная атака элитного врага
+    
+    Враг зависит от героя только через выбор способности, поэтому цепочка
+    ведется по парам (HP врага, число сильных ударов), а выживание героя
+    после k ответов берется из распределения суммы k ударов врага.
+    """
+    # Суммы урона k ответов, меньшие HP героя (остальное - гибель)
+    sums = [{0: 1.0}]
+    survived = {}
+    
+    def survival(hits: int, margin: int) -> float:
+        """Вероятность, что k ответов в сумме нанесли меньше margin урона"""
+        if (hits, margin) not in survived:
+            while len(sums) <= hits:
+                total = {}
+                for dealt, p in sums[-1].items():
+                    for amount, q in counter:
+                        if dealt + amount < player_hp:
+                            total[dealt + amount] = total.get(dealt + amount, 0.0) + p * q
+                sums.append(total)
+            survived[hits, margin] = sum(p for dealt, p in sums[hits].items() if dealt < margin)
+        return survived[hits, margin]
+    
+    # Раунд для врага с данным HP: шанс пасть от удара и исходы с учетом способности
+    rounds = {}
+    
+    def enemy_round(hp: int) -> Tuple[float, List[Tuple[int, int, float]]]:
+        if hp not in rounds:
+            killed = 0.0
+            outcomes = {}
+            for amount, q in hit:
+                if amount >= hp:
+                    killed += q
+                    continue
+                left = hp - amount
+                # 70% без способности, по 15% - сильный удар и исцеление (с потолком max_hp)
+                for key, w in (((left, 0), 0.7), ((left, 1), 0.15),
+                               ((min(enemy_max_hp, left + enemy_heal), 0), 0.15)):
+                    outcomes[key] = outcomes.get(key, 0.0) + q * w
+            rounds[hp] = killed, [(left, strong, w) for (left, strong), w in outcomes.items()]
+        return rounds[hp]
+    
+    odds = BattleOdds()
+    states = {(enemy_hp, 0): 1.0}
+    turn = 0
+    while states:
+        turn += 1
+        next_states = {}
+        for (hp, strong_hits), p in states.items():
+            alive = survival(turn - 1, player_hp - strong_hits * strong_hit)
+            if not alive:
+                continue
+            killed, outcomes = enemy_round(hp)
+            if killed:
+                # Победа: враг падает от удара, герой пережил все прошлые ответы
+                odds.win += p * killed * alive
+                odds.kill_rounds[turn] = odds.kill_rounds.get(turn, 0.0) + p * killed * alive
+            for left, strong, w in outcomes:
+                key = (left, strong_hits + strong)
+                next_states[key] = next_states.get(key, 0.0) + p * w
+        states = next_states
+    
+    # Каждый ответ врага отнимает хотя бы 1 HP, так что бой всегда заканчивается
+    odds.death = max(0.0, 1.0 - odds.win)
+    return odds
+
+
+def _attack_only_odds(player_hp: int, enemy_hp: int, hit: Tuple[Tuple[int, float], ...],
+                      counter: Tuple[Tuple[int, float], ...]) -> BattleOdds:
+    """Постоянная атака обычного врага: число ударов до победы и живучесть героя независимы"""
+    kills = _hits_to_kill(enemy_hp, hit)
+    survival = _survival(player_hp, counter, len(kills) - 1)
+    odds = BattleOdds()
+    alive_enemy = 1.0
+    for turn in range(1, len(kills)):
+        # Победа в раунде n: враг падает от n-го удара, герой пережил n-1 ответ
+        win = kills[turn] * survival[turn - 1]
+        if win:
+            odds.kill_rounds[turn] = win
+            odds.win += win
+        alive_enemy -= kills[turn]
+        # Гибель в раунде n: враг пережил n ударов, герой не пережил n-й ответ
+        odds.death += max(0.0, alive_enemy) * (survival[turn - 1] - survival[turn])
+    return odds
+
+
+# ========== ПАКЕТНЫЙ РАСЧЕТ БОЕВ ==========
+FIGHT_UNRESOLVED = 0
+FIGHT_WIN = 1
+FIGHT_DEATH = 2
+FIGHT_ESCAPE = 3
+
+
+@dataclass
+class FightBatch:
+    """Итоги пакета боев: код исхода (FIGHT_*), число раундов и HP героя в конце"""
+    outcome: Any
+    rounds: Any
+    player_hp: Any
+    
+    def rate(self, outcome: int) -> float:
+        """Доля боев с данным исходом"""
+        if isinstance(self.outcome, list):
+            return self.outcome.count(outcome) / len(self.outcome)
+        return float(np.mean(self.outcome == outcome))
+
+
+def _attack_rolls(rng, strength, target_armor, size: int):
+    """Векторный Hero.attack: 15% крит с удвоением, разброс -2..2, минус armor // 3"""
+    critical = rng.random(size) < 0.15
+    variance = rng.integers(-2, 3, size)
+    return np.maximum(1, strength * (1 + critical) + variance - target_armor // 3)
+
+
+def resolve_battles(player_hp, player_strength, player_armor, enemy_hp, enemy_strength, enemy_armor,
+                    elite=False, player_max_hp=None, enemy_max_hp=None, escape_below: int = 0,
+                    heal_below: int = 0, seed: Optional[int] = None, max_rounds: int = 1000) -> FightBatch:
+    """Пакет обычных боев по правилам resolve_battle_turn
+    
+    Характеристики - числа или последовательности одной длины (бой на
+    элемент); max_hp по умолчанию равны hp. Тактика героя - как в
+    battle_odds. С NumPy все бои идут раунд за раундом одновременно, броски
+    крита и разброса делаются массивами; без NumPy бои разыгрываются по
+    одному через resolve_battle_turn.
+    """
+    if player_max_hp is None:
+        player_max_hp = player_hp
+    if enemy_max_hp is None:
+        enemy_max_hp = enemy_hp
+    stats = (player_hp, player_max_hp, player_strength, player_armor,
+             enemy_hp, enemy_max_hp, enemy_strength, enemy_armor, elite)
+    if np is None:
+        return _resolve_battles_scalar(stats, escape_below, heal_below, seed, max_rounds)
+    return _resolve_battles_numpy(stats, escape_below, heal_below, seed, max_rounds)
+
+
+def _resolve_battles_scalar(stats: tuple, escape_below: int, heal_below: int, seed: Optional[int],
+                            max_rounds: int) -> FightBatch:
+    """Бои по одному через Hero и resolve_battle_turn"""
+    count = max((len(value) for value in stats if hasattr(value, "__len__")), default=1)
+    columns = [value if hasattr(value, "__len__") else [value] * count for value in stats]
+    rng = random.Random(seed)
+    batch = FightBatch([], [], [])
+    
+    for hp, max_hp, strength, armor, foe_hp, foe_max_hp, foe_strength, foe_armor, is_elite in zip(*columns):
+        player = Hero("Герой", 0, 0, '@', hp, strength, armor, rng=rng)
+        player.max_hp = max_hp
+        enemy = Fighter("Враг", 0, 0, 'E', foe_hp, foe_strength, foe_armor, rng=rng)
+        enemy.max_hp = foe_max_hp
+        enemy.enemy_type = EnemyType.ELITE if is_elite else EnemyType.NORMAL
+        
+        outcome, turn = FIGHT_UNRESOLVED, 0
+        while turn < max_rounds:
+            turn += 1
+            if player.hp <= escape_below:
+                choice = 3
+            elif player.hp < heal_below and player.hp < player.max_hp:
+                choice = 2
+            else:
+                choice = 1
+            result = resolve_battle_turn(player, enemy, choice)
+            if result.escaped:
+                outcome = FIGHT_ESCAPE
+            elif not enemy.is_alive:
+                outcome = FIGHT_WIN
+            elif not player.is_alive:
+                outcome = FIGHT_DEATH
+            else:
+                continue
+            break
+        
+        batch.outcome.append(outcome)
+        batch.rounds.append(turn)
+        batch.player_hp.append(player.hp)
+    return batch
+
+
+def _resolve_battles_numpy(stats: tuple, escape_below: int, heal_below: int, seed: Optional[int],
+                           max_rounds: int) -> FightBatch:
+    """Все бои раунд за раундом на массивах NumPy"""
+    columns = [np.ravel(column) for column in np.broadcast_arrays(*(np.asarray(value) for value in stats))]
+    (player_hp, player_max_hp, player_strength, player_armor,
+     enemy_hp, enemy_max_hp, enemy_strength, enemy_armor) = (column.astype(np.int64) for column in columns[:8])
+    elite = columns[8].astype(bool)
+    count = player_hp.size
+    
+    rng = np.random.default_rng(seed)
+    outcome = np.full(count, FIGHT_UNRESOLVED, dtype=np.int8)
+    rounds = np.full(count, max_rounds, dtype=np.int32)
+    final_hp = player_hp.copy()
+    
+    # Индексы еще идущих боев; состояние храним только для них
+    live = np.arange(count)
+    for turn in range(1, max_rounds + 1):
+        if live.size == 0:
+            break
+        size = live.size
+        
+        fleeing = player_hp <= escape_below
+        healing = ~fleeing & (player_hp < heal_below) & (player_hp < player_max_hp)
+        attacking = ~fleeing & ~healing
+        
+        damage = _attack_rolls(rng, player_strength, enemy_armor, size)
+        enemy_hp = np.where(attacking, enemy_hp - damage, enemy_hp)
+        player_hp = np.where(healing, np.minimum(player_max_hp, player_hp + 30), player_hp)
+        escaped = fleeing & (rng.random(size) < np.where(elite, 0.2, 0.4))
+        won = attacking & (enemy_hp <= 0)
+        
+        # Ход врага во всех боях, где враг жив и герой не сбежал
+        answering = ~escaped & ~won
+        damage = _attack_rolls(rng, enemy_strength, player_armor, size)
+        player_hp = np.where(answering, player_hp - damage, player_hp)
+        ability = answering & elite & (rng.random(size) < 0.3)
+        strong = ability & (rng.random(size) < 0.5)
+        player_hp = np.where(strong, player_hp - enemy_strength // 2, player_hp)
+        enemy_hp = np.where(ability & ~strong, np.minimum(enemy_max_hp, enemy_hp + enemy_max_hp // 10), enemy_hp)
+        died = answering & (player_hp <= 0)
+        
+        finished = escaped | won | died
+        if finished.any():
+            done = live[finished]
+            outcome[done] = np.select([won[finished], escaped[finished]], [FIGHT_WIN, FIGHT_ESCAPE], FIGHT_DEATH)
+            rounds[done] = turn
+            final_hp[done] = player_hp[finished]
+            keep = ~finished
+            live = live[keep]
+            (player_hp, player_max_hp, player_strength, player_armor, enemy_hp, enemy_max_hp,
+             enemy_strength, enemy_armor, elite) = (a[keep] for a in (
+                player_hp, player_max_hp, player_strength, player_armor, enemy_hp, enemy_max_hp,
+                enemy_strength, enemy_armor, elite))
+    
+    final_hp[live] = player_hp
+    return FightBatch(outcome, rounds, final_hp)
+
+
+def resolve_boss_battles(player_hp, player_strength, player_armor, boss_hp, boss_strength, boss_armor,
+                         boss_type, player_max_hp=None, boss_max_hp=None, heal_below: int = 0,
+                         max_heal_turn: int = 100, seed: Optional[int] = None,
+                         max_rounds: int = 1000) -> FightBatch:
+    """Пакет боев с боссами по правилам BossFight
+    
+    Характеристики - как в resolve_battles, boss_type - "dragon", "lich"
+    или "titan" (или последовательность). Герой атакует, а при HP ниже
+    heal_below до хода max_heal_turn пьет зелье (как GreedyPolicy). Фазы, особые способности и слуги лича
+    учитываются; с NumPy все бои идут одновременно, без него - по одному
+    через BossFight.
+    """
+    if player_max_hp is None:
+        player_max_hp = player_hp
+    if boss_max_hp is None:
+        boss_max_hp = boss_hp
+    stats = (player_hp, player_max_hp, player_strength, player_armor,
+             boss_hp, boss_max_hp, boss_strength, boss_armor, boss_type)
+    if np is None:
+        return _resolve_boss_battles_scalar(stats, heal_below, max_heal_turn, seed, max_rounds)
+    return _resolve_boss_battles_numpy(stats, heal_below, max_heal_turn, seed, max_rounds)
+
+
+def _resolve_boss_battles_scalar(stats: tuple, heal_below: int, max_heal_turn: int, seed: Optional[int],
+                                 max_rounds: int) -> FightBatch:
+    """Бои с боссами по одному через Hero и BossFight"""
+    count = max((len(value) for value in stats if not isinstance(value, (int, str))), default=1)
+    columns = [[value] * count if isinstance(value, (int, str)) else value for value in stats]
+    rng = random.Random(seed)
+    batch = FightBatch([], [], [])
+    
+    for hp, max_hp, strength, armor, foe_hp, foe_max_hp, foe_strength, foe_armor, kind in zip(*columns):
+        player = Hero("Герой", 0, 0, '@', hp, strength, armor, rng=rng)
+        player.max_hp = max_hp
+        boss = Boss("Босс", 0, 0, 'B', foe_hp, foe_strength, foe_armor, rng=rng, boss_type=kind)
+        boss.max_hp = foe_max_hp
+        
+        fight = BossFight(player, boss)
+        while not fight.is_over and fight.turn < max_rounds:
+            fight.next_turn()
+            healing = player.hp < heal_below and player.hp < player.max_hp and fight.turn <= max_heal_turn
+            fight.act(2 if healing else 1)
+        
+        if not boss.is_alive:
+            batch.outcome.append(FIGHT_WIN)
+        elif not player.is_alive:
+            batch.outcome.append(FIGHT_DEATH)
+        else:
+            batch.outcome.append(FIGHT_UNRESOLVED)
+        batch.rounds.append(fight.turn)
+        batch.player_hp.append(player.hp)
+    return batch
+
+
+def _resolve_boss_battles_numpy(stats: tuple, heal_below: int, max_heal_turn: int, seed: Optional[int],
+                                max_rounds: int) -> FightBatch:
+    """Все бои с боссами раунд за раундом на массивах NumPy"""
+    columns = [np.ravel(column) for column in np.broadcast_arrays(*(np.asarray(value) for value in stats))]
+    (player_hp, player_max_hp, player_strength, player_armor,
+     boss_hp, boss_max_hp, boss_strength, boss_armor) = (column.astype(np.int64) for column in columns[:8])
+    dragon = columns[8] == "dragon"
+    lich = columns[8] == "lich"
+    count = player_hp.size
+    
+    rng = np.random.default_rng(seed)
+    outcome = np.full(count, FIGHT_UNRESOLVED, dtype=np.int8)
+    rounds = np.full(count, max_rounds, dtype=np.int32)
+    final_hp = player_hp.copy()
+    phase = np.ones(count, dtype=np.int64)
+    minions = np.zeros(count, dtype=np.int64)
+    minion_strength = SKELETON_STATS[3]
+    
+    live = np.arange(count)
+    for turn in range(1, max_rounds + 1):
+        if live.size == 0:
+            break
+        
+        # Переходы фаз в начале хода, как в BossFight.next_turn
+        boss_hp_percent = boss_hp / boss_max_hp
+        enraged = (phase == 1) & (boss_hp_percent > 0.3) & (boss_hp_percent <= 0.6)
+        final = (phase == 2) & (boss_hp_percent <= 0.3)
+        boss_strength = np.where(enraged, (boss_strength * 1.3).astype(np.int64), boss_strength)
+        boss_strength = np.where(final, (boss_strength * 1.5).astype(np.int64), boss_strength)
+        boss_armor = np.where(final, (boss_armor * 0.7).astype(np.int64), boss_armor)
+        phase = phase + enraged + final
+        
+        healing = (player_hp < heal_below) & (player_hp < player_max_hp) & (turn <= max_heal_turn)
+        damage = _attack_rolls(rng, player_strength, boss_armor, live.size)
+        boss_hp = np.where(healing, boss_hp, boss_hp - damage)
+        player_hp = np.where(healing, np.minimum(player_max_hp, player_hp + 50), player_hp)
+        won = boss_hp <= 0
+        answering = ~won
+        
+        # Ход босса: каждый 3-й ход особая способность, иначе обычный удар
+        if turn % 3 == 0:
+            minions = minions + (answering & lich & (minions < MAX_MINIONS))
+            damage = np.select([dragon, lich], [boss_strength * 2, boss_strength // 2], boss_strength * 3)
+            player_strength = np.where(answering & lich, np.maximum(1, player_strength - 2), player_strength)
+        else:
+            damage = np.maximum(1, boss_strength - player_armor // 3)
+        damage = damage + minions * np.maximum(1, minion_strength - player_armor // 3)
+        player_hp = np.where(answering, player_hp - damage, player_hp)
+        died = answering & (player_hp <= 0)
+        
+        finished = won | died
+        if finished.any():
+            done = live[finished]
+            outcome[done] = np.where(won[finished], FIGHT_WIN, FIGHT_DEATH)
+            rounds[done] = turn
+            final_hp[done] = player_hp[finished]
+            keep = ~finished
+            live = live[keep]
+            (player_hp, player_max_hp, player_strength, player_armor, boss_hp, boss_max_hp,
+             boss_strength, boss_armor, dragon, lich, phase, minions) = (a[keep] for a in (
+                player_hp, player_max_hp, player_strength, player_armor, boss_hp, boss_max_hp,
+                boss_strength, boss_armor, dragon, lich, phase, minions))
+    
+    final_hp[live] = player_hp
+    return FightBatch(outcome, rounds, final_hp)
+
+
+def evaluate_bosses(player: Hero, difficulty: int, level: int, fights: int = 10000,
+                    heal_below: int = 0, max_heal_turn: int = 100, seed: Optional[int] = None) -> FightBatch:
+    """Бои героя с боссами, которых create_boss фабрики сложности создает на уровне level"""
+    rng = random.Random(seed)
+    factory_class = {1: EasyLevelFactory, 2: NormalLevelFactory}.get(difficulty, HardLevelFactory)
+    factory = factory_class(level, rng)
+    bosses = [factory.create_boss(0, 0) for _ in range(fights)]
+    return resolve_boss_battles(player.hp, player.strength, player.armor,
+                                [boss.hp for boss in bosses], [boss.strength for boss in bosses],
+                                [boss.armor for boss in bosses], [boss.boss_type for boss in bosses],
+                                player_max_hp=player.max_hp, heal_below=heal_below,
+                                max_heal_turn=max_heal_turn, seed=seed)
+
+
+def pick_treasure(rng: Optional[random.Random] = None) -> Treasure:
+    """Случайный выбор сокровища, найденного героем
+    
+    Игра берет сокровища из NORMAL_TREASURES при любой сложности; таблицы
+    EASY_TREASURES и HARD_TREASURES используют только фабрики сокровищ
+    EasyTreasureFactory и HardTreasureFactory.
+    """
+    return NORMAL_TREASURES.pick(rng if rng is not None else random)
+
+
+def find_treasure(player: Hero):
+    """Поиск сокровища"""
+    treasure = pick_treasure(player.rng)
+    
+    print(f"\n{'🎁' * 10}")
+    print(f"ВЫ НАШЛИ СОКРОВИЩЕ!")
+    print(f"{'🎁' * 10}")
+    print(f"\nНазвание: {treasure.name}")
+    print(f"Эффект: {treasure.description}")
+    
+    if treasure.teleport:
+        console.input("\nНажмите Enter, чтобы активировать свиток...")
+        return "teleport"
+    else:
+        apply_treasure(player, treasure)
+        print(f"\nЭффект применен!")
+        console.input("Нажмите Enter, чтобы продолжить...")
+        return None
+
+
+def plan_travel(player: Hero, game_map: GameMap) -> deque:
+    """Команда T: выбор цели и маршрут к ней в виде команд движения
+    
+    Цель - ближайшая по пути клетка выбранного вида; маршрут прокладывается
+    A* в обход известных ловушек. Путь прерывается боем, ловушкой или
+    сокровищем. В тумане войны цели выбираются только среди видимых и
+    исследованных клеток.
+    """
+    print("\nКуда идти? 1 - к ближайшему сокровищу, 2 - к ближайшему врагу, 3 - к боссу")
+    choice = console.input("Ваш выбор (Enter - отмена): ").strip()
+    if choice == '1':
+        targets = list(game_map.treasures)
+    elif choice == '2':
+        targets = [cell for cell in game_map.enemy_cells if game_map.get_enemy_at(*cell)]
+    elif choice == '3' and game_map.boss is not None and game_map.boss.is_alive:
+        targets = [(game_map.boss.x, game_map.boss.y)]
+    else:
+        return deque()
+    
+    # В тумане войны цели - только то, что герой видит или уже исследовал
+    fov = game_map.fov
+    if fov is not None:
+        fov.update(player.x, player.y)
+        targets = [(x, y) for x, y in targets if fov.is_visible(x, y) or fov.is_explored(x, y)]
+    
+    start = (player.x, player.y)
+    goal = game_map.paths.nearest(player.x, player.y, targets)
+    path = game_map.paths.find_path(start, goal) if goal is not None else []
+    if not path:
+        print("\nНет пути к такой цели!")
+        console.input("Нажмите Enter, чтобы продолжить...")
+        return deque()
+    
+    commands = {delta: command for command, delta in MOVE_DELTAS.items()}
+    steps = deque()
+    for x, y in path:
+        steps.append(commands[(x - start[0], y - start[1])])
+        start = (x, y)
+    return steps
+
+
+def show_inventory(player: Hero):
+    """Показать инвентарь игрока"""
+    console.clear()
+    
+    print("╔" + "═" * 50 + "╗")
+    print(f"║{'ИНВЕНТАРЬ':^50}║")
+    print("╚" + "═" * 50 + "╝")
+    
+    if not player.inventory:
+        print("\nВаш инвентарь пуст.")
+    else:
+        print(f"\nПредметы ({len(player.inventory)}):")
+        for i, item in enumerate(player.inventory, 1):
+            print(f"  {i}. {item}")
+    
+    print(f"\nВаша статистика:")
+    print(f"  Уровень: {player.level}")
+    print(f"  Опыт: {player.exp}/{player.next_level_exp}")
+    print(f"  Здоровье: {player.hp}/{player.max_hp}")
+    print(f"  Сила: {player.strength}")
+    print(f"  Защита: {player.armor}")
+    
+    console.input("\nНажмите Enter, чтобы вернуться...")
+
+
+# ========== ПОДГОТОВКА СЛЕДУЮЩЕГО УРОВНЯ ==========
+def level_rng(run_seed: int, level: int) -> random.Random:
+    """Генератор уровня: зависит только от зерна партии и номера уровня"""
+    return random.Random(f"{run_seed}:{level}")
+
+
+class LevelPrefetcher:
+    """Строит карту следующего уровня в фоновом потоке
+    
+    Пока игрок проходит уровень N, карта уровня N+1 генерируется заранее и
+    на переходе отдается сразу. Каждый уровень строится своим генератором
+    level_rng, поэтому карта не зависит от того, была ли она подготовлена
+    заранее. Неиспользованная карта отбрасывается в close(). С cache
+    (LevelCache) уровни берутся из кэша на диске и пополняют его.
+    """
+    
+    def __init__(self, difficulty: int, run_seed: int, cache: Optional['LevelCache'] = None, **map_options):
+        self.difficulty = difficulty
+        self.run_seed = run_seed
+        self.cache = cache
+        self.map_options = map_options
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="level-prefetch")
+        self._pending = {}
+    
+    def build(self, level: int) -> GameMap:
+        """Синхронная генерация карты уровня"""
+        if self.cache is not None:
+            return self.cache.get(self.run_seed, level, self.difficulty, **self.map_options)
+        return GameMap(level=level, difficulty=self.difficulty, rng=level_rng(self.run_seed, level),
+                       **self.map_options)
+    
+    def prefetch(self, level: int):
+        """Начать генерацию уровня в фоне"""
+        if level not in self._pending:
+            self._pending[level] = self._executor.submit(self.build, level)
+    
+    def take(self, level: int) -> GameMap:
+        """Карта уровня: готовая из фона или построенная сейчас"""
+        future = self._pending.pop(level, None)
+        if future is None:
+            return self.build(level)
+        return future.result()
+    
+    def close(self):
+        """Отменить ожидающие задачи и отпустить поток"""
+        for future in self._pending.values():
+            future.cancel()
+        self._pending.clear()
+        self._executor.shutdown(wait=False)
+    
+    def __enter__(self) -> 'LevelPrefetcher':
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# ========== СОХРАНЕНИЕ ИГРЫ ==========
+SAVE_FILE = "savegame.rpgs"
+SAVE_MAGIC = b"RPGS"
+# 2: время уровня для очереди ходов; 3: исследованные клетки тумана войны;
+# 4: включены ли ходы врагов. Старые версии читаются: время нулевое, тумана
+# нет, режим ходов врагов неизвестен
+SAVE_VERSION = 4
+
+_ENEMY_TYPES = list(EnemyType)
+_BOSS_FLAGS = ("fire_resistant", "undead", "stone_skin", "flying", "magic_immune")
+# name, symbol (индексы в таблице строк), x, y, hp, max_hp, strength, armor, тип, exp_reward
+_ENEMY_RECORD = struct.Struct("<HHiiiiiiBi")
+_ROOM_RECORD = struct.Struct("<iiiiBB")
+_CELL_RECORD = struct.Struct("<iiH")
+
+
+class SaveFormatError(ValueError):
+    """Файл не является сохранением игры или его версия не поддерживается"""
+    pass
+
+
+@dataclass
+class GameState:
+    """Состояние партии между ходами: все, что нужно для продолжения игры"""
+    player: Hero
+    game_map: GameMap
+    current_level: int
+    run_seed: int
+    enemy_turns: Optional[bool] = None  # Режим ходов врагов партии; None - старое сохранение без него
+
+
+class _SnapshotWriter:
+    """Последовательная запись двоичного снимка"""
+    
+    def __init__(self):
+        self.parts = []
+    
+    def pack(self, fmt: str, *values):
+        self.parts.append(struct.pack(fmt, *values))
+    
+    def text(self, value: str):
+        data = value.encode("utf-8")
+        self.pack("<H", len(data))
+        self.parts.append(data)
+    
+    def blob(self, data: bytes):
+        self.pack("<I", len(data))
+        self.parts.append(data)
+    
+    def rng_state(self, rng):
+        version, internal, gauss_next = rng.getstate()
+        self.pack("<B625IBd", version, *internal, gauss_next is not None, gauss_next or 0.0)
+    
+    def getvalue(self) -> bytes:
+        return b"".join(self.parts)
+
+
+class _SnapshotReader:
+    """Последовательное чтение двоичного снимка"""
+    
+    def __init__(self, data: bytes):
+        self.data = memoryview(data)
+        self.offset = 0
+    
+    def unpack(self, fmt: str) -> tuple:
+        values = struct.unpack_from(fmt, self.data, self.offset)
+        self.offset += struct.calcsize(fmt)
+        return values
+    
+    def take(self, size: int) -> memoryview:
+        chunk = self.data[self.offset:self.offset + size]
+        if len(chunk) != size:
+            raise SaveFormatError("Сохранение повреждено: неожиданный конец файла")
+        self.offset += size
+        return chunk
+    
+    def text(self) -> str:
+        size, = self.unpack("<H")
+        return bytes(self.take(size)).decode("utf-8")
+    
+    def blob(self) -> memoryview:
+        size, = self.unpack("<I")
+        return self.take(size)
+    
+    def rng_state(self) -> random.Random:
+        values = self.unpack("<B625IBd")
+        rng = random.Random()
+        rng.setstate((values[0], values[1:626], values[627] if values[626] else None))
+        return rng
+
+
+def _write_combatant(out: _SnapshotWriter, unit: Combatant):
+    out.text(unit.name)
+    out.text(unit.symbol)
+    out.pack("<iiiiiiB", unit.x, unit.y, unit.hp, unit.max_hp, unit.strength, unit.armor,
+             _ENEMY_TYPES.index(unit.enemy_type))
+
+
+def _read_combatant(data: _SnapshotReader, rng, unit_class: type = Fighter) -> Combatant:
+    name, symbol = data.text(), data.text()
+    x, y, hp, max_hp, strength, armor, enemy_type = data.unpack("<iiiiiiB")
+    unit = unit_class(name, x, y, symbol, hp, strength, armor, rng=rng)
+    unit.max_hp = max_hp
+    unit.enemy_type = _ENEMY_TYPES[enemy_type]
+    return unit
+
+
+def _write_player(out: _SnapshotWriter, player: Hero):
+    _write_combatant(out, player)
+    out.pack("<iii", player.level, player.exp, player.next_level_exp)
+    out.pack("<B", getattr(player, "difficulty", 2))
+    multipliers = player.difficulty_multipliers
+    out.pack("<ddd", multipliers["enemy"], multipliers["heal"], multipliers["treasure"])
+    # Временные бонусы появляются у героя только после сокровища
+    for bonus in ("temp_strength_bonus", "temp_armor_bonus"):
+        out.pack("<Bi", hasattr(player, bonus), getattr(player, bonus, 0))
+    out.pack("<H", len(player.inventory))
+    for item in player.inventory:
+        out.text(item)
+
+
+def _read_player(data: _SnapshotReader, rng) -> Hero:
+    player = _read_combatant(data, rng, Hero)
+    player.level, player.exp, player.next_level_exp = data.unpack("<iii")
+    player.difficulty, = data.unpack("<B")
+    enemy_mult, heal_mult, treasure_mult = data.unpack("<ddd")
+    player.difficulty_multipliers = {"enemy": enemy_mult, "heal": heal_mult, "treasure": treasure_mult}
+    for bonus in ("temp_strength_bonus", "temp_armor_bonus"):
+        present, value = data.unpack("<Bi")
+        if present:
+            setattr(player, bonus, value)
+    count, = data.unpack("<H")
+    player.inventory = [data.text() for _ in range(count)]
+    return player
+
+
+def _write_boss(out: _SnapshotWriter, boss: Boss):
+    _write_combatant(out, boss)
+    out.text(boss.boss_type)
+    out.pack("<iBd", boss.exp_reward, boss.enraged, boss.stun_chance)
+    out.pack("<B", sum(1 << i for i, flag in enumerate(_BOSS_FLAGS) if getattr(boss, flag)))
+    out.pack("<B", len(boss.abilities))
+    for ability in boss.abilities:
+        out.text(ability)
+    out.pack("<B", len(boss.minions))
+    for minion in boss.minions:
+        _write_combatant(out, minion)
+
+
+def _read_boss(data: _SnapshotReader, rng) -> Boss:
+    boss = _read_combatant(data, rng, Boss)
+    boss.boss_type = data.text()
+    boss.exp_reward, enraged, boss.stun_chance = data.unpack("<iBd")
+    boss.enraged = bool(enraged)
+    flags, = data.unpack("<B")
+    for i, flag in enumerate(_BOSS_FLAGS):
+        setattr(boss, flag, bool(flags & (1 << i)))
+    count, = data.unpack("<B")
+    boss.abilities = [data.text() for _ in range(count)]
+    count, = data.unpack("<B")
+    boss.minions = [_read_combatant(data, rng) for _ in range(count)]
+    return boss
+
+
+def _write_cells(out: _SnapshotWriter, cells: Dict[Tuple[int, int], int]):
+    out.pack("<I", len(cells))
+    out.parts.extend(_CELL_RECORD.pack(x, y, count) for (x, y), count in cells.items())
+
+
+def _read_cells(data: _SnapshotReader) -> Dict[Tuple[int, int], int]:
+    count, = data.unpack("<I")
+    block = data.take(count * _CELL_RECORD.size)
+    return {(x, y): n for x, y, n in _CELL_RECORD.iter_unpack(block)}
+
+
+def _room_records(game_map: GameMap) -> List[bytes]:
+    return [_ROOM_RECORD.pack(room.x, room.y, room.w, room.h, room.has_treasure, room.has_trap)
+            for room in game_map.rooms]
+
+
+def _add_rooms(game_map: GameMap, block: memoryview):
+    for x, y, w, h, has_treasure, has_trap in _ROOM_RECORD.iter_unpack(block):
+        room = Room(x, y, w, h, rng=game_map.rng)
+        room.has_treasure, room.has_trap = bool(has_treasure), bool(has_trap)
+        game_map.rooms.append(room)
+
+
+def _enemy_records(game_map: GameMap) -> Tuple[List[str], List[bytes]]:
+    """Живые враги карты записями _ENEMY_RECORD и таблица их имен и символов"""
+    # Павшие враги уже убраны из индекса клеток и в снимок не попадают.
+    # Имена и символы врагов повторяются - храним их в таблице строк
+    strings = {}
+    records = []
+    for enemy in game_map.enemies:
+        if not enemy.is_alive:
+            continue
+        name = strings.setdefault(enemy.name, len(strings))
+        symbol = strings.setdefault(enemy.symbol, len(strings))
+        records.append(_ENEMY_RECORD.pack(
+            name, symbol, enemy.x, enemy.y, enemy.hp, enemy.max_hp, enemy.strength, enemy.armor,
+            _ENEMY_TYPES.index(enemy.enemy_type), enemy.exp_reward))
+    return list(strings), records
+
+
+def _add_enemies(game_map: GameMap, strings: List[str], block: memoryview):
+    """Враги из записей _ENEMY_RECORD на карту"""
+    # Враги снова получают общие шаблоны фабрики уровня; если характеристики
+    # не совпали (баланс поменялся), шаблон заводится по снимку
+    templates = {(template.name, template.symbol, template.max_hp, template.strength, template.armor,
+                  template.exp_reward, template.enemy_type): template
+                 for pair in game_map.character_factory.enemy_templates() for template in pair}
+    for record in _ENEMY_RECORD.iter_unpack(block):
+        name, symbol, x, y, hp, max_hp, strength, armor, enemy_type, exp_reward = record
+        key = (strings[name], strings[symbol], max_hp, strength, armor, exp_reward, _ENEMY_TYPES[enemy_type])
+        template = templates.get(key)
+        if template is None:
+            # Стартовое HP в снимке не хранится
+            template = templates[key] = EnemyTemplate(key[0], key[1], max_hp, *key[2:])
+        enemy = Enemy(template, x, y, rng=game_map.rng)
+        enemy.hp = hp
+        game_map.add_enemy(enemy)
+
+
+def _write_map(out: _SnapshotWriter, game_map: GameMap):
+    out.pack("<HBii", game_map.level, game_map.difficulty, game_map.width, game_map.height)
+    out.text(game_map.grid_kind)
+    out.blob(zlib.compress(game_map.grid.to_bytes(), 1))
+    
+    out.pack("<I", len(game_map.rooms))
+    out.parts.extend(_room_records(game_map))
+    
+    strings, records = _enemy_records(game_map)
+    out.pack("<H", len(strings))
+    for value in strings:
+        out.text(value)
+    out.pack("<I", len(records))
+    out.parts.extend(records)
+    
+    out.pack("<B", game_map.boss is not None)
+    if game_map.boss is not None:
+        _write_boss(out, game_map.boss)
+    
+    _write_cells(out, game_map.treasures)
+    _write_cells(out, game_map.traps)
+    out.rng_state(game_map.rng)
+
+
+def _read_map(data: _SnapshotReader) -> GameMap:
+    level, difficulty, width, height = data.unpack("<HBii")
+    grid_kind = data.text()
+    grid = zlib.decompress(data.blob())
+    
+    # Генератор карты читается в конце снимка - создаем его заранее и
+    # восстанавливаем состояние, когда до него дойдем
+    rng = random.Random()
+    game_map = GameMap(level, difficulty, rng=rng, grid_kind=grid_kind, width=width, height=height,
+                       generate=False)
+    game_map.grid.load_bytes(grid)
+    
+    count, = data.unpack("<I")
+    _add_rooms(game_map, data.take(count * _ROOM_RECORD.size))
+    
+    count, = data.unpack("<H")
+    strings = [data.text() for _ in range(count)]
+    count, = data.unpack("<I")
+    _add_enemies(game_map, strings, data.take(count * _ENEMY_RECORD.size))
+    
+    has_boss, = data.unpack("<B")
+    if has_boss:
+        game_map.boss = _read_boss(data, rng)
+    
+    game_map.treasures = _read_cells(data)
+    game_map.traps = _read_cells(data)
+    rng.setstate(data.rng_state().getstate())
+    return game_map
+
+
+def encode_game_state(state: GameState) -> bytes:
+    """Двоичный снимок партии"""
+    out = _SnapshotWriter()
+    out.parts.append(SAVE_MAGIC)
+    out.pack("<HHQ", SAVE_VERSION, state.current_level, state.run_seed)
+    _write_player(out, state.player)
+    # Герой и карта могут делить один генератор - тогда сохраняем его один раз
+    shared_rng = state.player.rng is state.game_map.rng
+    out.pack("<B", shared_rng)
+    if not shared_rng:
+        out.rng_state(state.player.rng)
+    _write_map(out, state.game_map)
+    out.pack("<QB", state.game_map.clock, bool(state.enemy_turns))
+    fov = state.game_map.fov
+    out.pack("<B", fov is not None)
+    if fov is not None:
+        out.pack("<H", fov.radius)
+        out.blob(zlib.compress(bytes(fov.explored), 1))
+    return out.getvalue()
+
+
+def decode_game_state(data: bytes) -> GameState:
+    """Восстановление партии из снимка encode_game_state"""
+    if data[:len(SAVE_MAGIC)] != SAVE_MAGIC:
+        raise SaveFormatError("Файл не является сохранением игры")
+    reader = _SnapshotReader(data)
+    reader.take(len(SAVE_MAGIC))
+    try:
+        version, current_level, run_seed = reader.unpack("<HHQ")
+        if not 1 <= version <= SAVE_VERSION:
+            raise SaveFormatError(f"Неподдерживаемая версия сохранения: {version}")
+        player = _read_player(reader, None)
+        shared_rng, = reader.unpack("<B")
+        player_rng = None if shared_rng else reader.rng_state()
+        game_map = _read_map(reader)
+        enemy_turns = None
+        if version >= 4:
+            game_map.clock, enemy_turns = reader.unpack("<QB")
+            enemy_turns = bool(enemy_turns)
+        elif version >= 2:
+            game_map.clock, = reader.unpack("<Q")
+        if version >= 3:
+            has_fov, = reader.unpack("<B")
+            if has_fov:
+                radius, = reader.unpack("<H")
+                game_map.fov = FieldOfView(game_map, radius)
+                explored = zlib.decompress(reader.blob())
+                if len(explored) != len(game_map.fov.explored):
+                    raise SaveFormatError("Сохранение повреждено: не совпадает размер карты тумана войны")
+                game_map.fov.explored[:] = explored
+    except (struct.error, zlib.error, UnicodeDecodeError, IndexError) as error:
+        raise SaveFormatError(f"Сохранение повреждено: {error}") from error
+    
+    player.rng = game_map.rng if shared_rng else player_rng
+    return GameState(player, game_map, current_level, run_seed, enemy_turns)
+
+
+def save_game(path: str, state: GameState):
+    """Атомарная запись сохранения: файл либо старый, либо новый целиком"""
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as file:
+        file.write(encode_game_state(state))
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, path)
+
+
+def load_game(path: str) -> GameState:
+    """Загрузка сохранения"""
+    with open(path, "rb") as file:
+        return decode_game_state(file.read())
+
+
+# ========== КЭШ УРОВНЕЙ ==========
+LEVEL_CACHE_MAGIC = b"RPGL"
+LEVEL_CACHE_VERSION = 1
+LEVEL_CACHE_SIZE = 64 * 2 ** 20  # Предел размера кэша уровней на диске по умолчанию, байт
+
+# Магия, версия, зерно партии, уровень, сложность, ширина, высота, число
+# комнат, врагов, сокровищ, ловушек и размер хвоста со строками и боссом
+_LEVEL_HEADER = struct.Struct("<4sHQHBiiIIIII")
+_RNG_STATE = struct.Struct("<B625IBd")
+
+
+def _encode_level(run_seed: int, game_map: GameMap) -> bytes:
+    """Уровень в фиксированной раскладке файла кэша (см. LevelCache)"""
+    strings, enemies = _enemy_records(game_map)
+    tail = _SnapshotWriter()
+    tail.pack("<H", len(strings))
+    for value in strings:
+        tail.text(value)
+    tail.pack("<B", game_map.boss is not None)
+    if game_map.boss is not None:
+        _write_boss(tail, game_map.boss)
+    tail = tail.getvalue()
+    
+    version, internal, gauss_next = game_map.rng.getstate()
+    parts = [_LEVEL_HEADER.pack(LEVEL_CACHE_MAGIC, LEVEL_CACHE_VERSION, run_seed, game_map.level,
+                                game_map.difficulty, game_map.width, game_map.height, len(game_map.rooms),
+                                len(enemies), len(game_map.treasures), len(game_map.traps), len(tail)),
+             game_map.grid.to_bytes()]
+    parts.extend(_room_records(game_map))
+    parts.extend(enemies)
+    parts.extend(_CELL_RECORD.pack(x, y, count) for (x, y), count in game_map.treasures.items())
+    parts.extend(_CELL_RECORD.pack(x, y, count) for (x, y), count in game_map.traps.items())
+    parts.append(_RNG_STATE.pack(version, *internal, gauss_next is not None, gauss_next or 0.0))
+    parts.append(tail)
+    return b"".join(parts)
+
+
+def _decode_level(data: memoryview, **map_options) -> Tuple[int, GameMap]:
+    """Зерно партии и карта из файла кэша"""
+    if len(data) < _LEVEL_HEADER.size:
+        raise SaveFormatError("Файл кэша уровня поврежден: неожиданный конец файла")
+    (magic, version, run_seed, level, difficulty, width, height,
+     rooms, enemies, treasures, traps, tail_size) = _LEVEL_HEADER.unpack_from(data)
+    if magic != LEVEL_CACHE_MAGIC:
+        raise SaveFormatError("Файл не является уровнем из кэша")
+    if version != LEVEL_CACHE_VERSION:
+        raise SaveFormatError(f"Неподдерживаемая версия кэша уровней: {version}")
+    
+    # Смещения разделов следуют из заголовка
+    sizes = (width * height, rooms * _ROOM_RECORD.size, enemies * _ENEMY_RECORD.size,
+             treasures * _CELL_RECORD.size, traps * _CELL_RECORD.size, _RNG_STATE.size, tail_size)
+    if _LEVEL_HEADER.size + sum(sizes) != len(data):
+        raise SaveFormatError("Файл кэша уровня поврежден: размер не совпадает с заголовком")
+    sections = []
+    offset = _LEVEL_HEADER.size
+    for size in sizes:
+        sections.append(data[offset:offset + size])
+        offset += size
+    grid, room_block, enemy_block, treasure_block, trap_block, rng_state, tail = sections
+    
+    # Комнаты тянут числа из генератора карты - его состояние восстанавливаем в конце
+    rng = random.Random()
+    game_map = GameMap(level, difficulty, rng=rng, width=width, height=height, generate=False, **map_options)
+    try:
+        game_map.grid.load_bytes(grid)
+        _add_rooms(game_map, room_block)
+        
+        tail = _SnapshotReader(tail)
+        count, = tail.unpack("<H")
+        strings = [tail.text() for _ in range(count)]
+        _add_enemies(game_map, strings, enemy_block)
+        has_boss, = tail.unpack("<B")
+        if has_boss:
+            game_map.boss = _read_boss(tail, rng)
+        
+        game_map.treasures = {(x, y): n for x, y, n in _CELL_RECORD.iter_unpack(treasure_block)}
+        game_map.traps = {(x, y): n for x, y, n in _CELL_RECORD.iter_unpack(trap_block)}
+        values = _RNG_STATE.unpack(rng_state)
+        rng.setstate((values[0], values[1:626], values[627] if values[626] else None))
+    except SaveFormatError:
+        raise
+    except (struct.error, ValueError, IndexError) as error:  # ValueError - и от rng.setstate
+        raise SaveFormatError(f"Файл кэша уровня поврежден: {error}") from error
+    return run_seed, game_map
+
+
+class LevelCache:
+    """Построенные уровни на диске для многих партий с одним зерном ("подземелье дня")
+    
+    Уровень с ключом (зерно партии, номер, сложность, размер карты) лежит в
+    своем файле с фиксированной раскладкой: заголовок с числом записей, сетка
+    тайлов как есть, массивы записей комнат, врагов, сокровищ и ловушек,
+    состояние генератора и в конце - строки и босс. Смещения разделов
+    вычисляются из заголовка, а сетка и записи читаются целыми блоками,
+    без сжатия и последовательного разбора снимка сохранения.
+    
+    Когда общий размер файлов превышает max_bytes, удаляются давно не
+    использованные (время изменения файла обновляется при каждой загрузке).
+    Файл записывается во временный и переименовывается, поэтому другие
+    процессы не увидят его недописанным.
+    """
+    
+    SUFFIX = ".rpgl"
+    
+    def __init__(self, directory: str, max_bytes: int = LEVEL_CACHE_SIZE):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # Счетчики для отладки и бенчмарков
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def path(self, run_seed: int, level: int, difficulty: int, width: int, height: int) -> str:
+        """Файл уровня с данным ключом"""
+        return os.path.join(self.directory, f"{run_seed}_{level}_{difficulty}_{width}x{height}{self.SUFFIX}")
+    
+    def load(self, run_seed: int, level: int, difficulty: int, width: int = MAP_WIDTH,
+             height: int = MAP_HEIGHT, **map_options) -> Optional[GameMap]:
+        """Уровень из кэша или None, если его там нет
+        
+        map_options (grid_kind, enemy_store) задают представление карты -
+        в файле оно не хранится.
+        """
+        path = self.path(run_seed, level, difficulty, width, height)
+        try:
+            with open(path, "rb") as file:
+                data = file.read()
+        except FileNotFoundError:
+            return None
+        stored_seed, game_map = _decode_level(memoryview(data), **map_options)
+        if (stored_seed, game_map.level, game_map.difficulty) != (run_seed, level, difficulty):
+            raise SaveFormatError("Файл кэша уровня не соответствует своему ключу")
+        os.utime(path)  # Отметка использования для вытеснения
+        return game_map
+    
+    def store(self, run_seed: int, game_map: GameMap):
+        """Запись только что построенного уровня (до начала игры на нем)"""
+        path = self.path(run_seed, game_map.level, game_map.difficulty, game_map.width, game_map.height)
+        data = _encode_level(run_seed, game_map)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as file:
+            file.write(data)
+        os.replace(temp_path, path)
+        self.trim()
+    
+    def get(self, run_seed: int, level: int, difficulty: int, width: int = MAP_WIDTH,
+            height: int = MAP_HEIGHT, **map_options) -> GameMap:
+        """Уровень из кэша, а если его нет - построенный через level_rng и записанный в кэш"""
+        try:
+            game_map = self.load(run_seed, level, difficulty, width, height, **map_options)
+        except SaveFormatError:
+            game_map = None  # Поврежденный файл заменяем заново построенным уровнем
+        if game_map is not None:
+            self.hits += 1
+            return game_map
+        
+        self.misses += 1
+        game_map = GameMap(level, difficulty, rng=level_rng(run_seed, level), width=width, height=height,
+                           **map_options)
+        try:
+            self.store(run_seed, game_map)
+        except OSError:
+            pass  # Без записи в кэш уровень все равно годится для игры
+        return game_map
+    
+    def size(self) -> int:
+        """Общий размер файлов кэша, байт"""
+        return sum(entry.stat().st_size for entry in self._entries())
+    
+    def _entries(self) -> List[os.DirEntry]:
+        return [entry for entry in os.scandir(self.directory) if entry.name.endswith(self.SUFFIX)]
+    
+    def trim(self):
+        """Удаление давно не использованных уровней сверх max_bytes"""
+        files = []
+        for entry in self._entries():
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue  # Удален другим процессом
+            files.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            self.evictions += 1
+
+
+# ========== БЕСКОНЕЧНОЕ ПОДЗЕМЕЛЬЕ ==========
+CHUNK_SIZE = 32  # Сторона области бесконечного подземелья в клетках
+CHUNK_CACHE_SIZE = 16  # Областей в памяти; давно не нужные вытесняются
+CHUNK_DEPTH_STEP = 2  # Глубина (уровень врагов области) растет на 1 через столько областей от входа
+CHUNK_MAX_DEPTH = 15
+
+
+class ChunkedDungeon:
+    """Бесконечное подземелье из областей CHUNK_SIZE×CHUNK_SIZE
+    
+    Область строится по требованию обычным GameMap с генератором из зерна
+    (seed, cx, cy), поэтому одна и та же область всегда выходит одинаковой.
+    Соседние области связаны проходами в общей стене: место прохода тоже
+    выводится из зерна и стены, и обе области пробивают его в одной клетке.
+    
+    В памяти держится не больше max_chunks областей (LRU). Измененная
+    область (пал враг, взято сокровище, сработала ловушка) при вытеснении
+    сбрасывается в spill_dir снимком _write_map и потом читается оттуда;
+    без spill_dir она при следующем посещении строится заново. Все методы
+    принимают мировые координаты: область клетки - (x // CHUNK_SIZE, y // CHUNK_SIZE).
+    """
+    
+    def __init__(self, difficulty: int = 2, seed: int = 0, max_chunks: int = CHUNK_CACHE_SIZE,
+                 spill_dir: Optional[str] = None, grid_kind: str = "bytes"):
+        # Кадр VIEW_WIDTH×VIEW_HEIGHT задевает до 3×2 областей сразу
+        min_chunks = (VIEW_WIDTH // CHUNK_SIZE + 2) * (VIEW_HEIGHT // CHUNK_SIZE + 2)
+        if max_chunks < min_chunks:
+            raise ValueError(f"Бесконечному подземелью нужно не меньше {min_chunks} областей в памяти")
+        self.difficulty = difficulty
+        self.seed = seed
+        self.max_chunks = max_chunks
+        self.spill_dir = spill_dir
+        self.grid_kind = grid_kind
+        self.chunks = OrderedDict()  # (cx, cy) -> GameMap, от давно не нужных к недавним
+        self.dirty = set()  # Области в памяти, измененные после постройки или загрузки
+        # Счетчики для отладки и бенчмарков
+        self.generated = 0
+        self.spilled = 0
+        self.loaded = 0
+    
+    @staticmethod
+    def depth(cx: int, cy: int) -> int:
+        """Глубина области: уровень ее врагов, сокровищ и ловушек"""
+        return min(1 + (abs(cx) + abs(cy)) // CHUNK_DEPTH_STEP, CHUNK_MAX_DEPTH)
+    
+    def chunk(self, cx: int, cy: int) -> GameMap:
+        """Область (cx, cy): из памяти, с диска или построенная заново"""
+        key = (cx, cy)
+        game_map = self.chunks.get(key)
+        if game_map is not None:
+            self.chunks.move_to_end(key)
+            return game_map
+        
+        game_map = self._load(cx, cy)
+        if game_map is None:
+            game_map = self._generate(cx, cy)
+        self.chunks[key] = game_map
+        while len(self.chunks) > self.max_chunks:
+            self._evict(*self.chunks.popitem(last=False))
+        return game_map
+    
+    def locate(self, x: int, y: int) -> Tuple[GameMap, int, int]:
+        """Область клетки и координаты клетки внутри нее"""
+        cx, lx = divmod(x, CHUNK_SIZE)
+        cy, ly = divmod(y, CHUNK_SIZE)
+        return self.chunk(cx, cy), lx, ly
+    
+    def mark_dirty(self, x: int, y: int):
+        """Область клетки изменилась - при вытеснении ее нужно сохранить"""
+        self.dirty.add((x // CHUNK_SIZE, y // CHUNK_SIZE))
+    
+    def _spill_path(self, cx: int, cy: int) -> str:
+        return os.path.join(self.spill_dir, f"chunk_{cx}_{cy}.rpgc")
+    
+    def _generate(self, cx: int, cy: int) -> GameMap:
+        rng = random.Random(f"{self.seed}:{cx}:{cy}")
+        game_map = GameMap(self.depth(cx, cy), self.difficulty, rng=rng, grid_kind=self.grid_kind,
+                           width=CHUNK_SIZE, height=CHUNK_SIZE)
+        self._carve_doors(game_map, cx, cy)
+        self.generated += 1
+        return game_map
+    
+    def _door(self, wall: str, bx: int, by: int) -> int:
+        """Смещение прохода вдоль общей стены: одинаковое для обеих областей"""
+        return random.Random(f"{self.seed}:{wall}:{bx}:{by}").randint(2, CHUNK_SIZE - 3)
+    
+    def _carve_doors(self, game_map: GameMap, cx: int, cy: int):
+        """Проходы к четырем соседям - туннели от ближайших комнат к краю области"""
+        last = CHUNK_SIZE - 1
+        grid = game_map.grid
+        # Вертикальная стена "v" (bx, by) - западный край области (bx, by),
+        # горизонтальная "h" - северный
+        for side, (door_x, door_y) in (("v", (0, self._door("v", cx, cy))),
+                                       ("v", (last, self._door("v", cx + 1, cy))),
+                                       ("h", (self._door("h", cx, cy), 0)),
+                                       ("h", (self._door("h", cx, cy + 1), last))):
+            room = min(game_map.rooms,
+                       key=lambda room: abs(room.center_x - door_x) + abs(room.center_y - door_y))
+            if side == "v":
+                grid.vline(room.center_x, room.center_y, door_y, TILE_FLOOR)
+                grid.hline(room.center_x, door_x, door_y, TILE_FLOOR)
+            else:
+                grid.hline(room.center_x, door_x, room.center_y, TILE_FLOOR)
+                grid.vline(door_x, room.center_y, door_y, TILE_FLOOR)
+        
+        # Туннели могли пройти по ловушкам - возвращаем их на сетку
+        for x, y in game_map.traps:
+            grid.set(x, y, TILE_TRAP)
+    
+    def _load(self, cx: int, cy: int) -> Optional[GameMap]:
+        """Область, сброшенная на диск при вытеснении, или None"""
+        if self.spill_dir is None:
+            return None
+        try:
+            with open(self._spill_path(cx, cy), "rb") as file:
+                data = file.read()
+        except FileNotFoundError:
+            return None
+        self.loaded += 1
+        return _read_map(_SnapshotReader(data))
+    
+    def _evict(self, key: Tuple[int, int], game_map: GameMap):
+        """Вытеснение области из памяти: измененная сбрасывается на диск"""
+        if key not in self.dirty:
+            return
+        self.dirty.discard(key)
+        if self.spill_dir is None:
+            return  # Без папки изменения теряются - область будет построена заново
+        out = _SnapshotWriter()
+        _write_map(out, game_map)
+        with open(self._spill_path(*key), "wb") as file:
+            file.write(out.getvalue())
+        self.spilled += 1
+    
+    def entrance(self) -> Tuple[int, int]:
+        """Стартовая клетка героя: центр первой комнаты области (0, 0)"""
+        room = self.chunk(0, 0).rooms[0]
+        return room.center_x, room.center_y
+    
+    def is_walkable(self, x: int, y: int) -> bool:
         """Проверка, можно ли пройти в клетку"""
-        if not (0 <= x < MAP_WIDTH and 0 <= y < MAP_HEIGHT):
-            return False
-        return self.grid[y][x] != '#'
+        game_map, x, y = self.locate(x, y)
+        return game_map.is_walkable(x, y)
     
-    def get_enemy_at(self, x: int, y: int) -> Optional[Hero]:
-        """Получение врага в указанной клетке"""
-        for enemy in self.enemies:
-            if enemy.is_alive and enemy.x == x and enemy.y == y:
-                return enemy
-        if self.boss and self.boss.is_alive and self.boss.x == x and self.boss.y == y:
-            return self.boss
-        return None
+    def get_enemy_at(self, x: int, y: int) -> Optional[Combatant]:
+        """Получение врага или босса в указанной клетке"""
+        game_map, x, y = self.locate(x, y)
+        return game_map.get_enemy_at(x, y)
     
     def get_treasure_at(self, x: int, y: int) -> bool:
         """Проверка, есть ли сокровище в клетке"""
-        return (x, y) in self.treasures
+        game_map, x, y = self.locate(x, y)
+        return game_map.get_treasure_at(x, y)
+    
+    def take_treasure(self, x: int, y: int) -> bool:
+        """Забрать сокровище из клетки"""
+        game_map, lx, ly = self.locate(x, y)
+        taken = game_map.take_treasure(lx, ly)
+        if taken:
+            self.mark_dirty(x, y)
+        return taken
+    
+    def check_trap(self, x: int, y: int, player: Hero) -> Tuple[bool, int]:
+        """Проверка на ловушку"""
+        game_map, lx, ly = self.locate(x, y)
+        is_trap, trap_damage = game_map.check_trap(lx, ly, player)
+        if is_trap:
+            self.mark_dirty(x, y)
+        return is_trap, trap_damage
+    
+    def defeat_enemy(self, x: int, y: int, enemy: Combatant):
+        """Учет врага или босса, павшего в бою в клетке (x, y)"""
+        game_map, _, _ = self.locate(x, y)
+        if not enemy.is_boss:
+            game_map.defeat_enemy(enemy)
+        self.mark_dirty(x, y)
+    
+    def teleport(self, player: Hero):
+        """Телепортация игрока в случайную комнату текущей области"""
+        cx, cy = player.x // CHUNK_SIZE, player.y // CHUNK_SIZE
+        self.chunk(cx, cy).teleport(player)
+        player.x += cx * CHUNK_SIZE
+        player.y += cy * CHUNK_SIZE
+    
+    def compose_frame(self, player: Hero) -> Tuple[List[List[str]], List[str]]:
+        """Сборка кадра вокруг героя: клетки соседних областей и строки информации"""
+        view_x = player.x - VIEW_WIDTH // 2
+        view_y = player.y - VIEW_HEIGHT // 2
+        cells = [list("╔" + "═" * VIEW_WIDTH + "╗")]
+        
+        for y in range(view_y, view_y + VIEW_HEIGHT):
+            row = ["║"]
+            cy, ly = divmod(y, CHUNK_SIZE)
+            x = view_x
+            # Строка собирается отрезками: каждый - в пределах одной области
+            while x < view_x + VIEW_WIDTH:
+                cx, start = divmod(x, CHUNK_SIZE)
+                game_map = self.chunk(cx, cy)
+                tiles = game_map.grid.row(ly)
+                for lx in range(start, min(CHUNK_SIZE, start + view_x + VIEW_WIDTH - x)):
+                    if player.x == x and player.y == y:
+                        row.append(f"\033[1;32m{player.symbol}\033[0m")
+                    else:
+                        row.append(game_map.glyph(lx, ly, tiles[lx]))
+                    x += 1
+            row.append("║")
+            cells.append(row)
+        
+        cells.append(list("╚" + "═" * VIEW_WIDTH + "╝"))
+        
+        # Статистика игрока и области
+        game_map, lx, ly = self.locate(player.x, player.y)
+        lines = player.get_stats().split("\n")
+        lines.append(f"Глубина: {game_map.level} (область {player.x // CHUNK_SIZE}, {player.y // CHUNK_SIZE})")
+        lines.append(f"Сложность: {DIFFICULTY_NAMES[self.difficulty]}")
+        
+        # Ближайшие враги текущей области
+        nearby_enemies = game_map.radar.nearest(lx, ly, 8, 3)
+        if nearby_enemies:
+            lines.append("")
+            lines.append("Ближайшие враги:")
+            for enemy, distance in nearby_enemies:
+                type_indicator = " [ЭЛИТНЫЙ]" if enemy.enemy_type == EnemyType.ELITE else ""
+                lines.append(f"  {enemy.name}{type_indicator} - {enemy.hp}/{enemy.max_hp} HP ({distance} клеток)")
+        return cells, lines
+    
+    def draw(self, player: Hero, renderer: Optional['TerminalRenderer'] = None):
+        """Отрисовка окрестностей героя и информации"""
+        cells, lines = self.compose_frame(player)
+        (renderer or TerminalRenderer()).render(cells, lines)
 
 
-def find_treasure(game_map: GameMap) -> Tuple[str, str, Any]:
-    """Создание сокровища через фабрику"""
-    treasure = game_map.treasure_factory.create_treasure()
-    return treasure
+# ========== ЖУРНАЛ АВТОСОХРАНЕНИЯ ==========
+JOURNAL_FILE = "savegame.journal"
+JOURNAL_MAGIC = b"RPGJ"
+JOURNAL_VERSION = 1
 
+_JOURNAL_HEADER = struct.Struct("<4sH")
+# Тип записи и длина данных; после данных - CRC32 заголовка и данных
+_JOURNAL_RECORD = struct.Struct("<BI")
+_JOURNAL_CRC = struct.Struct("<I")
+# Уровень, x, y, hp, max_hp, опыт, сила, защита, клетки с врагами, hp босса
+_TURN_DIGEST = struct.Struct("<Hiiiiiiiii")
 
-def start_battle(player: Hero, enemy: Hero):
-    """Запуск боя с обычным врагом"""
-    os.system('cls' if os.name == 'nt' else 'clear')
-    
-    print("╔" + "═" * 50 + "╗")
-    print(f"║{'БОЙ НАЧИНАЕТСЯ!':^50}║")
+_RECORD_CHECKPOINT = 1
+_RECORD_INPUT = 2
+_RECORD_TURN = 3
+
+
+class JournalError(Exception):
+    """Журнал поврежден или его повтор разошелся с записанной игрой"""
+    pass
+
+
+def _turn_digest(state: GameState) -> bytes:
+    """Краткая сводка состояния после хода для проверки повтора"""
+    player, game_map = state.player, state.game_map
+    boss_hp = game_map.boss.hp if game_map.boss is not None else 0
+    return _TURN_DIGEST.pack(state.current_level, player.x, player.y, player.hp, player.max_hp, player.exp,
+                             player.strength, player.armor, len(game_map.enemy_cells), boss_hp)
+
+
+def _journal_record(kind: int, payload: bytes) -> bytes:
+    header = _JOURNAL_RECORD.pack(kind, len(payload))
+    return header + payload + _JOURNAL_CRC.pack(zlib.crc32(payload, zlib.crc32(header)))
+
+
+def _read_journal_records(data: bytes):
+    """Записи журнала (тип, данные, смещение конца) до первой оборванной или испорченной"""
+    offset = _JOURNAL_HEADER.size
+    while offset + _JOURNAL_RECORD.size <= len(data):
+        header = data[offset:offset + _JOURNAL_RECORD.size]
+        kind, size = _JOURNAL_RECORD.unpack(header)
+        start = offset + _JOURNAL_RECORD.size
+        end = start + size + _JOURNAL_CRC.size
+        if end > len(data):
+            break
+        payload = data[start:start + size]
+        crc, = _JOURNAL_CRC.unpack_from(data, start + size)
+        if crc != zlib.crc32(payload, zlib.crc32(header)):
+            break
+        yield kind, payload, end
+        offset = end
+
+
+class Journal:
+    """Журнал автосохранения: партия переживает обрыв соединения
     
-    if enemy.enemy_type == EnemyType.ELITE:
-        print(f"║{'ВСТРЕЧА С ЭЛИТНЫМ ВРАГОМ!':^50}║")
+    Файл - контрольная точка (снимок партии) и хвост записей после нее:
+    строки, введенные игроком, и сводка состояния после каждого хода.
+    Записи копятся в памяти и дописываются в файл в конце хода, на диск
+    (fsync) они сбрасываются раз в sync_every ходов. В начале уровня и
+    каждые checkpoint_every ходов файл заменяется новой контрольной точкой,
+    поэтому при восстановлении повторяется лишь короткий хвост.
+    """
     
-    print(f"║{f'{player.name} vs {enemy.name}':^50}║")
-    print("╚" + "═" * 50 + "╝")
+    def __init__(self, path: str = JOURNAL_FILE, sync_every: int = 10, checkpoint_every: int = 100):
+        self.path = path
+        self.sync_every = sync_every
+        self.checkpoint_every = checkpoint_every
+        self._file = None
+        self._buffer = bytearray()
+        self._turns = 0  # Ходов после контрольной точки
+        self._unsynced = 0
+        self._level = None  # Уровень подземелья последней контрольной точки
+        self._expected = deque()  # Сводки ходов, которые еще предстоит повторить
     
-    turn = 0
+    def record_input(self, text: str):
+        """Слушатель консоли: строка, введенная игроком"""
+        self._buffer += _journal_record(_RECORD_INPUT, text.encode("utf-8"))
     
-    while player.is_alive and enemy.is_alive:
-        turn += 1
-        
-        print(f"\n{'─' * 50}")
-        print(f"РАУНД {turn}")
-        print(f"{'─' * 50}")
+    def turn(self, state: GameState):
+        """Ход завершен: герой на карте и ждет следующую команду"""
+        digest = _turn_digest(state)
+        if self._expected:
+            if digest != self._expected.popleft():
+                raise JournalError("Повтор журнала разошелся с записанной игрой")
+            return
         
-        # Статусы
-        player_health = f"{player.hp}/{player.max_hp} HP"
-        enemy_health = f"{enemy.hp}/{enemy.max_hp} HP"
+        if self._level != state.current_level or self._turns >= self.checkpoint_every:
+            self.checkpoint(state)
+            return
         
-        print(f"\n{player.name:25} {player_health:>10}")
-        print(f"{enemy.name:25} {enemy_health:>10}")
-        print(f"{'─' * 50}")
+        self._turns += 1
+        self._buffer += _journal_record(_RECORD_TURN, digest)
+        self._file.write(self._buffer)
+        self._file.flush()
+        self._buffer.clear()
+        self._unsynced += 1
+        if self._unsynced >= self.sync_every:
+            self.sync()
+    
+    def checkpoint(self, state: GameState):
+        """Заменить журнал контрольной точкой без хвоста"""
+        if self._file is not None:
+            self._file.close()
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "wb") as file:
+            file.write(_JOURNAL_HEADER.pack(JOURNAL_MAGIC, JOURNAL_VERSION))
+            file.write(_journal_record(_RECORD_CHECKPOINT, encode_game_state(state)))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self.path)
         
-        # Ход игрока
-        print("\nВыберите действие:")
-        print("1. Атаковать мечом")
-        print("2. Использовать зелье здоровья (+30 HP)")
-        print("3. Попытаться сбежать")
+        self._file = open(self.path, "ab")
+        self._buffer.clear()
+        self._turns = 0
+        self._unsynced = 0
+        self._level = state.current_level
+    
+    def sync(self):
+        """Сбросить записанное на диск"""
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        self._unsynced = 0
+    
+    def close(self, keep: bool = False):
+        """Закрыть журнал: партия закончилась - восстанавливать больше нечего
         
+        keep - партия прервана, файл остается для восстановления.
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if keep:
+            return
         try:
-            choice = int(input("Ваш выбор: "))
-        except ValueError:
-            choice = 0
-        
-        if choice == 1:
-            damage, critical = player.attack(enemy)
-            if critical:
-                print(f"\n✨ КРИТИЧЕСКИЙ УДАР! Вы нанесли {damage} урона!")
-            else:
-                print(f"\n⚔️ Вы нанесли {damage} урона!")
-            
-            if not enemy.is_alive:
-                break
-        
-        elif choice == 2:
-            if player.hp < player.max_hp:
-                healed = player.heal(30)
-                print(f"\n🧪 Вы выпили зелье здоровья и восстановили {healed} HP!")
-            else:
-                print("\nУ вас и так полное здоровье!")
-                continue
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+    
+    @classmethod
+    def recover(cls, path: str = JOURNAL_FILE, **options) -> Tuple['Journal', GameState, List[str]]:
+        """Восстановление прерванной партии
         
-        elif choice == 3:
-            # Шанс сбежать зависит от уровня врага
-            escape_chance = 0.4
-            if enemy.enemy_type == EnemyType.ELITE:
-                escape_chance = 0.2
-            
-            if random.random() < escape_chance:
-                print("\n🏃 Вы успешно сбежали из боя!")
-                return True  # Успешно сбежали
-            else:
-                print("\nВраг блокирует ваш путь к отступлению!")
+        Возвращает журнал для ее продолжения, состояние на контрольной точке
+        и строки ввода, которые нужно повторить (Console.replay), чтобы дойти
+        до последнего записанного хода. Ввод незаконченного хода отбрасывается.
+        """
+        with open(path, "rb") as file:
+            data = file.read()
+        if len(data) < _JOURNAL_HEADER.size:
+            raise JournalError("Журнал автосохранения пуст")
+        magic, version = _JOURNAL_HEADER.unpack_from(data)
+        if magic != JOURNAL_MAGIC or version != JOURNAL_VERSION:
+            raise JournalError("Файл не является журналом автосохранения этой версии")
         
-        else:
-            print("\nНеверный выбор! Пропускаете ход.")
+        records = _read_journal_records(data)
+        first = next(records, None)
+        if first is None or first[0] != _RECORD_CHECKPOINT:
+            raise JournalError("В журнале нет контрольной точки")
+        state = decode_game_state(first[1])
         
-        # Ход врага
-        if enemy.is_alive:
-            damage, critical = enemy.attack(player)
-            if critical:
-                print(f"\n💥 {enemy.name} наносит критический удар на {damage} урона!")
-            else:
-                print(f"\n🗡️ {enemy.name} атакует и наносит {damage} урона!")
-            
-            # Особые способности элитных врагов
-            if enemy.enemy_type == EnemyType.ELITE and enemy.is_alive:
-                if random.random() < 0.3:  # 30% шанс на особую способность
-                    elite_ability = random.choice(["сильный удар", "исцеление"])
-                    if elite_ability == "сильный удар":
-                        bonus_damage = enemy.strength // 2
-                        player.hp -= bonus_damage
-                        print(f"💢 {enemy.name} использует СИЛЬНЫЙ УДАР! Дополнительно {bonus_damage} урона!")
-                    elif elite_ability == "исцеление":
-                        heal_amount = enemy.max_hp // 10
-                        enemy.heal(heal_amount)
-                        print(f"💚 {enemy.name} исцеляется на {heal_amount} HP!")
+        journal = cls(path, **options)
+        journal._expected.append(_turn_digest(state))
+        script, pending = [], []
+        complete = first[2]
+        for kind, payload, end in records:
+            if kind == _RECORD_INPUT:
+                pending.append(payload.decode("utf-8"))
+            elif kind == _RECORD_TURN:
+                script.extend(pending)
+                pending = []
+                journal._expected.append(payload)
+                complete = end
         
-        if not player.is_alive:
-            print(f"\n☠️ {player.name} пал в бою...")
-            break
+        # Хвост после последнего законченного хода будет записан заново
+        with open(path, "r+b") as file:
+            file.truncate(complete)
+        journal._file = open(path, "ab")
+        journal._turns = len(journal._expected) - 1
+        journal._level = state.current_level
+        return journal, state, script
+
+
+# ========== БЕЗГОЛОВАЯ СИМУЛЯЦИЯ ==========
+MOVE_DELTAS = {'w': (0, -1), 's': (0, 1), 'a': (-1, 0), 'd': (1, 0)}
+
+
+class Policy(ABC):
+    """Стратегия, принимающая решения вместо игрока в симуляции"""
     
-    # Результаты боя
-    if not enemy.is_alive:
-        exp_gained = enemy.exp_reward if hasattr(enemy, 'exp_reward') else enemy.max_hp // 2 + enemy.strength * 2
-        player.gain_exp(exp_gained)
-        print(f"\n🎉 {enemy.name} повержен!")
-        print(f"Получено опыта: {exp_gained}")
-        
-        # Дополнительные награды за элитных врагов
-        if enemy.enemy_type == EnemyType.ELITE:
-            print("⭐ Вы победили элитного врага! Получена дополнительная награда!")
-            # Шанс на получение редкого предмета
-            if random.random() < 0.5:
-                rare_items = ["Руна силы", "Амулет защиты", "Сапфир маны"]
-                item = random.choice(rare_items)
-                player.inventory.append(item)
-                print(f"🎁 Получен предмет: {item}")
+    @abstractmethod
+    def choose_move(self, player: Hero, game_map: GameMap) -> str:
+        """Команда на карте: 'w', 'a', 's', 'd', 'h' или 'q'"""
+        pass
     
-    input("\nНажмите Enter, чтобы продолжить...")
-    return False
+    @abstractmethod
+    def choose_battle_action(self, player: Hero, enemy: Combatant, turn: int) -> int:
+        """Действие в обычном бою: 1 - атака, 2 - зелье, 3 - побег"""
+        pass
+    
+    @abstractmethod
+    def choose_boss_action(self, player: Hero, boss: Boss, turn: int) -> int:
+        """Действие в бою с боссом: 1 - атака, 2 - зелье, 3 - защита"""
+        pass
 
 
-def start_boss_battle(player: Hero, boss: Hero):
-    """Запуск боя с боссом"""
-    os.system('cls' if os.name == 'nt' else 'clear')
+class GreedyPolicy(Policy):
+    """Идет к ближайшему врагу или сокровищу, лечится при низком здоровье"""
     
-    print("╔" + "═" * 50 + "╗")
-    print(f"║{'БИТВА С БОССОМ!':^50}║")
-    print(f"║{f'{boss.name}':^50}║")
-    print("╚" + "═" * 50 + "╝")
+    def __init__(self, heal_threshold: float = 0.35, boss_heal_threshold: float = 0.4,
+                 max_heal_turn: int = 100):
+        self.heal_threshold = heal_threshold
+        self.boss_heal_threshold = boss_heal_threshold
+        # После стольких ходов только атакуем, чтобы не лечиться бесконечно
+        self.max_heal_turn = max_heal_turn
+        self._path = []
+        self._map = None
     
-    print(f"\n⚡ ОСОБЫЕ МЕХАНИКИ БОССА:")
-    
-    if boss.boss_type == "dragon":
-        print("  • Огненное дыхание: наносит урон по площади")
-        print("  • Сопротивление огню: получает меньше урона от огня")
-        print("  • Полёт: может уклоняться от атак")
+    def choose_move(self, player: Hero, game_map: GameMap) -> str:
+        if self._map is not game_map or not self._path_is_valid(player, game_map):
+            self._map = game_map
+            self._path = self._find_path(player, game_map)
+            if not self._path:
+                return 'q'
+        
+        x, y = self._path.pop(0)
+        for command, (dx, dy) in MOVE_DELTAS.items():
+            if (player.x + dx, player.y + dy) == (x, y):
+                return command
+        return 'q'
     
-    elif boss.boss_type == "lich":
-        print("  • Проклятие: уменьшает вашу силу")
-        print("  • Призыв скелетов: вызывает помощников")
-        print("  • Нежить: невосприимчив к ядам")
+    def choose_battle_action(self, player: Hero, enemy: Combatant, turn: int) -> int:
+        if player.hp < player.max_hp * self.heal_threshold and turn <= self.max_heal_turn:
+            return 2
+        return 1
     
-    elif boss.boss_type == "titan":
-        print("  • Землетрясение: оглушает на 1 ход")
-        print("  • Каменная кожа: уменьшает получаемый урон")
-        print("  • Сокрушение: наносит двойной урон при низком HP")
+    def choose_boss_action(self, player: Hero, boss: Boss, turn: int) -> int:
+        if player.hp < player.max_hp * self.boss_heal_threshold and turn <= self.max_heal_turn:
+            return 2
+        return 1
     
-    print(f"\n⚠️  НЕЛЬЗЯ СБЕЖАТЬ ОТ БОССА!")
-    print(f"{'─' * 50}")
+    def _is_target(self, game_map: GameMap, x: int, y: int) -> bool:
+        return game_map.get_enemy_at(x, y) is not None or game_map.get_treasure_at(x, y)
     
-    input("\nНажмите Enter, чтобы начать бой...")
+    def _path_is_valid(self, player: Hero, game_map: GameMap) -> bool:
+        if not self._path:
+            return False
+        # Путь ведет из текущей клетки и цель все еще на месте
+        x, y = self._path[0]
+        if abs(x - player.x) + abs(y - player.y) != 1:
+            return False
+        return self._is_target(game_map, *self._path[-1])
     
-    turn = 0
-    boss_phase = 1
+    def _find_path(self, player: Hero, game_map: GameMap) -> List[Tuple[int, int]]:
+        # Сначала ищем путь в обход ловушек, затем - любой
+        path = self._bfs(player, game_map, avoid_traps=True)
+        if not path:
+            path = self._bfs(player, game_map, avoid_traps=False)
+        if not path and self._is_target(game_map, player.x, player.y):
+            # Цель осталась в нашей же клетке - отходим, чтобы вернуться к ней
+            for dx, dy in MOVE_DELTAS.values():
+                if game_map.is_walkable(player.x + dx, player.y + dy):
+                    return [(player.x + dx, player.y + dy)]
+        return path
     
-    while player.is_alive and boss.is_alive:
-        turn += 1
-        os.system('cls' if os.name == 'nt' else 'clear')
-        
-        # Отображение статуса
-        print(f"\nХОД {turn}")
-        print(f"{'─' * 50}")
-        
-        # Индикатор здоровья босса
-        boss_hp_percent = boss.hp / boss.max_hp
-        boss_bar_length = 40
-        boss_filled = int(boss_hp_percent * boss_bar_length)
+    def _bfs(self, player: Hero, game_map: GameMap, avoid_traps: bool) -> List[Tuple[int, int]]:
+        start = (player.x, player.y)
+        came_from = {start: None}
+        queue = deque([start])
         
-        # Определение фазы босса
-        if boss_hp_percent > 0.6:
-            phase = "I"
-            phase_color = "🟢"
-        elif boss_hp_percent > 0.3:
-            phase = "II"
-            phase_color = "🟡"
-            
-            # Включаем режим ярости при переходе во вторую фазу
-            if boss_phase == 1:
-                boss_phase = 2
-                boss.enraged = True
-                boss.strength = int(boss.strength * 1.3)
-                print(f"⚡ {boss.name} впадает в ЯРОСТЬ! Его сила увеличивается!")
-                input("\nНажмите Enter, чтобы продолжить...")
-        else:
-            phase = "III"
-            phase_color = "🔴"
+        while queue:
+            x, y = queue.popleft()
+            if (x, y) != start and self._is_target(game_map, x, y):
+                path = []
+                cell = (x, y)
+                while cell != start:
+                    path.append(cell)
+                    cell = came_from[cell]
+                path.reverse()
+                return path
             
-            # Финальная фаза
-            if boss_phase == 2:
-                boss_phase = 3
-                boss.strength = int(boss.strength * 1.5)
-                boss.armor = int(boss.armor * 0.7)  # Жертвует защитой ради атаки
-                print(f"💀 {boss.name} в ФИНАЛЬНОЙ ФАЗЕ! Сила резко возрастает!")
-                input("\nНажмите Enter, чтобы продолжить...")
-        
-        print(f"\nБОСС [{phase}] {boss.name}")
-        print(f"HP: [{phase_color * boss_filled}{'⬜' * (boss_bar_length - boss_filled)}] "
-              f"{boss.hp}/{boss.max_hp}")
-        
-        # Здоровье игрока
-        player_hp_percent = player.hp / player.max_hp
-        player_bar_length = 40
-        player_filled = int(player_hp_percent * player_bar_length)
-        player_color = "🟢" if player_hp_percent > 0.3 else "🔴"
-        
-        print(f"\nИГРОК {player.name}")
-        print(f"HP: [{player_color * player_filled}{'⬜' * (player_bar_length - player_filled)}] "
-              f"{player.hp}/{player.max_hp}")
+            for dx, dy in MOVE_DELTAS.values():
+                nx, ny = x + dx, y + dy
+                if (nx, ny) in came_from or not game_map.is_walkable(nx, ny):
+                    continue
+                if avoid_traps and (nx, ny) in game_map.traps:
+                    continue
+                came_from[(nx, ny)] = (x, y)
+                queue.append((nx, ny))
+        return []
+
+
+@dataclass
+class RunResult:
+    """Итог одного прохождения в симуляции"""
+    difficulty: int
+    outcome: str  # "victory", "death", "quit" или "stalled"
+    levels_cleared: int
+    final_level: int
+    death_cause: Optional[str]
+    hero_level: int
+    hp: int
+    max_hp: int
+    strength: int
+    armor: int
+    exp: int
+    steps: int = 0
+    battles: int = 0
+    kills: int = 0
+    bosses_killed: int = 0
+    escapes: int = 0
+    treasures: int = 0
+    traps: int = 0
+    seed: Optional[int] = None
+
+
+class SimulationStalled(Exception):
+    """Стратегия зациклилась и не продвигает игру"""
+    pass
+
+
+class HeadlessGame:
+    """Полное прохождение игры без ввода, вывода и задержек
+    
+    Повторяет правила main(), start_battle и start_boss_battle, используя
+    те же GameMap, Hero и фабрики.
+    """
+    
+    def __init__(self, policy: Policy, difficulty: int = 2, max_levels: int = 15,
+                 player_name: Optional[str] = None, max_steps_per_level: int = 5000,
+                 max_battle_turns: int = 1000, seed: Optional[int] = None, enemy_turns: bool = False,
+                 level_cache: Optional[LevelCache] = None):
+        self.policy = policy
+        self.difficulty = difficulty
+        self.max_levels = max_levels
+        self.player_name = player_name or HERO_NAMES[0]
+        self.max_steps_per_level = max_steps_per_level
+        self.max_battle_turns = max_battle_turns
+        self.seed = seed
+        self.enemy_turns = enemy_turns  # Враги ходят по очереди TurnScheduler, как в play_game
+        self.level_cache = level_cache  # Уровни из кэша на диске (LevelCache) вместо генерации
+        self.stats = {}
+        self.death_cause = None
+    
+    def run(self) -> RunResult:
+        """Сыграть одну партию до победы, смерти или выхода"""
+        self.stats = dict.fromkeys(
+            ("steps", "battles", "kills", "bosses_killed", "escapes", "treasures", "traps"), 0)
+        self.death_cause = None
+        # Все случайные решения партии идут через один генератор
+        rng = random.Random(self.seed)
+        run_seed = rng.getrandbits(63)
         
-        print(f"{'─' * 50}")
+        player = create_player(self.player_name, self.difficulty, rng)
+        player.verbose = False
         
-        # Ход игрока
-        print("\nВыберите действие:")
-        print("1. Атаковать")
-        print("2. Использовать зелье здоровья (+50 HP)")
-        print("3. Защищаться (уменьшает получаемый урон)")
+        current_level = 1
+        levels_cleared = 0
+        outcome = "death"
         
         try:
-            choice = int(input("Ваш выбор: "))
-        except ValueError:
-            choice = 0
-        
-        player_defending = False
+            while player.is_alive and current_level <= self.max_levels:
+                if self.level_cache is not None:
+                    game_map = self.level_cache.get(run_seed, current_level, self.difficulty)
+                else:
+                    game_map = GameMap(level=current_level, difficulty=self.difficulty,
+                                       rng=level_rng(run_seed, current_level))
+                start_room = game_map.rooms[0]
+                player.x = start_room.center_x
+                player.y = start_room.center_y
+                
+                # Лечение между уровнями
+                player.heal(int(30 * player.difficulty_multipliers["heal"]))
+                
+                level_outcome = self._play_level(player, game_map)
+                if level_outcome != "cleared":
+                    outcome = level_outcome
+                    break
+                
+                levels_cleared += 1
+                player.gain_exp(50 * current_level)
+                if current_level == self.max_levels:
+                    outcome = "victory"
+                    break
+                current_level += 1
+        except SimulationStalled:
+            outcome = "stalled"
         
-        if choice == 1:
-            damage, critical = player.attack(boss)
-            if critical:
-                print(f"\n✨ КРИТИЧЕСКИЙ УДАР! Вы нанесли {damage} урона!")
-            else:
-                print(f"\n⚔️ Вы нанесли {damage} урона!")
+        return RunResult(
+            difficulty=self.difficulty,
+            outcome=outcome,
+            levels_cleared=levels_cleared,
+            final_level=current_level,
+            death_cause=self.death_cause if outcome == "death" else None,
+            hero_level=player.level,
+            hp=player.hp,
+            max_hp=player.max_hp,
+            strength=player.strength,
+            armor=player.armor,
+            exp=player.exp,
+            seed=self.seed,
+            **self.stats
+        )
+    
+    def _play_level(self, player: Hero, game_map: GameMap) -> str:
+        """Цикл уровня из main(): "cleared", "death", "quit" или "stalled" """
+        steps = 0
+        scheduler = TurnScheduler(game_map, player) if self.enemy_turns else None
+        turn_spent = False
         
-        elif choice == 2:
-            if player.hp < player.max_hp:
-                healed = player.heal(50)
-                print(f"\n🧪 Вы выпили зелье здоровья и восстановили {healed} HP!")
-            else:
-                print("\nУ вас и так полное здоровье!")
+        while player.is_alive:
+            if turn_spent:
+                turn_spent = False
+                for enemy in scheduler.advance():
+                    if not player.is_alive or not enemy.is_alive:
+                        continue
+                    if enemy.is_boss:
+                        self._boss_battle(player, enemy)
+                    elif not self._battle(player, enemy) and not enemy.is_alive:
+                        game_map.defeat_enemy(enemy)
+                if not player.is_alive:
+                    break
+            
+            if game_map.is_cleared():
+                return "cleared"
+            
+            if steps >= self.max_steps_per_level:
+                raise SimulationStalled()
+            steps += 1
+            self.stats["steps"] += 1
+            
+            command = self.policy.choose_move(player, game_map)
+            
+            if command == 'q':
+                return "quit"
+            
+            elif command == 'h':
+                turn_spent = scheduler is not None
+                if player.hp > 20:
+                    player.hp -= 10
+                    player.strength += 2
                 continue
-        
-        elif choice == 3:
-            player_defending = True
-            print(f"\n🛡️ Вы принимаете защитную стойку. Следующая атака будет слабее.")
-        
-        else:
-            print("\nНеверный выбор! Пропускаете ход.")
-        
-        # Ход босса
-        if boss.is_alive:
-            # Особые способности босса
-            if turn % 3 == 0:  # Каждый 3-й ход - особая способность
-                if boss.boss_type == "dragon":
-                    damage = boss.strength * 2
-                    player.hp -= damage
-                    print(f"\n🔥 {boss.name} использует ОГНЕННОЕ ДЫХАНИЕ! Нанесено {damage} урона!")
-                
-                elif boss.boss_type == "lich":
-                    # Лич может призывать скелетов
-                    if len(boss.minions) < 3:
-                        skeleton = Hero("Скелет-слуга", 0, 0, 's', 30, 8, 3)
-                        boss.minions.append(skeleton)
-                        print(f"\n💀 {boss.name} призывает Скелета-слугу!")
-                    
-                    # И проклинать игрока
-                    curse_damage = boss.strength // 2
-                    player.hp -= curse_damage
-                    player.strength = max(1, player.strength - 2)
-                    print(f"\n☠️ {boss.name} накладывает ПРОКЛЯТИЕ! Нанесено {curse_damage} урона, ваша сила уменьшена!")
-                
-                elif boss.boss_type == "titan":
-                    damage = boss.strength * 3
-                    if player_defending:
-                        damage = damage // 2  # Защита уменьшает урон
-                        print(f"\n🛡️ Ваша защита смягчает удар!")
-                    
-                    player.hp -= damage
-                    print(f"\n🌋 {boss.name} вызывает ЗЕМЛЕТРЯСЕНИЕ! Нанесено {damage} урона!")
-                    
-                    # Оглушение с шансом
-                    if random.random() < 0.5:
-                        print(f"💫 Вы оглушены и пропустите следующий ход!")
-                        # Здесь можно добавить механику пропуска хода
-            else:
-                # Обычная атака босса
-                if player_defending:
-                    damage = max(1, boss.strength // 2 - (player.armor // 3))
-                else:
-                    damage = max(1, boss.strength - (player.armor // 3))
+            
+            elif command not in MOVE_DELTAS:
+                continue
+            
+            turn_spent = scheduler is not None
+            dx, dy = MOVE_DELTAS[command]
+            new_x, new_y = player.x + dx, player.y + dy
+            
+            if not game_map.is_walkable(new_x, new_y):
+                continue
+            
+            is_trap, _ = game_map.check_trap(new_x, new_y, player)
+            if is_trap:
+                self.stats["traps"] += 1
+                if not player.is_alive:
+                    self.death_cause = "Ловушка"
+                    break
+            
+            enemy = game_map.get_enemy_at(new_x, new_y)
+            if enemy:
+                if enemy.is_boss:
+                    self._boss_battle(player, enemy)
+                elif self._battle(player, enemy):
+                    continue
+                elif not enemy.is_alive:
+                    game_map.defeat_enemy(enemy)
                 
-                player.hp -= damage
-                print(f"\n👊 {boss.name} атакует и наносит {damage} урона!")
+                if not player.is_alive:
+                    break
             
-            # Атака миньонов босса
-            for minion in boss.minions[:]:
-                if minion.is_alive:
-                    minion_damage = max(1, minion.strength - (player.armor // 3))
-                    player.hp -= minion_damage
-                    print(f"  💀 {minion.name} атакует! Нанесено {minion_damage} урона")
-                else:
-                    boss.minions.remove(minion)
+            elif game_map.get_treasure_at(new_x, new_y):
+                self.stats["treasures"] += 1
+                treasure = pick_treasure(player.rng)
+                game_map.take_treasure(new_x, new_y)
+                
+                if treasure.teleport:
+                    game_map.teleport(player)
+                    continue
+                apply_treasure(player, treasure)
+            
+            player.x, player.y = new_x, new_y
         
-        time.sleep(2)
+        return "death"
     
-    # Результат битвы с боссом
-    if not boss.is_alive:
-        print(f"\n{'🎉' * 25}")
-        print(f"        ПОБЕДА НАД {boss.name}!")
-        print(f"{'🎉' * 25}")
+    def _battle(self, player: Hero, enemy: Combatant) -> bool:
+        """Обычный бой по правилам start_battle; True - если герой сбежал"""
+        self.stats["battles"] += 1
+        turn = 0
         
-        # Награда за босса
-        exp_reward = boss.exp_reward
-        player.gain_exp(exp_reward)
-        print(f"\n✨ Получено опыта: {exp_reward}")
-        
-        # Уникальные предметы
-        legendary_items = {
-            "dragon": ["Сердце дракона", "Чешуя дракона", "Коготь древнего"],
-            "lich": ["Филоктерия", "Посох некроманта", "Кольцо тьмы"],
-            "titan": ["Камень вечности", "Сердце горы", "Длань титана"]
-        }
-        
-        if boss.boss_type in legendary_items:
-            items = legendary_items[boss.boss_type]
-            for item in items:
-                if random.random() < 0.5:  # 50% шанс на каждый предмет
-                    player.inventory.append(item)
-                    print(f"🏆 Получен легендарный предмет: {item}")
+        while player.is_alive and enemy.is_alive:
+            turn += 1
+            if turn > self.max_battle_turns:
+                raise SimulationStalled()
+            
+            choice = self.policy.choose_battle_action(player, enemy, turn)
+            if resolve_battle_turn(player, enemy, choice).escaped:
+                self.stats["escapes"] += 1
+                return True
         
-        # Постоянные бонусы
-        if boss.boss_type == "dragon":
-            player.max_hp += 30
-            player.hp = min(player.max_hp, player.hp + 30)
-            print(f"🌟 Постоянный бонус: +30 к максимальному здоровью (Сердце дракона)")
+        if enemy.is_alive:
+            self.death_cause = enemy.name
+        else:
+            self.stats["kills"] += 1
+            award_battle_victory(player, enemy)
+        return False
+    
+    def _boss_battle(self, player: Hero, boss: Boss):
+        """Бой с боссом по правилам start_boss_battle"""
+        self.stats["battles"] += 1
+        fight = BossFight(player, boss)
         
-        elif boss.boss_type == "lich":
-            player.strength += 5
-            print(f"🌟 Постоянный бонус: +5 к силе (Знания некроманта)")
+        while not fight.is_over:
+            fight.next_turn()
+            if fight.turn > self.max_battle_turns:
+                raise SimulationStalled()
+            fight.act(self.policy.choose_boss_action(player, boss, fight.turn))
         
-        elif boss.boss_type == "titan":
-            player.armor += 5
-            print(f"🌟 Постоянный бонус: +5 к защите (Кожа титана)")
-    
-    input("\nНажмите Enter, чтобы продолжить...")
+        if boss.is_alive:
+            self.death_cause = boss.name
+            return
+        
+        self.stats["kills"] += 1
+        self.stats["bosses_killed"] += 1
+        award_boss_victory(player, boss)
 
 
-def find_treasure(player: Hero):
-    """Поиск сокровища"""
-    treasures = [
-        ("Золотой слиток", "Добавляет 50 опыта", lambda p: p.gain_exp(50)),
-        ("Малое зелье здоровья", "Восстанавливает 20 HP", lambda p: p.heal(20)),
-        ("Большое зелье здоровья", "Восстанавливает 50 HP", lambda p: p.heal(50)),
-        ("Эликсир силы", "+2 к силе", lambda p: setattr(p, 'strength', p.strength + 2)),
-        ("Эликсир защиты", "+3 к защите", lambda p: setattr(p, 'armor', p.armor + 3)),
-        ("Броня дракона", "+5 к максимальному HP", lambda p: setattr(p, 'max_hp', p.max_hp + 5)),
-        ("Свиток телепортации", "Переносит в случайную комнату", lambda p: None),
-        ("Зачарованный меч", "+3 к силе на следующий бой", lambda p: setattr(p, 'temp_strength_bonus', 3)),
-        ("Щит стража", "+4 к защите на следующий бой", lambda p: setattr(p, 'temp_armor_bonus', 4))
-    ]
+def simulate_run(policy: Optional[Policy] = None, difficulty: int = 2, **options) -> RunResult:
+    """Сыграть одну партию в безголовом режиме"""
+    return HeadlessGame(policy or GreedyPolicy(), difficulty, **options).run()
+
+
+# ========== ПАРАЛЛЕЛЬНЫЙ МОНТЕ-КАРЛО ==========
+DIFFICULTY_NAMES = {1: "Легкий", 2: "Нормальный", 3: "Сложный"}
+
+
+def game_seed(base_seed: int, difficulty: int, index: int) -> int:
+    """Детерминированное зерно для партии с номером index"""
+    return (base_seed * 4 + difficulty) * 1_000_000_007 + index
+
+
+@dataclass
+class DifficultyReport:
+    """Сводная статистика партий одной сложности"""
+    difficulty: int
+    games: int = 0
+    victories: int = 0
+    outcomes: Counter = field(default_factory=Counter)
+    reached: Counter = field(default_factory=Counter)  # уровень -> сколько партий до него дошли
+    cleared: Counter = field(default_factory=Counter)  # уровень -> сколько партий его прошли
+    death_causes: Counter = field(default_factory=Counter)
+    totals: Counter = field(default_factory=Counter)  # суммы характеристик героя
     
-    treasure = random.choice(treasures)
-    name, description, effect = treasure
+    def add(self, result: RunResult):
+        """Учесть итог одной партии"""
+        self.games += 1
+        self.outcomes[result.outcome] += 1
+        if result.outcome == "victory":
+            self.victories += 1
+        for level in range(1, result.levels_cleared + 1):
+            self.reached[level] += 1
+            self.cleared[level] += 1
+        if result.levels_cleared < result.final_level:
+            self.reached[result.final_level] += 1
+        if result.death_cause:
+            self.death_causes[result.death_cause] += 1
+        for stat in ("levels_cleared", "hero_level", "max_hp", "strength", "armor",
+                     "steps", "battles", "kills", "treasures"):
+            self.totals[stat] += getattr(result, stat)
     
-    print(f"\n{'🎁' * 10}")
-    print(f"ВЫ НАШЛИ СОКРОВИЩЕ!")
-    print(f"{'🎁' * 10}")
-    print(f"\nНазвание: {name}")
-    print(f"Эффект: {description}")
+    def merge(self, other: 'DifficultyReport'):
+        """Объединить с отчетом другого исполнителя"""
+        self.games += other.games
+        self.victories += other.victories
+        for name in ("outcomes", "reached", "cleared", "death_causes", "totals"):
+            getattr(self, name).update(getattr(other, name))
     
-    if "телепортации" in name.lower():
-        input("\nНажмите Enter, чтобы активировать свиток...")
-        return "teleport"
-    else:
-        effect(player)
-        print(f"\nЭффект применен!")
-        input("Нажмите Enter, чтобы продолжить...")
-        return None
+    def survival_rate(self, level: int) -> float:
+        """Доля партий, прошедших уровень, среди дошедших до него"""
+        if not self.reached[level]:
+            return 0.0
+        return self.cleared[level] / self.reached[level]
+    
+    def mean(self, stat: str) -> float:
+        """Среднее значение характеристики по всем партиям"""
+        return self.totals[stat] / self.games if self.games else 0.0
 
 
-def show_inventory(player: Hero):
-    """Показать инвентарь игрока"""
-    os.system('cls' if os.name == 'nt' else 'clear')
-    
-    print("╔" + "═" * 50 + "╗")
-    print(f"║{'ИНВЕНТАРЬ':^50}║")
-    print("╚" + "═" * 50 + "╝")
+def _simulate_batch(task: Tuple[int, List[int], int, type]) -> DifficultyReport:
+    """Сыграть пачку партий в процессе-исполнителе"""
+    difficulty, seeds, max_levels, policy_class = task
+    report = DifficultyReport(difficulty)
+    for seed in seeds:
+        game = HeadlessGame(policy_class(), difficulty, max_levels=max_levels, seed=seed)
+        report.add(game.run())
+    return report
+
+
+def run_monte_carlo(games: int, difficulties: Tuple[int, ...] = (1, 2, 3), workers: Optional[int] = None,
+                    base_seed: int = 0, max_levels: int = 15,
+                    policy_class: type = GreedyPolicy) -> Dict[int, DifficultyReport]:
+    """Сыграть games партий каждой сложности на всех ядрах процессора
     
-    if not player.inventory:
-        print("\nВаш инвентарь пуст.")
-    else:
-        print(f"\nПредметы ({len(player.inventory)}):")
-        for i, item in enumerate(player.inventory, 1):
-            print(f"  {i}. {item}")
+    У каждой партии свое зерно, поэтому отчет не зависит от числа
+    исполнителей и порядка их работы.
+    """
+    workers = workers or os.cpu_count() or 1
+    # Мелкие пачки выравнивают нагрузку, крупные - снижают накладные расходы
+    batch_size = max(1, min(64, games // (workers * 4)))
     
-    print(f"\nВаша статистика:")
-    print(f"  Уровень: {player.level}")
-    print(f"  Опыт: {player.exp}/{player.next_level_exp}")
-    print(f"  Здоровье: {player.hp}/{player.max_hp}")
-    print(f"  Сила: {player.strength}")
-    print(f"  Защита: {player.armor}")
+    tasks = []
+    for difficulty in difficulties:
+        for start in range(0, games, batch_size):
+            seeds = [game_seed(base_seed, difficulty, i)
+                     for i in range(start, min(games, start + batch_size))]
+            tasks.append((difficulty, seeds, max_levels, policy_class))
     
-    input("\nНажмите Enter, чтобы вернуться...")
+    reports = {difficulty: DifficultyReport(difficulty) for difficulty in difficulties}
+    if workers == 1:
+        for partial in map(_simulate_batch, tasks):
+            reports[partial.difficulty].merge(partial)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for partial in executor.map(_simulate_batch, tasks):
+                reports[partial.difficulty].merge(partial)
+    return reports
+
+
+def format_balance_report(reports: Dict[int, DifficultyReport]) -> str:
+    """Текстовый отчет о балансе по сложностям"""
+    lines = []
+    for difficulty, report in sorted(reports.items()):
+        name = DIFFICULTY_NAMES.get(difficulty, str(difficulty))
+        lines.append("═" * 50)
+        lines.append(f"СЛОЖНОСТЬ: {name} (партий: {report.games})")
+        lines.append("═" * 50)
+        win_rate = report.victories / report.games * 100 if report.games else 0.0
+        lines.append(f"Победы: {report.victories} ({win_rate:.1f}%)")
+        lines.append(f"Исходы: " + ", ".join(f"{k}={v}" for k, v in report.outcomes.most_common()))
+        lines.append(f"Среднее пройденных уровней: {report.mean('levels_cleared'):.2f}")
+        lines.append(f"Средний герой: ур. {report.mean('hero_level'):.1f}, "
+                     f"HP {report.mean('max_hp'):.0f}, сила {report.mean('strength'):.1f}, "
+                     f"защита {report.mean('armor'):.1f}")
+        
+        lines.append("\nВыживаемость по уровням:")
+        for level in sorted(report.reached):
+            lines.append(f"  Уровень {level:>2}: {report.survival_rate(level) * 100:5.1f}% "
+                         f"({report.cleared[level]}/{report.reached[level]})")
+        
+        if report.death_causes:
+            lines.append("\nПричины гибели:")
+            for cause, count in report.death_causes.most_common(10):
+                lines.append(f"  {cause}: {count}")
+        lines.append("")
+    return "\n".join(lines)
 
 
 def main_menu():
     """Главное меню игры"""
-    os.system('cls' if os.name == 'nt' else 'clear')
+    console.clear()
     
     print("╔" + "═" * 50 + "╗")
     print("║{:^50}║".format("ПОДЗЕМЕЛЬЯ ДРЕВНИХ"))
@@ -1156,13 +4717,13 @@ def main_menu():
     print("ГЛАВНОЕ МЕНЮ:")
     print("=" * 50)
     print("1. Новая игра")
-    print("2. Загрузить игру (в разработке)")
+    print("2. Загрузить игру")
     print("3. Об игре")
     print("4. Выход")
     
     while True:
         try:
-            choice = int(input("\nВаш выбор: "))
+            choice = int(console.input("\nВаш выбор: "))
             if 1 <= choice <= 4:
                 return choice
             else:
@@ -1173,7 +4734,7 @@ def main_menu():
 
 def about_game():
     """Информация об игре"""
-    os.system('cls' if os.name == 'nt' else 'clear')
+    console.clear()
     
     print("╔" + "═" * 50 + "╗")
     print("║{:^50}║".format("ОБ ИГРЕ"))
@@ -1198,6 +4759,7 @@ def about_game():
     print("W/A/S/D - движение")
     print("I - открыть инвентарь")
     print("H - пожертвовать 10 HP для увеличения силы")
+    print("P - сохранить игру (загрузка - пункт 2 главного меню)")
     print("Q - выход из игры")
     
     print("\n" + "=" * 50)
@@ -1207,12 +4769,12 @@ def about_game():
     print("Каждый 3-й уровень - босс с уникальными способностями.")
     print("Развивайте персонажа, находите сокровища и побеждайте врагов!")
     
-    input("\nНажмите Enter, чтобы вернуться в меню...")
+    console.input("\nНажмите Enter, чтобы вернуться в меню...")
 
 
 def choose_difficulty():
     """Выбор сложности игры"""
-    os.system('cls' if os.name == 'nt' else 'clear')
+    console.clear()
     
     print("╔" + "═" * 50 + "╗")
     print("║{:^50}║".format("ВЫБОР СЛОЖНОСТИ"))
@@ -1235,7 +4797,7 @@ def choose_difficulty():
     
     while True:
         try:
-            choice = int(input("\nВаш выбор (1-3): "))
+            choice = int(console.input("\nВаш выбор (1-3): "))
             if 1 <= choice <= 3:
                 return choice
             else:
@@ -1244,10 +4806,464 @@ def choose_difficulty():
             print("Пожалуйста, введите число.")
 
 
-def main():
-    """Основная функция игры"""
-    random.seed()
+def create_player(player_name: str, difficulty: int, rng: Optional[random.Random] = None) -> Hero:
+    """Создание героя с учетом выбранной сложности"""
+    # Настройки сложности
+    if difficulty == 1:  # Новичок
+        hp_mult = 1.2
+        enemy_mult = 0.8
+        heal_mult = 1.5
+        treasure_mult = 1.5
+    elif difficulty == 2:  # Воин
+        hp_mult = 1.0
+        enemy_mult = 1.0
+        heal_mult = 1.0
+        treasure_mult = 1.0
+    else:  # Мастер
+        hp_mult = 0.9
+        enemy_mult = 1.3
+        heal_mult = 0.5
+        treasure_mult = 0.7
+    
+    player = Hero(
+        name=player_name,
+        x=0, y=0,
+        symbol='@',
+        hp=int(100 * hp_mult),
+        strength=10,
+        armor=5,
+        rng=rng
+    )
+    
+    player.difficulty = difficulty
+    player.difficulty_multipliers = {
+        "enemy": enemy_mult,
+        "heal": heal_mult,
+        "treasure": treasure_mult
+    }
+    return player
+
+
+def play_game(player: Hero, difficulty: int, run_seed: int, map_width: int = MAP_WIDTH,
+              map_height: int = MAP_HEIGHT, current_level: int = 1, game_map: Optional[GameMap] = None,
+              journal: Optional[Journal] = None, enemy_turns: bool = False, fog_of_war: bool = False,
+              level_cache: Optional[LevelCache] = None):
+    """Прохождение подземелья начиная с уровня current_level
+    
+    Если передана game_map, игра продолжается на ней с текущей клетки
+    героя (загруженное сохранение), иначе уровень строится заново.
+    Журнал, если он передан, получает ввод игрока и итог каждого хода.
+    enemy_turns - враги ходят по очереди TurnScheduler: бродят, преследуют
+    героя и нападают сами; fog_of_war - на карте видно только поле зрения
+    героя и исследованные клетки (FieldOfView); level_cache - брать уровни
+    из кэша на диске (LevelCache), например для общего "подземелья дня".
+    """
+    max_levels = 15
+    renderer = TerminalRenderer()
+    prefetcher = LevelPrefetcher(difficulty, run_seed, level_cache, width=map_width, height=map_height)
+    resumed_map = game_map
+    if journal is not None:
+        console.listeners.append(journal.record_input)
+    
+    finished = False
+    try:
+        while player.is_alive and current_level <= max_levels:
+            if resumed_map is not None:
+                # Продолжение сохраненного уровня с той же клетки
+                game_map, resumed_map = resumed_map, None
+                if current_level < max_levels:
+                    prefetcher.prefetch(current_level + 1)
+            else:
+                # Карта текущего уровня (обычно уже построена в фоне)
+                game_map = prefetcher.take(current_level)
+                if current_level < max_levels:
+                    prefetcher.prefetch(current_level + 1)
+                start_room = game_map.rooms[0]
+                player.x = start_room.center_x
+                player.y = start_room.center_y
+            
+                # Лечение между уровнями
+                heal_amount = int(30 * player.difficulty_multipliers["heal"])
+                player.heal(heal_amount)
+            
+                # Сообщение о начале уровня
+                console.clear()
+                print("╔" + "═" * 50 + "╗")
+                print(f"║{'УРОВЕНЬ':^20} {current_level:^28} ║")
+                print("╚" + "═" * 50 + "╝")
+            
+                if current_level % 3 == 0:
+                    print(f"\n⚠️  ВНИМАНИЕ! На этом уровне вас ждет БОСС!")
+                    print(f"   Приготовьтесь к тяжелой битве!")
+            
+                print(f"\nВы восстановили {heal_amount} HP.")
+                console.input("\nНажмите Enter, чтобы войти в подземелье...")
+            if fog_of_war and game_map.fov is None:
+                game_map.fov = FieldOfView(game_map)
+            renderer.invalidate()
+        
+            # Цикл уровня
+            level_completed = False
+            escaped = False
+            travel = deque()  # Оставшиеся шаги команды T
+            scheduler = TurnScheduler(game_map, player) if enemy_turns else None
+            turn_spent = False  # Герой потратил ход - очередь врагов
+        
+            while player.is_alive and not level_completed and not escaped:
+                # Ходы врагов, чья очередь подошла до следующего хода героя
+                if turn_spent:
+                    turn_spent = False
+                    for enemy in scheduler.advance():
+                        if not player.is_alive or not enemy.is_alive:
+                            continue
+                        travel.clear()
+                        renderer.invalidate()
+                        print(f"\n⚔️  {enemy.name} нападает на вас!")
+                        console.input("Нажмите Enter, чтобы продолжить...")
+                        if enemy.is_boss:
+                            start_boss_battle(player, enemy)
+                        elif not start_battle(player, enemy) and not enemy.is_alive:
+                            game_map.defeat_enemy(enemy)
+                    if not player.is_alive:
+                        break
+            
+                # Путь по команде T целиком - один ход журнала: при повторе он
+                # прокладывается заново из того же состояния
+                if journal is not None and not travel:
+                    journal.turn(GameState(player, game_map, current_level, run_seed, enemy_turns))
+            
+                # Отрисовка карты (при молчаливом повторе кадры не нужны)
+                if not console.quiet:
+                    game_map.draw(player, renderer)
+            
+                # Проверка победы
+                if game_map.is_cleared():
+                    level_completed = True
+                    print(f"\n{'⭐' * 25}")
+                    print(f"УРОВЕНЬ {current_level} ОЧИЩЕН!")
+                    print(f"{'⭐' * 25}")
+                
+                    # Награда за уровень
+                    level_reward_exp = 50 * current_level
+                    player.gain_exp(level_reward_exp)
+                    print(f"Получено опыта: {level_reward_exp}")
+                
+                    if current_level == max_levels:
+                        print(f"\n🎉 ПОБЕДА! Вы прошли все {max_levels} уровней!")
+                        print("Вы - настоящий герой подземелий!")
+                        console.input("\nНажмите Enter, чтобы продолжить...")
+                        break
+                    else:
+                        console.input("\nНажмите Enter для перехода на следующий уровень...")
+                        current_level += 1
+                        break
+            
+                # Ввод команды (в пути шаги берутся из проложенного маршрута)
+                if travel:
+                    command = travel.popleft()
+                else:
+                    print("\nКоманды: WASD-движение, T-путь к цели, I-инвентарь, H-жертвование, P-сохранить, Q-выход")
+                    command = console.input("Ваш ход: ").lower()
+            
+                if command == 'q':
+                    print("\nВыход из игры...")
+                    escaped = True
+                    break
+            
+                # Инвентарь
+                elif command == 'i':
+                    show_inventory(player)
+                    renderer.invalidate()
+                    continue
+            
+                # Сохранение игры
+                elif command == 'p':
+                    try:
+                        save_game(SAVE_FILE, GameState(player, game_map, current_level, run_seed, enemy_turns))
+                        print(f"\n💾 Игра сохранена в {SAVE_FILE}")
+                    except OSError as error:
+                        print(f"\nНе удалось сохранить игру: {error}")
+                    console.input("Нажмите Enter, чтобы продолжить...")
+                    continue
+            
+                # Путь к цели
+                elif command == 't':
+                    travel = plan_travel(player, game_map)
+                    continue
+            
+                # Жертвование здоровья для силы
+                elif command == 'h':
+                    turn_spent = scheduler is not None
+                    if player.hp > 20:
+                        player.hp -= 10
+                        player.strength += 2
+                        print(f"\n🔥 Вы пожертвовали 10 HP для увеличения силы на 2!")
+                        console.input("Нажмите Enter, чтобы продолжить...")
+                    else:
+                        print("\nНедостаточно здоровья для жертвоприношения!")
+                        console.input("Нажмите Enter, чтобы продолжить...")
+                    continue
+            
+                # Движение
+                new_x, new_y = player.x, player.y
+            
+                if command == 'w':
+                    new_y -= 1
+                elif command == 's':
+                    new_y += 1
+                elif command == 'a':
+                    new_x -= 1
+                elif command == 'd':
+                    new_x += 1
+                else:
+                    print("\nНеизвестная команда!")
+                    console.input("Нажмите Enter, чтобы продолжить...")
+                    continue
+            
+                turn_spent = scheduler is not None
+            
+                # Проверка возможности хода
+                if game_map.is_walkable(new_x, new_y):
+                    # Проверка на ловушку
+                    is_trap, trap_damage = game_map.check_trap(new_x, new_y, player)
+                    if is_trap:
+                        travel.clear()
+                        print(f"\n☠️ Вы наступили на ловушку! Получено {trap_damage} урона!")
+                        if not player.is_alive:
+                            break
+                        console.input("Нажмите Enter, чтобы продолжить...")
+                
+                    # Проверка на врага
+                    enemy = game_map.get_enemy_at(new_x, new_y)
+                    if enemy:
+                        travel.clear()
+                        renderer.invalidate()
+                        if enemy.is_boss:
+                            start_boss_battle(player, enemy)
+                        else:
+                            escaped_from_battle = start_battle(player, enemy)
+                            if escaped_from_battle:
+                                continue
+                            if not enemy.is_alive:
+                                game_map.defeat_enemy(enemy)
+                    
+                        if not player.is_alive:
+                            break
+                
+                    # Проверка на сокровище
+                    elif game_map.get_treasure_at(new_x, new_y):
+                        travel.clear()
+                        result = find_treasure(player)
+                        renderer.invalidate()
+                        game_map.take_treasure(new_x, new_y)
+                    
+                        if result == "teleport":
+                            # Телепортация в случайную комнату
+                            game_map.teleport(player)
+                            continue
+                
+                    # Перемещение игрока
+                    player.x, player.y = new_x, new_y
+            
+                else:
+                    print("\nНельзя пройти сквозь стены!")
+                    console.input("Нажмите Enter, чтобы продолжить...")
+        
+            # Выход из уровня
+            if escaped:
+                break
+    
+        finished = True
+    finally:
+        # Заготовка следующего уровня больше не нужна; журнал прерванной
+        # партии (обрыв ввода, ошибка повтора) остается для восстановления
+        prefetcher.close()
+        if journal is not None:
+            console.listeners.remove(journal.record_input)
+            journal.close(keep=not finished)
+    
+    # Конец игры
+    console.clear()
+    
+    if player.is_alive:
+        print("╔" + "═" * 50 + "╗")
+        print("║{:^50}║".format("ИГРА ЗАВЕРШЕНА"))
+        print("║{:^50}║".format("ВЫ ВЫЖИЛИ!"))
+        print("╚" + "═" * 50 + "╝")
+        
+        print(f"\nИтоговые характеристики:")
+        print(f"Уровень героя: {player.level}")
+        print(f"Достигнутый уровень подземелья: {current_level - 1}")
+        print(f"Сила: {player.strength}")
+        print(f"Защита: {player.armor}")
+        print(f"Максимальное здоровье: {player.max_hp}")
+        
+        if player.inventory:
+            print(f"\nНайденные легендарные предметы:")
+            for item in player.inventory:
+                print(f"  • {item}")
+    
+    else:
+        print("╔" + "═" * 50 + "╗")
+        print("║{:^50}║".format("ВЫ ПАЛИ В БОЮ"))
+        print("║{:^50}║".format(f"Уровень: {current_level}"))
+        print("╚" + "═" * 50 + "╝")
+        
+        print(f"\nВаши достижения:")
+        print(f"Уровень героя: {player.level}")
+        print(f"Пройдено уровней: {current_level - 1}")
+    
+    console.input("\nНажмите Enter, чтобы вернуться в главное меню...")
+
+
+def resume_game(state: GameState, journal: Optional[Journal] = None, enemy_turns: bool = False,
+                fog_of_war: bool = False):
+    """Продолжение партии из сохраненного состояния
+    
+    Режимы берутся из снимка, чтобы партия (и повтор ее журнала) шла по
+    тем же правилам, с какими началась; enemy_turns и fog_of_war действуют
+    только для сохранений старых версий, в которых режима ходов врагов нет.
+    """
+    game_map = state.game_map
+    if state.enemy_turns is not None:
+        enemy_turns = state.enemy_turns
+        fog_of_war = game_map.fov is not None
+    play_game(state.player, game_map.difficulty, state.run_seed, game_map.width, game_map.height,
+              state.current_level, game_map, journal, enemy_turns, fog_of_war)
+
+
+def recover_game(path: str = JOURNAL_FILE, enemy_turns: bool = False, fog_of_war: bool = False):
+    """Продолжение партии, прерванной обрывом соединения, по журналу"""
+    try:
+        journal, state, script = Journal.recover(path)
+    except (OSError, SaveFormatError, JournalError) as error:
+        print(f"\nНе удалось восстановить партию: {error}")
+        console.input("Нажмите Enter, чтобы вернуться в меню...")
+        return
+    
+    # Ходы после контрольной точки повторяются молча, затем игра идет как обычно
+    console.replay(script)
+    try:
+        resume_game(state, journal, enemy_turns, fog_of_war)
+    except JournalError as error:
+        console.stop_replay()
+        print(f"\nНе удалось восстановить партию: {error}")
+        console.input("Нажмите Enter, чтобы вернуться в меню...")
+
+
+def play_endless(player: Hero, difficulty: int, run_seed: int, spill_dir: Optional[str] = None):
+    """Бесконечное подземелье (ChunkedDungeon): без уровней, враги сильнее вдали от входа
+    
+    Измененные области, вытесненные из памяти, сбрасываются в spill_dir.
+    Сохранения и журнал автосохранения в этом режиме не ведутся.
+    """
+    dungeon = ChunkedDungeon(difficulty, run_seed, spill_dir=spill_dir)
+    renderer = TerminalRenderer()
+    player.x, player.y = dungeon.entrance()
+    deepest = 1
+    
+    while player.is_alive:
+        if not console.quiet:
+            dungeon.draw(player, renderer)
+        
+        print("\nКоманды: WASD-движение, I-инвентарь, H-жертвование, Q-выход")
+        command = console.input("Ваш ход: ").lower()
+        
+        if command == 'q':
+            print("\nВыход из игры...")
+            break
+        
+        # Инвентарь
+        elif command == 'i':
+            show_inventory(player)
+            renderer.invalidate()
+            continue
+        
+        # Жертвование здоровья для силы
+        elif command == 'h':
+            if player.hp > 20:
+                player.hp -= 10
+                player.strength += 2
+                print(f"\n🔥 Вы пожертвовали 10 HP для увеличения силы на 2!")
+            else:
+                print("\nНедостаточно здоровья для жертвоприношения!")
+            console.input("Нажмите Enter, чтобы продолжить...")
+            continue
+        
+        # Движение
+        if command not in MOVE_DELTAS:
+            print("\nНеизвестная команда!")
+            console.input("Нажмите Enter, чтобы продолжить...")
+            continue
+        dx, dy = MOVE_DELTAS[command]
+        new_x, new_y = player.x + dx, player.y + dy
+        
+        if not dungeon.is_walkable(new_x, new_y):
+            print("\nНельзя пройти сквозь стены!")
+            console.input("Нажмите Enter, чтобы продолжить...")
+            continue
+        
+        # Проверка на ловушку
+        is_trap, trap_damage = dungeon.check_trap(new_x, new_y, player)
+        if is_trap:
+            print(f"\n☠️ Вы наступили на ловушку! Получено {trap_damage} урона!")
+            if not player.is_alive:
+                break
+            console.input("Нажмите Enter, чтобы продолжить...")
+        
+        # Проверка на врага
+        enemy = dungeon.get_enemy_at(new_x, new_y)
+        if enemy:
+            renderer.invalidate()
+            # После любого боя (и побега) у врага другое HP - область изменена
+            if enemy.is_boss:
+                start_boss_battle(player, enemy)
+                dungeon.mark_dirty(new_x, new_y)
+            else:
+                escaped_from_battle = start_battle(player, enemy)
+                dungeon.mark_dirty(new_x, new_y)
+                if escaped_from_battle:
+                    continue
+            if not enemy.is_alive:
+                dungeon.defeat_enemy(new_x, new_y, enemy)
+            if not player.is_alive:
+                break
+        
+        # Проверка на сокровище
+        elif dungeon.get_treasure_at(new_x, new_y):
+            result = find_treasure(player)
+            renderer.invalidate()
+            dungeon.take_treasure(new_x, new_y)
+            if result == "teleport":
+                dungeon.teleport(player)
+                continue
+        
+        # Перемещение игрока
+        player.x, player.y = new_x, new_y
+        deepest = max(deepest, dungeon.depth(new_x // CHUNK_SIZE, new_y // CHUNK_SIZE))
+    
+    # Конец игры
+    console.clear()
+    print("╔" + "═" * 50 + "╗")
+    print("║{:^50}║".format("ВЫ ВЫЖИЛИ!" if player.is_alive else "ВЫ ПАЛИ В БОЮ"))
+    print("╚" + "═" * 50 + "╝")
+    print(f"\nУровень героя: {player.level}")
+    print(f"Наибольшая глубина: {deepest}")
+    if player.inventory:
+        print(f"\nНайденные легендарные предметы:")
+        for item in player.inventory:
+            print(f"  • {item}")
+    console.input("\nНажмите Enter, чтобы вернуться в главное меню...")
+
+
+def game_session(map_width: int = MAP_WIDTH, map_height: int = MAP_HEIGHT, autosave: bool = True,
+                 enemy_turns: bool = False, fog_of_war: bool = False, endless: bool = False):
+    """Главное меню и партии до выхода из игры
     
+    autosave - вести журнал автосохранения в новых и загруженных партиях;
+    enemy_turns и fog_of_war - режимы с ходами врагов и туманом войны (см. play_game);
+    endless - новые партии идут в бесконечном подземелье (play_endless).
+    """
     while True:
         menu_choice = main_menu()
         
@@ -1256,7 +5272,7 @@ def main():
             difficulty = choose_difficulty()
             
             # Создание игрока
-            os.system('cls' if os.name == 'nt' else 'clear')
+            console.clear()
             print("╔" + "═" * 50 + "╗")
             print("║{:^50}║".format("СОЗДАНИЕ ПЕРСОНАЖА"))
             print("╚" + "═" * 50 + "╝")
@@ -1267,241 +5283,56 @@ def main():
             print(f"{len(HERO_NAMES) + 1}. Ввести своё имя")
             
             try:
-                name_choice = int(input("\nВаш выбор: "))
+                name_choice = int(console.input("\nВаш выбор: "))
                 if 1 <= name_choice <= len(HERO_NAMES):
                     player_name = HERO_NAMES[name_choice - 1]
                 else:
-                    player_name = input("Введите имя героя: ").strip()
+                    player_name = console.input("Введите имя героя: ").strip()
                     if not player_name:
                         player_name = random.choice(HERO_NAMES)
             except:
                 player_name = random.choice(HERO_NAMES)
             
-            # Настройки сложности
-            if difficulty == 1:  # Новичок
-                hp_mult = 1.2
-                enemy_mult = 0.8
-                heal_mult = 1.5
-                treasure_mult = 1.5
-            elif difficulty == 2:  # Воин
-                hp_mult = 1.0
-                enemy_mult = 1.0
-                heal_mult = 1.0
-                treasure_mult = 1.0
-            else:  # Мастер
-                hp_mult = 0.9
-                enemy_mult = 1.3
-                heal_mult = 0.5
-                treasure_mult = 0.7
-            
             # Создание игрока
-            player = Hero(
-                name=player_name,
-                x=0, y=0,
-                symbol='@',
-                hp=int(100 * hp_mult),
-                strength=10,
-                armor=5
-            )
-            
-            player.difficulty = difficulty
-            player.difficulty_multipliers = {
-                "enemy": enemy_mult,
-                "heal": heal_mult,
-                "treasure": treasure_mult
-            }
+            player = create_player(player_name, difficulty)
             
             print(f"\nДобро пожаловать, {player_name}!")
             print("Ваша цель - пройти как можно больше уровней подземелья.")
             print("Каждый 3-й уровень содержит босса с уникальными способностями.")
-            print("\nУправление: WASD - движение, I - инвентарь, H - жертвование, Q - выход")
-            input("\nНажмите Enter, чтобы начать...")
-            
-            # Игровой цикл с уровнями
-            current_level = 1
-            max_levels = 15
-            
-            while player.is_alive and current_level <= max_levels:
-                # Создание карты текущего уровня
-                game_map = GameMap(level=current_level, difficulty=difficulty)
-                start_room = game_map.rooms[0]
-                player.x = start_room.center_x
-                player.y = start_room.center_y
-                
-                # Лечение между уровнями
-                heal_amount = int(30 * player.difficulty_multipliers["heal"])
-                player.heal(heal_amount)
-                
-                # Сообщение о начале уровня
-                os.system('cls' if os.name == 'nt' else 'clear')
-                print("╔" + "═" * 50 + "╗")
-                print(f"║{'УРОВЕНЬ':^20} {current_level:^28} ║")
-                print("╚" + "═" * 50 + "╝")
-                
-                if current_level % 3 == 0:
-                    print(f"\n⚠️  ВНИМАНИЕ! На этом уровне вас ждет БОСС!")
-                    print(f"   Приготовьтесь к тяжелой битве!")
-                
-                print(f"\nВы восстановили {heal_amount} HP.")
-                input("\nНажмите Enter, чтобы войти в подземелье...")
-                
-                # Цикл уровня
-                level_completed = False
-                escaped = False
-                
-                while player.is_alive and not level_completed and not escaped:
-                    # Отрисовка карты
-                    game_map.draw(player)
-                    
-                    # Проверка победы
-                    alive_enemies = [e for e in game_map.enemies if e.is_alive]
-                    boss_alive = game_map.boss and game_map.boss.is_alive
-                    
-                    if not alive_enemies and not boss_alive:
-                        level_completed = True
-                        print(f"\n{'⭐' * 25}")
-                        print(f"УРОВЕНЬ {current_level} ОЧИЩЕН!")
-                        print(f"{'⭐' * 25}")
-                        
-                        # Награда за уровень
-                        level_reward_exp = 50 * current_level
-                        player.gain_exp(level_reward_exp)
-                        print(f"Получено опыта: {level_reward_exp}")
-                        
-                        if current_level == max_levels:
-                            print(f"\n🎉 ПОБЕДА! Вы прошли все {max_levels} уровней!")
-                            print("Вы - настоящий герой подземелий!")
-                            input("\nНажмите Enter, чтобы продолжить...")
-                            break
-                        else:
-                            input("\nНажмите Enter для перехода на следующий уровень...")
-                            current_level += 1
-                            break
-                    
-                    # Ввод команды
-                    print("\nКоманды: WASD-движение, I-инвентарь, H-жертвование, Q-выход")
-                    command = input("Ваш ход: ").lower()
-                    
-                    if command == 'q':
-                        print("\nВыход из игры...")
-                        escaped = True
-                        break
-                    
-                    # Инвентарь
-                    elif command == 'i':
-                        show_inventory(player)
-                        continue
-                    
-                    # Жертвование здоровья для силы
-                    elif command == 'h':
-                        if player.hp > 20:
-                            player.hp -= 10
-                            player.strength += 2
-                            print(f"\n🔥 Вы пожертвовали 10 HP для увеличения силы на 2!")
-                            input("Нажмите Enter, чтобы продолжить...")
-                        else:
-                            print("\nНедостаточно здоровья для жертвоприношения!")
-                            input("Нажмите Enter, чтобы продолжить...")
-                        continue
-                    
-                    # Движение
-                    new_x, new_y = player.x, player.y
-                    
-                    if command == 'w':
-                        new_y -= 1
-                    elif command == 's':
-                        new_y += 1
-                    elif command == 'a':
-                        new_x -= 1
-                    elif command == 'd':
-                        new_x += 1
-                    else:
-                        print("\nНеизвестная команда!")
-                        input("Нажмите Enter, чтобы продолжить...")
-                        continue
-                    
-                    # Проверка возможности хода
-                    if game_map.is_walkable(new_x, new_y):
-                        # Проверка на ловушку
-                        is_trap, trap_damage = game_map.check_trap(new_x, new_y, player)
-                        if is_trap:
-                            print(f"\n☠️ Вы наступили на ловушку! Получено {trap_damage} урона!")
-                            if not player.is_alive:
-                                break
-                            input("Нажмите Enter, чтобы продолжить...")
-                        
-                        # Проверка на врага
-                        enemy = game_map.get_enemy_at(new_x, new_y)
-                        if enemy:
-                            if enemy.is_boss:
-                                start_boss_battle(player, enemy)
-                            else:
-                                escaped_from_battle = start_battle(player, enemy)
-                                if escaped_from_battle:
-                                    continue
-                            
-                            if not player.is_alive:
-                                break
-                        
-                        # Проверка на сокровище
-                        elif game_map.get_treasure_at(new_x, new_y):
-                            result = find_treasure(player)
-                            game_map.treasures.remove((new_x, new_y))
-                            
-                            if result == "teleport":
-                                # Телепортация в случайную комнату
-                                room = random.choice(game_map.rooms)
-                                player.x = random.randint(room.x, room.x + room.w - 1)
-                                player.y = random.randint(room.y, room.y + room.h - 1)
-                                continue
-                        
-                        # Перемещение игрока
-                        player.x, player.y = new_x, new_y
-                    
-                    else:
-                        print("\nНельзя пройти сквозь стены!")
-                        input("Нажмите Enter, чтобы продолжить...")
-                
-                # Выход из уровня
-                if escaped:
-                    break
-            
-            # Конец игры
-            os.system('cls' if os.name == 'nt' else 'clear')
-            
-            if player.is_alive:
-                print("╔" + "═" * 50 + "╗")
-                print("║{:^50}║".format("ИГРА ЗАВЕРШЕНА"))
-                print("║{:^50}║".format("ВЫ ВЫЖИЛИ!"))
-                print("╚" + "═" * 50 + "╝")
-                
-                print(f"\nИтоговые характеристики:")
-                print(f"Уровень героя: {player.level}")
-                print(f"Достигнутый уровень подземелья: {current_level - 1}")
-                print(f"Сила: {player.strength}")
-                print(f"Защита: {player.armor}")
-                print(f"Максимальное здоровье: {player.max_hp}")
-                
-                if player.inventory:
-                    print(f"\nНайденные легендарные предметы:")
-                    for item in player.inventory:
-                        print(f"  • {item}")
+            print("\nУправление: WASD - движение, I - инвентарь, H - жертвование, P - сохранить, Q - выход")
+            console.input("\nНажмите Enter, чтобы начать...")
             
+            if endless:
+                # Измененные области, вытесненные из памяти, живут во временной папке до конца партии
+                with tempfile.TemporaryDirectory(prefix="rpg-chunks-") as spill_dir:
+                    play_endless(player, difficulty, random.getrandbits(63), spill_dir)
             else:
-                print("╔" + "═" * 50 + "╗")
-                print("║{:^50}║".format("ВЫ ПАЛИ В БОЮ"))
-                print("║{:^50}║".format(f"Уровень: {current_level}"))
-                print("╚" + "═" * 50 + "╝")
-                
-                print(f"\nВаши достижения:")
-                print(f"Уровень героя: {player.level}")
-                print(f"Пройдено уровней: {current_level - 1}")
-            
-            input("\nНажмите Enter, чтобы вернуться в главное меню...")
+                play_game(player, difficulty, random.getrandbits(63), map_width, map_height,
+                          journal=Journal() if autosave else None, enemy_turns=enemy_turns,
+                          fog_of_war=fog_of_war)
         
         elif menu_choice == 2:  # Загрузить игру
-            print("\nФункция загрузки игры находится в разработке.")
-            input("Нажмите Enter, чтобы вернуться в меню...")
+            # Партия, прерванная обрывом соединения, новее любого сохранения
+            if autosave and os.path.exists(JOURNAL_FILE):
+                answer = console.input("\nНайдена прерванная партия. Продолжить ее? (д/н): ").strip().lower()
+                if answer in ("", "д", "y"):
+                    recover_game(enemy_turns=enemy_turns, fog_of_war=fog_of_war)
+                    continue
+            
+            try:
+                state = load_game(SAVE_FILE)
+            except FileNotFoundError:
+                print("\nСохранение не найдено.")
+                console.input("Нажмите Enter, чтобы вернуться в меню...")
+                continue
+            except (OSError, SaveFormatError) as error:
+                print(f"\nНе удалось загрузить игру: {error}")
+                console.input("Нажмите Enter, чтобы вернуться в меню...")
+                continue
+            
+            print(f"\nС возвращением, {state.player.name}! Уровень подземелья: {state.current_level}")
+            console.input("Нажмите Enter, чтобы продолжить...")
+            resume_game(state, Journal() if autosave else None, enemy_turns, fog_of_war)
         
         elif menu_choice == 3:  # Об игре
             about_game()
@@ -1511,5 +5342,150 @@ def main():
             break
 
 
+def main(map_width: int = MAP_WIDTH, map_height: int = MAP_HEIGHT, record_path: Optional[str] = None,
+         enemy_turns: bool = False, fog_of_war: bool = False, endless: bool = False):
+    """Основная функция игры
+    
+    record_path - файл, в который записывается сеанс для повтора (replay_session);
+    enemy_turns, fog_of_war и endless - режимы с ходами врагов, туманом войны
+    и бесконечным подземельем.
+    """
+    random.seed()
+    if record_path is None:
+        game_session(map_width, map_height, enemy_turns=enemy_turns, fog_of_war=fog_of_war, endless=endless)
+        return
+    
+    # Вся случайность сеанса выводится из одного зерна: зерна и ввода достаточно для повтора
+    session = Session(random.getrandbits(63), map_width, map_height,
+                      enemy_turns=enemy_turns, fog_of_war=fog_of_war, endless=endless)
+    random.seed(session.seed)
+    console.listeners.append(session.inputs.append)
+    try:
+        game_session(map_width, map_height, enemy_turns=enemy_turns, fog_of_war=fog_of_war, endless=endless)
+    finally:
+        # Запись сохраняется и при падении игры - ради нее она и делается
+        console.listeners.remove(session.inputs.append)
+        save_session(record_path, session)
+
+
+# ========== ЗАПИСЬ И ПОВТОР СЕАНСА ==========
+SESSION_MAGIC = b"RPGR"
+SESSION_VERSION = 2
+_SESSION_HEADER_V1 = struct.Struct("<4sHQII")
+_SESSION_HEADER = struct.Struct("<4sHQIIB")  # 2: добавлены флаги режимов (SESSION_FLAGS)
+SESSION_FLAGS = ("enemy_turns", "fog_of_war", "endless")  # Бит i байта флагов - режим SESSION_FLAGS[i]
+
+
+@dataclass
+class Session:
+    """Записанный сеанс: зерно случайности, размер карты, режимы и весь ввод игрока"""
+    seed: int
+    map_width: int = MAP_WIDTH
+    map_height: int = MAP_HEIGHT
+    inputs: List[str] = field(default_factory=list)
+    enemy_turns: bool = False
+    fog_of_war: bool = False
+    endless: bool = False
+
+
+def save_session(path: str, session: Session):
+    """Запись сеанса: заголовок и сжатые строки ввода"""
+    # Строки ввода не содержат перевода строки - он служит разделителем
+    payload = zlib.compress("\n".join(session.inputs).encode("utf-8"), 9)
+    flags = sum(1 << bit for bit, name in enumerate(SESSION_FLAGS) if getattr(session, name))
+    with open(path, "wb") as file:
+        file.write(_SESSION_HEADER.pack(SESSION_MAGIC, SESSION_VERSION, session.seed,
+                                        session.map_width, session.map_height, flags))
+        file.write(struct.pack("<I", len(session.inputs)))
+        file.write(payload)
+
+
+def load_session(path: str) -> Session:
+    """Чтение сеанса, записанного save_session"""
+    with open(path, "rb") as file:
+        data = file.read()
+    try:
+        magic, version, seed, map_width, map_height = _SESSION_HEADER_V1.unpack_from(data)
+        if magic != SESSION_MAGIC:
+            raise SaveFormatError("Файл не является записью сеанса")
+        if version not in (1, SESSION_VERSION):
+            raise SaveFormatError(f"Неподдерживаемая версия записи сеанса: {version}")
+        header = _SESSION_HEADER if version == SESSION_VERSION else _SESSION_HEADER_V1
+        flags = header.unpack_from(data)[5] if version == SESSION_VERSION else 0
+        count, = struct.unpack_from("<I", data, header.size)
+        text = zlib.decompress(data[header.size + 4:]).decode("utf-8")
+    except (struct.error, zlib.error, UnicodeDecodeError) as error:
+        raise SaveFormatError(f"Запись сеанса повреждена: {error}") from error
+    inputs = text.split("\n") if count else []
+    if len(inputs) != count:
+        raise SaveFormatError("Запись сеанса повреждена: не совпадает число строк ввода")
+    modes = {name: bool(flags >> bit & 1) for bit, name in enumerate(SESSION_FLAGS)}
+    return Session(seed, map_width, map_height, inputs, **modes)
+
+
+def replay_session(path: str, speed: Optional[float] = None) -> float:
+    """Повтор записанного сеанса, возвращает время повтора в секундах
+    
+    Без speed сеанс проигрывается молча и без пауз, кадры карты не строятся.
+    С speed игра идет на экране, паузы и ввод ускорены в speed раз.
+    Повтор идет во временной папке без журнала автосохранения, чтобы не
+    задеть сохранения игрока; сеанс, в котором загружали сохранение, поэтому
+    повторяется без него.
+    """
+    session = load_session(path)
+    random.seed(session.seed)
+    console.replay(session.inputs, quiet=speed is None, speed=speed or 1.0, live_after=False)
+    
+    start = time.perf_counter()
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        try:
+            game_session(session.map_width, session.map_height, autosave=False,
+                         enemy_turns=session.enemy_turns, fog_of_war=session.fog_of_war,
+                         endless=session.endless)
+        except EOFError:
+            pass  # Сеанс был прерван - повтор дошел до конца записи
+        finally:
+            console.stop_replay()
+            os.chdir(cwd)
+    return time.perf_counter() - start
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Разбор аргументов командной строки"""
+    parser = argparse.ArgumentParser(description="Подземелья Древних: Руины Кристального Замка")
+    parser.add_argument("--simulate", type=int, metavar="N",
+                        help="сыграть N партий каждой сложности без интерфейса и вывести отчет о балансе")
+    parser.add_argument("--difficulty", type=int, nargs="+", choices=(1, 2, 3), default=[1, 2, 3],
+                        help="сложности для симуляции")
+    parser.add_argument("--workers", type=int, help="число процессов (по умолчанию - все ядра)")
+    parser.add_argument("--seed", type=int, default=0, help="базовое зерно симуляции")
+    parser.add_argument("--levels", type=int, default=15, help="число уровней в партии")
+    parser.add_argument("--map-width", type=int, default=MAP_WIDTH, help="ширина карты уровня")
+    parser.add_argument("--map-height", type=int, default=MAP_HEIGHT, help="высота карты уровня")
+    parser.add_argument("--enemy-turns", action="store_true",
+                        help="враги ходят сами: бродят, преследуют героя и нападают")
+    parser.add_argument("--fog", action="store_true",
+                        help="туман войны: видно только поле зрения героя и исследованные клетки")
+    parser.add_argument("--endless", action="store_true",
+                        help="бесконечное подземелье: области строятся по мере продвижения героя")
+    parser.add_argument("--record", metavar="FILE", help="записать сеанс игры в файл для повтора")
+    parser.add_argument("--replay", metavar="FILE", help="повторить записанный сеанс")
+    parser.add_argument("--speed", type=float,
+                        help="показывать повтор на экране с ускорением в указанное число раз "
+                             "(по умолчанию сеанс проигрывается молча и мгновенно)")
+    return parser.parse_args(argv)
+
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    args = parse_args()
+    if args.simulate:
+        reports = run_monte_carlo(args.simulate, tuple(args.difficulty), args.workers,
+                                  args.seed, args.levels)
+        print(format_balance_report(reports))
+    elif args.replay:
+        elapsed = replay_session(args.replay, args.speed)
+        print(f"\nПовтор сеанса завершен за {elapsed:.2f} с")
+    else:
+        main(args.map_width, args.map_height, args.record, args.enemy_turns, args.fog, args.endless)
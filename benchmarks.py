@@ -0,0 +1,714 @@
+"""Замеры производительности Подземелий Древних
+
+Запуск всех замеров:        python benchmarks.py
+Запуск выбранных замеров:   python benchmarks.py renderer
+"""
+import argparse
+import gc
+import io
+import random
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+import OOP_RPG
+from OOP_RPG import (GameMap, Hero, MOVE_DELTAS, TerminalRenderer, TILE_FLOOR,
+                     battle_odds, make_tile_grid, np, resolve_battle_turn)
+
+
+def _random_walk(game_map: GameMap, player: Hero, moves: int, rng: random.Random) -> List[tuple]:
+    """Последовательность проходимых клеток для перемещения героя"""
+    path = []
+    x, y = player.x, player.y
+    while len(path) < moves:
+        dx, dy = rng.choice(list(MOVE_DELTAS.values()))
+        if game_map.is_walkable(x + dx, y + dy):
+            x, y = x + dx, y + dy
+            path.append((x, y))
+    return path
+
+
+def bench_renderer(moves: int = 300):
+    """Время кадра и объем вывода на один ход: полный кадр против разностного"""
+    rng = random.Random(1)
+    game_map = GameMap(level=4, difficulty=2, rng=rng)
+    room = game_map.rooms[0]
+    player = Hero("Бенчмарк", room.center_x, room.center_y, '@', 100, 10, 5)
+    path = _random_walk(game_map, player, moves, rng)
+
+    for title, full_redraw in (("Полный кадр", True), ("Разностный", False)):
+        renderer = TerminalRenderer(stream=io.StringIO(), rows=200)
+        game_map.draw(player, renderer)
+        renderer.bytes_written = 0
+
+        start = time.perf_counter()
+        for player.x, player.y in path:
+            if full_redraw:
+                renderer.invalidate()
+            game_map.draw(player, renderer)
+        elapsed = time.perf_counter() - start
+
+        print(f"  {title:<12} {elapsed / moves * 1000:7.3f} мс/кадр, "
+              f"{renderer.bytes_written / moves:9.1f} байт/ход")
+        player.x, player.y = room.center_x, room.center_y
+
+
+def _floor_cells(game_map: GameMap) -> List[tuple]:
+    return [(x, y) for y in range(game_map.grid.height) for x in range(game_map.grid.width)
+            if game_map.is_walkable(x, y)]
+
+
+def _linear_enemy_at(game_map: GameMap, x: int, y: int) -> Optional[Hero]:
+    """Поиск врага полным перебором (как до индекса клеток)"""
+    for enemy in game_map.enemies:
+        if enemy.is_alive and enemy.x == x and enemy.y == y:
+            return enemy
+    return None
+
+
+def bench_entity_index(lookups: int = 20000):
+    """Поиск врага по клетке и кадр карты: индекс клеток против перебора"""
+    for enemy_count in (10, 100, 500, 2000):
+        rng = random.Random(enemy_count)
+        game_map = GameMap(level=5, difficulty=2, rng=rng)
+        floor = _floor_cells(game_map)
+        while len(game_map.enemies) < enemy_count:
+            x, y = rng.choice(floor)
+            game_map.add_enemy(game_map.character_factory.create_normal_enemy(x, y))
+        probes = [rng.choice(floor) for _ in range(lookups)]
+
+        start = time.perf_counter()
+        for x, y in probes:
+            _linear_enemy_at(game_map, x, y)
+        linear = (time.perf_counter() - start) / lookups
+
+        start = time.perf_counter()
+        for x, y in probes:
+            game_map.get_enemy_at(x, y)
+        indexed = (time.perf_counter() - start) / lookups
+
+        player = Hero("Бенчмарк", *floor[0], '@', 100, 10, 5)
+        start = time.perf_counter()
+        for _ in range(20):
+            game_map.compose_frame(player)
+        frame = (time.perf_counter() - start) / 20
+
+        print(f"  врагов {enemy_count:>5}: перебор {linear * 1e6:8.2f} мкс, "
+              f"индекс {indexed * 1e6:6.2f} мкс, кадр {frame * 1000:6.2f} мс")
+
+
+def bench_tile_grid():
+    """Вырезание комнат и туннелей и память сетки: списки против bytearray/NumPy"""
+    kinds = ["list", "bytes"] + (["numpy"] if np is not None else [])
+    for width, height in ((60, 20), (250, 250), (1000, 1000)):
+        rooms = max(8, width * height // 600)
+        rng = random.Random(width)
+        plan = []
+        for _ in range(rooms):
+            w, h = rng.randint(3, 10), rng.randint(3, 10)
+            plan.append((rng.randint(1, width - w - 2), rng.randint(1, height - h - 2), w, h))
+
+        results = []
+        for kind in kinds:
+            start = time.perf_counter()
+            grid = make_tile_grid(width, height, kind)
+            previous = None
+            for x, y, w, h in plan:
+                grid.fill_rect(x, y, w, h, TILE_FLOOR)
+                if previous:
+                    px, py = previous
+                    grid.hline(px, x, py, TILE_FLOOR)
+                    grid.vline(x, py, y, TILE_FLOOR)
+                previous = (x, y)
+            elapsed = time.perf_counter() - start
+            results.append(f"{kind} {elapsed * 1000:8.2f} мс / {grid.nbytes / 1024:8.1f} КБ")
+        print(f"  {width}x{height}, комнат {rooms}: " + "; ".join(results))
+
+
+class _AllPairsRoomIndex:
+    """Проверка пересечений перебором всех комнат (как до индекса)"""
+
+    def __init__(self, *args):
+        self.rooms = []
+
+    def add(self, room):
+        self.rooms.append(room)
+
+    def candidates(self, room):
+        return self.rooms
+
+
+def bench_dungeon_generation():
+    """Генерация уровня на больших картах: корзины комнат против перебора всех пар"""
+    for width, height in ((60, 20), (250, 250), (500, 500), (1000, 1000)):
+        timings = []
+        for title, index_class in (("корзины", OOP_RPG.RoomIndex), ("все пары", _AllPairsRoomIndex)):
+            if index_class is _AllPairsRoomIndex and width * height > 500 * 500:
+                timings.append(f"{title}: пропущено")
+                continue
+            saved, OOP_RPG.RoomIndex = OOP_RPG.RoomIndex, index_class
+            try:
+                start = time.perf_counter()
+                game_map = GameMap(level=5, difficulty=2, rng=random.Random(7), grid_kind="compact",
+                                   width=width, height=height)
+                timings.append(f"{title}: {(time.perf_counter() - start) * 1000:8.1f} мс")
+            finally:
+                OOP_RPG.RoomIndex = saved
+        print(f"  {width}x{height} (комнат {len(game_map.rooms)}, врагов {len(game_map.enemies)}): "
+              + "; ".join(timings))
+
+
+def _simulate_fight(player: Hero, enemy: Hero, rng: random.Random) -> bool:
+    """Один бой по resolve_battle_turn с постоянной атакой, True - победа героя"""
+    hero = Hero(player.name, 0, 0, '@', player.hp, player.strength, player.armor, rng=rng)
+    hero.max_hp = player.max_hp
+    foe = OOP_RPG.Fighter(enemy.name, 0, 0, enemy.symbol, enemy.hp, enemy.strength, enemy.armor, rng=rng)
+    foe.max_hp = enemy.max_hp
+    foe.enemy_type = enemy.enemy_type
+    while hero.is_alive and foe.is_alive:
+        resolve_battle_turn(hero, foe, 1)
+    return hero.is_alive
+
+
+def bench_battle_odds(enemies: int = 2000, fights: int = 2000):
+    """Шансы героя против врагов фабрик: точный расчет против розыгрыша боев"""
+    rng = random.Random(12)
+    player = OOP_RPG.create_player("Бенчмарк", 2)
+    factories = (OOP_RPG.EasyLevelFactory, OOP_RPG.NormalLevelFactory, OOP_RPG.HardLevelFactory)
+    for kind in ("normal", "elite"):
+        count = enemies if kind == "normal" else enemies // 10
+        pool = []
+        for _ in range(count):
+            factory = rng.choice(factories)(rng.randint(1, 15), rng)
+            pool.append(factory.create_normal_enemy(0, 0) if kind == "normal" else factory.create_elite_enemy(0, 0))
+        
+        OOP_RPG._hits_to_kill.cache_clear()
+        OOP_RPG._survival.cache_clear()
+        start = time.perf_counter()
+        ranked = sorted(pool, key=lambda enemy: battle_odds(player, enemy).win)
+        exact = time.perf_counter() - start
+        
+        # Розыгрыш боев для нескольких врагов: время и расхождение с расчетом
+        sample = ranked[::max(1, len(ranked) // 5)]
+        start = time.perf_counter()
+        deviation = 0.0
+        for enemy in sample:
+            wins = sum(_simulate_fight(player, enemy, rng) for _ in range(fights))
+            deviation = max(deviation, abs(wins / fights - battle_odds(player, enemy).win))
+        simulated = (time.perf_counter() - start) / len(sample)
+        
+        print(f"  {kind:<6} расчет {len(pool) / exact:9.0f} врагов/с; розыгрыш {fights} боев "
+              f"{1 / simulated:7.1f} врагов/с; расхождение {deviation:.4f}")
+
+
+def bench_batch_battles(fights: int = 200000, scalar_fights: int = 20000):
+    """Пакетный расчет боев: NumPy против resolve_battle_turn, сверка статистики с точным расчетом"""
+    rng = random.Random(13)
+    player = OOP_RPG.create_player("Бенчмарк", 2)
+    factory = OOP_RPG.NormalLevelFactory(6, rng)
+    matchups = [("обычный", factory.create_normal_enemy(0, 0), 0, 0),
+                ("обычный, побег", factory.create_normal_enemy(0, 0), 20, 0),
+                ("элитный", factory.create_elite_enemy(0, 0), 0, 0),
+                ("элитный, лечение", factory.create_elite_enemy(0, 0), 12, 40)]
+    
+    for title, enemy, escape_below, heal_below in matchups:
+        elite = enemy.enemy_type == OOP_RPG.EnemyType.ELITE
+        stats = (player.hp, player.max_hp, player.strength, player.armor,
+                 enemy.hp, enemy.max_hp, enemy.strength, enemy.armor, elite)
+        exact = battle_odds(player, enemy, escape_below, heal_below)
+        expected = {OOP_RPG.FIGHT_WIN: exact.win, OOP_RPG.FIGHT_DEATH: exact.death,
+                    OOP_RPG.FIGHT_ESCAPE: exact.escape}
+        
+        runs = [("поштучно", scalar_fights, OOP_RPG._resolve_battles_scalar)]
+        if np is not None:
+            runs.append(("NumPy", fights, OOP_RPG._resolve_battles_numpy))
+        
+        print(f"  {title}: точно победа {exact.win:.4f}, гибель {exact.death:.4f}, побег {exact.escape:.4f}")
+        for name, count, run in runs:
+            start = time.perf_counter()
+            # Первый столбец задает число боев, остальные характеристики общие
+            batch = run(([player.hp] * count,) + stats[1:], escape_below, heal_below, 1, 1000)
+            elapsed = time.perf_counter() - start
+            # Отклонение доли исхода от точной вероятности в стандартных ошибках
+            worst = max(abs(batch.rate(code) - p) / max((p * (1 - p) / count) ** 0.5, 1e-12)
+                        for code, p in expected.items())
+            print(f"    {name:<9} {count / elapsed:10.0f} боев/с; победа {batch.rate(OOP_RPG.FIGHT_WIN):.4f}, "
+                  f"гибель {batch.rate(OOP_RPG.FIGHT_DEATH):.4f}, побег {batch.rate(OOP_RPG.FIGHT_ESCAPE):.4f}, "
+                  f"отклонение до {worst:.1f} сигм")
+
+
+def _leveled_player(difficulty: int, level: int) -> Hero:
+    """Герой, прокачанный примерно как к данному уровню подземелья"""
+    player = OOP_RPG.create_player("Бенчмарк", difficulty, random.Random(level))
+    player.verbose = False
+    for _ in range(level):
+        player.level_up()
+    return player
+
+
+class _LegacyHero(Hero):
+    """Враг в виде прежнего Hero: свои __dict__, списки и словарь у каждого"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.enemy_type = OOP_RPG.EnemyType.NORMAL
+        self.is_boss = False
+        self.enraged = False
+        self.abilities_used = []
+        self.cooldowns = {}
+        self.minions = []
+
+
+def bench_enemy_store(turns: int = 200):
+    """Подсчет живых и враги рядом на каждом ходу: список объектов против структуры массивов"""
+    rng = random.Random(17)
+    factory = OOP_RPG.NormalLevelFactory(5, rng)
+    size = 1000
+    probes = [(rng.randrange(size), rng.randrange(size)) for _ in range(turns)]
+    for enemy_count in (1000, 10000, 50000):
+        positions = [(rng.randrange(size), rng.randrange(size)) for _ in range(enemy_count)]
+        timings = []
+        for kind in ("objects", "arrays"):
+            store = OOP_RPG.make_enemy_store(kind)
+            for x, y in positions:
+                store.add(factory.create_normal_enemy(x, y))
+            # Половина врагов уже пала
+            for enemy in list(store)[::2]:
+                enemy.hp = 0
+            
+            start = time.perf_counter()
+            for x, y in probes:
+                store.alive_count()
+                store.nearby(x, y, 8)
+            timings.append(f"{kind} {(time.perf_counter() - start) / turns * 1000:7.3f} мс/ход")
+        print(f"  врагов {enemy_count:>6}: " + "; ".join(timings))
+
+
+def _allocated_per_call(check: Callable[[], object], calls: int) -> float:
+    """Пиковая память сверх исходной (байт) за calls вызовов check"""
+    def measure(function: Callable[[], object]) -> int:
+        tracemalloc.start()
+        base = tracemalloc.get_traced_memory()[0]
+        for _ in range(calls):
+            function()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return peak - base
+    
+    # Вычитаем накладные расходы самого цикла с пустым вызовом
+    return max(measure(check) - measure(lambda: None), 0)
+
+
+def bench_level_completion(turns: int = 2000):
+    """Проверка очистки уровня на каждом ходу: список живых против счетчика GameMap"""
+    for enemy_count in (10, 1000, 10000):
+        rng = random.Random(enemy_count)
+        game_map = GameMap(level=5, difficulty=2, rng=rng)
+        floor = _floor_cells(game_map)
+        while len(game_map.enemies) < enemy_count:
+            game_map.add_enemy(game_map.character_factory.create_normal_enemy(*rng.choice(floor)))
+        # Половина врагов уже пала в боях
+        for enemy in list(game_map.enemies)[::2]:
+            enemy.hp = 0
+            game_map.defeat_enemy(enemy)
+        enemies = game_map.enemies
+        
+        results = []
+        # Прежняя проверка из main() строила список живых врагов на каждом ходу
+        for title, check in (("список живых", lambda: [e for e in enemies if e.is_alive]),
+                             ("has_alive", enemies.has_alive),
+                             ("is_cleared", game_map.is_cleared)):
+            scans = enemies.scans
+            start = time.perf_counter()
+            for _ in range(turns):
+                check()
+            elapsed = (time.perf_counter() - start) / turns
+            scans = (enemies.scans - scans) / turns
+            line = f"{title} {elapsed * 1e6:8.2f} мкс, {_allocated_per_call(check, turns):6.0f} байт"
+            if scans:
+                line += f", проходов {scans:.0f}"
+            results.append(line)
+        print(f"  врагов {enemy_count:>5}: " + "; ".join(results))
+
+
+def bench_nearest_enemies(frames: int = 500):
+    """Панель ближайших врагов на большой карте: перебор хранилища против корзин EnemyRadar"""
+    size = 1000
+    for enemy_count in (1000, 10000, 50000):
+        rng = random.Random(enemy_count)
+        game_map = GameMap(level=5, difficulty=2, rng=rng, grid_kind="bytes",
+                           width=size, height=size, generate=False)
+        factory = game_map.character_factory
+        for _ in range(enemy_count):
+            game_map.add_enemy(factory.create_normal_enemy(rng.randrange(size), rng.randrange(size)))
+        for enemy in list(game_map.enemies)[::2]:
+            enemy.hp = 0
+            game_map.defeat_enemy(enemy)
+        probes = [(rng.randrange(size), rng.randrange(size)) for _ in range(frames)]
+        
+        start = time.perf_counter()
+        for x, y in probes:
+            sorted(game_map.enemies.nearby(x, y, 8), key=lambda item: item[1])[:3]
+        scan = (time.perf_counter() - start) / frames
+        
+        start = time.perf_counter()
+        for x, y in probes:
+            game_map.radar.nearest(x, y, 8, 3)
+        radar = (time.perf_counter() - start) / frames
+        print(f"  врагов {enemy_count:>6}: перебор {scan * 1000:7.3f} мс/кадр, корзины {radar * 1000:6.3f} мс/кадр")
+
+
+def bench_pathfinding(queries: int = 200):
+    """Запросов поиска пути в секунду: A*, поле расстояний с нуля и из кэша, шаг преследования"""
+    def rate(run: Callable[[], object], count: int) -> float:
+        start = time.perf_counter()
+        run()
+        return count / (time.perf_counter() - start)
+    
+    for width, height in ((60, 20), (250, 250), (1000, 1000)):
+        rng = random.Random(width)
+        game_map = GameMap(level=8, difficulty=2, rng=rng, grid_kind="bytes", width=width, height=height)
+        floor = _floor_cells(game_map)
+        pairs = [(rng.choice(floor), rng.choice(floor)) for _ in range(queries)]
+        # Путь через всю большую карту стоит секунды - там запросов меньше
+        count = queries if width * height <= 250 * 250 else 5
+        
+        paths = game_map.paths
+        astar = rate(lambda: [paths.find_path(a, b) for a, b in pairs[:count]], count)
+        cold = rate(lambda: [paths.distance_field(*a) for a, _ in pairs[:count]], count)
+        paths.distance_field(*pairs[0][0])
+        cached = rate(lambda: [paths.distance_field(*pairs[0][0]) for _ in range(queries)], queries)
+        # Преследование: поле радиусом 12 от героя на ход, шаг для каждого врага
+        paths = OOP_RPG.Pathfinder(game_map)
+        chase = rate(lambda: [paths.step_toward(*b, *a, 12) for a, b in pairs], queries)
+        print(f"  {width}x{height}: A* {astar:8.1f}/с, поле с нуля {cold:8.1f}/с, "
+              f"поле из кэша {cached:9.0f}/с, преследование r=12 {chase:7.0f}/с")
+
+
+def bench_turn_scheduler(turns: int = 50):
+    """Очередь ходов врагов: время на действие врага при тысячах врагов на большой карте"""
+    size = 500
+    for enemy_count in (1000, 10000, 50000):
+        rng = random.Random(enemy_count)
+        game_map = GameMap(level=5, difficulty=2, rng=rng, grid_kind="bytes", width=size, height=size)
+        floor = _floor_cells(game_map)
+        factory = game_map.character_factory
+        while len(game_map.enemies) < enemy_count:
+            game_map.add_enemy(factory.create_normal_enemy(*rng.choice(floor)))
+        room = game_map.rooms[0]
+        player = Hero("Бенчмарк", room.center_x, room.center_y, '@', 100, 10, 5)
+        scheduler = OOP_RPG.TurnScheduler(game_map, player)
+        
+        start = time.perf_counter()
+        for _ in range(turns):
+            scheduler.advance()
+        elapsed = time.perf_counter() - start
+        print(f"  врагов {enemy_count:>6}: {scheduler.actions / turns:8.0f} действий за ход героя, "
+              f"{elapsed / scheduler.actions * 1e6:5.2f} мкс/действие, {elapsed / turns * 1000:7.2f} мс/ход")
+
+
+def bench_field_of_view(moves: int = 300):
+    """Пересчет поля зрения при каждом шаге героя по радиусам 8-30 и кадр с туманом войны"""
+    rng = random.Random(22)
+    game_map = GameMap(level=8, difficulty=2, rng=rng, width=250, height=250)
+    room = game_map.rooms[0]
+    player = Hero("Бенчмарк", room.center_x, room.center_y, '@', 100, 10, 5)
+    path = _random_walk(game_map, player, moves, rng)
+    
+    for radius in (8, 12, 20, 30):
+        fov = OOP_RPG.FieldOfView(game_map, radius)
+        start = time.perf_counter()
+        for x, y in path:
+            fov.update(x, y)
+        recompute = (time.perf_counter() - start) / moves
+        
+        # Герой стоит на месте - поле не пересчитывается
+        start = time.perf_counter()
+        for _ in range(moves):
+            fov.update(*path[-1])
+        cached = (time.perf_counter() - start) / moves
+        print(f"  радиус {radius:>2}: пересчет {recompute * 1000:6.3f} мс, без движения {cached * 1e6:5.2f} мкс, "
+              f"видно {len(fov.visible):4} клеток, исследовано {sum(fov.explored):6}")
+    
+    for title, fov in (("без тумана", None), ("с туманом", OOP_RPG.FieldOfView(game_map))):
+        game_map.fov = fov
+        start = time.perf_counter()
+        for player.x, player.y in path:
+            game_map.compose_frame(player)
+        print(f"  кадр {title:<10} {(time.perf_counter() - start) / moves * 1000:6.3f} мс")
+    game_map.fov = None
+
+
+def _walk_chunks(dungeon, distance: int, checkpoints: Optional[List[int]] = None):
+    """Герой идет на восток через distance областей, в каждой забирая сокровище
+    
+    Кадр подгружает окрестные области, а взятое сокровище делает область
+    измененной. С checkpoints в список дописывается занятая память по
+    четвертям пути (нужен запущенный tracemalloc).
+    """
+    # Середина области по высоте: кадр задевает один ряд областей
+    player = Hero("Бенчмарк", 0, OOP_RPG.CHUNK_SIZE // 2, '@', 100, 10, 5)
+    for step in range(distance):
+        player.x = step * OOP_RPG.CHUNK_SIZE
+        dungeon.compose_frame(player)
+        game_map = dungeon.chunk(step, 0)
+        if game_map.treasures:
+            x, y = next(iter(game_map.treasures))
+            dungeon.take_treasure(player.x + x, y)
+        if checkpoints is not None and (step + 1) % (distance // 4) == 0:
+            # Вытесненные карты связаны циклическими ссылками (карта и ее
+            # Pathfinder) - собираем их, чтобы замер показывал живые области
+            gc.collect()
+            checkpoints.append(tracemalloc.get_traced_memory()[0])
+
+
+def bench_chunked_dungeon(distance: int = 120):
+    """Бесконечное подземелье: память при уходе героя далеко от входа и стоимость области"""
+    for title, max_chunks, spill in (("все в памяти", 10 ** 9, False), ("LRU 16", 16, False),
+                                     ("LRU 16 + диск", 16, True)):
+        with tempfile.TemporaryDirectory() as spill_dir:
+            def make_dungeon():
+                return OOP_RPG.ChunkedDungeon(2, seed=23, max_chunks=max_chunks,
+                                              spill_dir=spill_dir if spill else None)
+            
+            # Время и память отдельными проходами: трассировка замедляет постройку
+            dungeon = make_dungeon()
+            start = time.perf_counter()
+            _walk_chunks(dungeon, distance)
+            elapsed = time.perf_counter() - start
+            
+            checkpoints = []
+            tracemalloc.start()
+            _walk_chunks(make_dungeon(), distance, checkpoints)
+            tracemalloc.stop()
+            memory = ", ".join(f"{size / 2 ** 20:4.1f}" for size in checkpoints)
+            print(f"  {title:<14} память по четвертям пути {memory} МБ; "
+                  f"{elapsed / dungeon.generated * 1000:5.2f} мс на построенную область, "
+                  f"построено {dungeon.generated}, сброшено {dungeon.spilled}")
+            
+            if spill:
+                # Возврат к сброшенным областям: чтение снимка вместо постройки
+                start = time.perf_counter()
+                for step in range(distance):
+                    dungeon.chunk(step, 0)
+                print(f"  {'':<14} обратный путь: {(time.perf_counter() - start) / distance * 1000:5.2f} мс "
+                      f"на область, прочитано с диска {dungeon.loaded}")
+
+
+def bench_level_cache(seeds: int = 2):
+    """Уровень из кэша на диске против генерации с нуля"""
+    for width, height in ((60, 20), (200, 200), (400, 400)):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = OOP_RPG.LevelCache(cache_dir)
+            keys = [(seed, level, 1 + level % 3) for seed in range(seeds) for level in range(1, 16)]
+            
+            start = time.perf_counter()
+            maps = [GameMap(level, difficulty, rng=OOP_RPG.level_rng(seed, level), width=width, height=height)
+                    for seed, level, difficulty in keys]
+            cold = (time.perf_counter() - start) / len(keys)
+            
+            for (seed, _, _), game_map in zip(keys, maps):
+                cache.store(seed, game_map)
+            del maps
+            start = time.perf_counter()
+            for key in keys:
+                cache.load(*key, width=width, height=height)
+            cached = (time.perf_counter() - start) / len(keys)
+            print(f"  {width:>3}×{height:<3}: генерация {cold * 1000:7.2f} мс, из кэша {cached * 1000:6.2f} мс "
+                  f"(в {cold / cached:4.1f} раза быстрее), файл {cache.size() / len(keys) / 1024:6.1f} КБ")
+
+
+def _legacy_pick_treasure(rng: random.Random) -> tuple:
+    """Сокровище прежним способом: список кортежей с новыми lambda на каждый вызов"""
+    treasures = [
+        ("Золотой слиток", "Добавляет 50 опыта", lambda p: p.gain_exp(50)),
+        ("Малое зелье здоровья", "Восстанавливает 20 HP", lambda p: p.heal(20)),
+        ("Большое зелье здоровья", "Восстанавливает 50 HP", lambda p: p.heal(50)),
+        ("Эликсир силы", "+2 к силе", lambda p: setattr(p, 'strength', p.strength + 2)),
+        ("Эликсир защиты", "+3 к защите", lambda p: setattr(p, 'armor', p.armor + 3)),
+        ("Броня дракона", "+5 к максимальному HP", lambda p: setattr(p, 'max_hp', p.max_hp + 5)),
+        ("Свиток телепортации", "Переносит в случайную комнату", lambda p: None),
+        ("Зачарованный меч", "+3 к силе на следующий бой", lambda p: setattr(p, 'temp_strength_bonus', 3)),
+        ("Щит стража", "+4 к защите на следующий бой", lambda p: setattr(p, 'temp_armor_bonus', 4))
+    ]
+    return rng.choice(treasures)
+
+
+def bench_treasures(picks: int = 200000):
+    """Находка сокровища: список lambda на каждый вызов против таблицы эффектов"""
+    weighted = OOP_RPG.TreasureTable(OOP_RPG.NORMAL_TREASURES.treasures,
+                                     [4, 4, 2, 2, 2, 1, 2, 2, 2])
+    
+    def legacy(rng: random.Random, player: Hero):
+        name, _, effect = _legacy_pick_treasure(rng)
+        if "телепортации" not in name.lower():
+            effect(player)
+    
+    def table(pick: Callable[[random.Random], object]):
+        def find(rng: random.Random, player: Hero):
+            treasure = pick(rng)
+            if not treasure.teleport:
+                OOP_RPG.apply_treasure(player, treasure)
+        return find
+    
+    for title, find in (("lambda", legacy), ("таблица", table(OOP_RPG.pick_treasure)),
+                        ("таблица с весами", table(weighted.pick))):
+        rng = random.Random(25)
+        player = Hero("Бенчмарк", 0, 0, '@', 100, 10, 5)
+        player.verbose = False
+        start = time.perf_counter()
+        for _ in range(picks):
+            find(rng, player)
+        elapsed = time.perf_counter() - start
+        memory = _allocated_per_call(lambda: find(rng, player), 1000)
+        print(f"  {title:<17} {elapsed / picks * 1e6:5.2f} мкс на находку, {memory:6.0f} байт")
+
+
+def _hero_enemy(factory, x: int, y: int) -> Hero:
+    """Враг отдельным Hero со своими характеристиками (как до шаблонов)"""
+    name = factory.rng.choice(OOP_RPG.ENEMY_NAMES)
+    base_hp, base_str, base_arm, symbol = OOP_RPG.enemy_kind(name)
+    hp = int(base_hp * factory.multiplier * (1 + (factory.level - 1) * 0.15))
+    strength = int(base_str * factory.multiplier * (1 + (factory.level - 1) * 0.1))
+    armor = int(base_arm * factory.multiplier * (1 + (factory.level - 1) * 0.05))
+    enemy = _LegacyHero(name, x, y, symbol, hp, strength, armor, rng=factory.rng)
+    enemy.exp_reward = int(hp * 0.5 + strength * 2)
+    return enemy
+
+
+def bench_enemy_templates(count: int = 100000):
+    """Создание врагов: общие шаблоны против отдельного Hero на каждого"""
+    for title, create in (("Hero", _hero_enemy), ("шаблон", OOP_RPG.NormalLevelFactory.create_normal_enemy)):
+        factory = OOP_RPG.NormalLevelFactory(7, random.Random(3))
+        start = time.perf_counter()
+        enemies = [create(factory, i, i) for i in range(count)]
+        elapsed = time.perf_counter() - start
+        del enemies
+        
+        # Память считаем отдельным проходом: трассировка замедляет создание
+        tracemalloc.start()
+        enemies = [create(factory, i, i) for i in range(count)]
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del enemies
+        print(f"  {title:<7} {elapsed / count * 1e6:6.2f} мкс/враг, {memory / count:6.0f} байт/враг")
+
+
+def _legacy_boss(factory, x: int, y: int) -> Hero:
+    """Босс в виде прежнего Hero с полями, добавленными на лету"""
+    boss = factory.create_boss(x, y)
+    legacy = _LegacyHero(boss.name, x, y, boss.symbol, boss.hp, boss.strength, boss.armor, rng=boss.rng)
+    legacy.is_boss = True
+    legacy.enemy_type = OOP_RPG.EnemyType.BOSS
+    legacy.boss_type = boss.boss_type
+    legacy.exp_reward = boss.exp_reward
+    legacy.abilities = list(boss.abilities)
+    for flag in OOP_RPG._BOSS_FLAGS:
+        if getattr(boss, flag):
+            setattr(legacy, flag, True)
+    return legacy
+
+
+def _measure_memory(create: Callable[[int], object], count: int) -> float:
+    """Байт на объект по tracemalloc для count объектов"""
+    tracemalloc.start()
+    objects = [create(i) for i in range(count)]
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del objects
+    return memory / count
+
+
+def bench_combatant_memory(count: int = 20000):
+    """Память на врага: прежний Hero против классов со __slots__"""
+    factory = OOP_RPG.NormalLevelFactory(9, random.Random(5))
+    factory.enemy_templates()  # Таблица шаблонов общая и в замер не входит
+    variants = [
+        ("враг: Hero (прежний)", lambda i: _hero_enemy(factory, i, i)),
+        ("враг: Fighter", lambda i: OOP_RPG.Fighter("Пещерный Троль", i, i, 'T', 60, 14, 4, rng=factory.rng)),
+        ("враг: Enemy (шаблон)", lambda i: factory.create_normal_enemy(i, i)),
+        ("босс: Hero (прежний)", lambda i: _legacy_boss(factory, i, i)),
+        ("босс: Boss", lambda i: factory.create_boss(i, i)),
+    ]
+    for title, create in variants:
+        print(f"  {title:<22} {_measure_memory(create, count):6.0f} байт/объект ({count} шт.)")
+
+
+def bench_boss_battles(fights: int = 20000, scalar_fights: int = 2000):
+    """Сложность боссов по уровням и сложностям: пакетный расчет против BossFight"""
+    for difficulty in (1, 2, 3):
+        cells = []
+        start = time.perf_counter()
+        for level in (3, 6, 9, 12, 15):
+            player = _leveled_player(difficulty, level)
+            # Лечение ниже 40% здоровья, как у GreedyPolicy
+            batch = OOP_RPG.evaluate_bosses(player, difficulty, level, fights, int(player.max_hp * 0.4), seed=level)
+            cells.append(f"ур.{level:>2} {batch.rate(OOP_RPG.FIGHT_WIN):6.1%}")
+        speed = 5 * fights / (time.perf_counter() - start)
+        print(f"  {OOP_RPG.DIFFICULTY_NAMES[difficulty]:<10} победы: " + ", ".join(cells)
+              + f"; {speed:8.0f} боев/с")
+    
+    # Сверка пакетного расчета с поштучным розыгрышем через BossFight
+    player = _leveled_player(2, 9)
+    heal_below = int(player.max_hp * 0.4)
+    for boss_type in OOP_RPG.BOSS_TYPES:
+        boss = (300, 30, 15, boss_type)
+        start = time.perf_counter()
+        scalar = OOP_RPG._resolve_boss_battles_scalar(
+            ([player.hp] * scalar_fights, player.max_hp, player.strength, player.armor, boss[0]) + boss,
+            heal_below, 100, 1, 1000)
+        scalar_speed = scalar_fights / (time.perf_counter() - start)
+        scalar_rate = scalar.rate(OOP_RPG.FIGHT_WIN)
+        line = f"  {boss_type:<7} поштучно {scalar_speed:7.0f} боев/с, победа {scalar_rate:.4f}"
+        if np is not None:
+            start = time.perf_counter()
+            batch = OOP_RPG.resolve_boss_battles([player.hp] * fights, player.strength, player.armor, *boss,
+                                                 player_max_hp=player.max_hp, heal_below=heal_below, seed=2)
+            batch_speed = fights / (time.perf_counter() - start)
+            p = batch.rate(OOP_RPG.FIGHT_WIN)
+            sigma = max((p * (1 - p) / scalar_fights) ** 0.5, 1e-12)
+            line += (f"; NumPy {batch_speed:8.0f} боев/с, победа {p:.4f}, "
+                     f"расхождение {abs(scalar_rate - p) / sigma:.1f} сигм")
+        print(line)
+
+
+BENCHMARKS: Dict[str, Callable[[], None]] = {
+    "renderer": bench_renderer,
+    "entity_index": bench_entity_index,
+    "tile_grid": bench_tile_grid,
+    "dungeon_generation": bench_dungeon_generation,
+    "battle_odds": bench_battle_odds,
+    "batch_battles": bench_batch_battles,
+    "boss_battles": bench_boss_battles,
+    "enemy_templates": bench_enemy_templates,
+    "enemy_store": bench_enemy_store,
+    "level_completion": bench_level_completion,
+    "nearest_enemies": bench_nearest_enemies,
+    "pathfinding": bench_pathfinding,
+    "turn_scheduler": bench_turn_scheduler,
+    "field_of_view": bench_field_of_view,
+    "chunked_dungeon": bench_chunked_dungeon,
+    "level_cache": bench_level_cache,
+    "treasures": bench_treasures,
+    "combatant_memory": bench_combatant_memory,
+}
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Замеры производительности")
+    parser.add_argument("names", nargs="*", help="замеры для запуска (по умолчанию - все): "
+                        + ", ".join(BENCHMARKS))
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"неизвестные замеры: {', '.join(unknown)}")
+
+    for name in args.names or BENCHMARKS:
+        print(f"[{name}] {BENCHMARKS[name].__doc__}")
+        BENCHMARKS[name]()
+        print()
+
+
+if __name__ == "__main__":
+    main()
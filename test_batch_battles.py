@@ -0,0 +1,47 @@
+"""Сверка пакетного розыгрыша боев (resolve_battles) с точным расчетом battle_odds
+
+Запуск: python -m unittest test_batch_battles
+"""
+import random
+import unittest
+
+import OOP_RPG
+from OOP_RPG import FIGHT_DEATH, FIGHT_ESCAPE, FIGHT_WIN, battle_odds, np
+
+MAX_SIGMAS = 4  # Допустимое отклонение доли исхода от точной вероятности, в стандартных ошибках
+
+
+def _matchups():
+    """Несколько боев с фиксированными врагами и тактиками: (название, враг, побег ниже, лечение ниже)"""
+    factory = OOP_RPG.NormalLevelFactory(6, random.Random(13))
+    return [("обычный", factory.create_normal_enemy(0, 0), 0, 0),
+            ("обычный, побег", factory.create_normal_enemy(0, 0), 20, 0),
+            ("элитный", factory.create_elite_enemy(0, 0), 0, 0),
+            ("элитный, лечение", factory.create_elite_enemy(0, 0), 12, 40)]
+
+
+class BatchBattlesTest(unittest.TestCase):
+    def check(self, resolve, fights: int):
+        player = OOP_RPG.create_player("Тест", 2, random.Random(1))
+        for title, enemy, escape_below, heal_below in _matchups():
+            elite = enemy.enemy_type == OOP_RPG.EnemyType.ELITE
+            stats = ([player.hp] * fights, player.max_hp, player.strength, player.armor,
+                     enemy.hp, enemy.max_hp, enemy.strength, enemy.armor, elite)
+            batch = resolve(stats, escape_below, heal_below, 1, 1000)
+            exact = battle_odds(player, enemy, escape_below, heal_below)
+            for code, p in ((FIGHT_WIN, exact.win), (FIGHT_DEATH, exact.death), (FIGHT_ESCAPE, exact.escape)):
+                error = max((p * (1 - p) / fights) ** 0.5, 1e-12)
+                with self.subTest(matchup=title, outcome=code):
+                    self.assertLessEqual(abs(batch.rate(code) - p), MAX_SIGMAS * error,
+                                         f"доля {batch.rate(code):.4f}, точно {p:.4f}")
+
+    def test_scalar(self):
+        self.check(OOP_RPG._resolve_battles_scalar, 4000)
+
+    @unittest.skipIf(np is None, "NumPy не установлен")
+    def test_numpy(self):
+        self.check(OOP_RPG._resolve_battles_numpy, 20000)
+
+
+if __name__ == "__main__":
+    unittest.main()
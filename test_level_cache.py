@@ -0,0 +1,67 @@
+"""Кэш уровней: поврежденный файл заменяется заново построенным уровнем
+
+Запуск: python -m unittest test_level_cache
+"""
+import os
+import tempfile
+import unittest
+
+import OOP_RPG
+from OOP_RPG import GameMap, LevelCache, SaveFormatError, level_rng
+
+SEED, LEVEL, DIFFICULTY = 20261018, 3, 2
+
+
+class LevelCacheCorruptionTest(unittest.TestCase):
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.cache = LevelCache(temp_dir.name)
+        self.cache.get(SEED, LEVEL, DIFFICULTY)
+        self.path = self.cache.path(SEED, LEVEL, DIFFICULTY, OOP_RPG.MAP_WIDTH, OOP_RPG.MAP_HEIGHT)
+        with open(self.path, "rb") as file:
+            self.data = file.read()
+        self.expected = OOP_RPG._encode_level(SEED, GameMap(LEVEL, DIFFICULTY, rng=level_rng(SEED, LEVEL)))
+        self.assertEqual(self.data, self.expected)
+
+    def corrupt(self, offset: int, value: bytes):
+        data = bytearray(self.data)
+        data[offset:offset + len(value)] = value
+        with open(self.path, "wb") as file:
+            file.write(data)
+
+    def check_rebuilt(self):
+        with self.assertRaises(SaveFormatError):
+            self.cache.load(SEED, LEVEL, DIFFICULTY)
+        misses = self.cache.misses
+        game_map = self.cache.get(SEED, LEVEL, DIFFICULTY)
+        self.assertEqual(self.cache.misses, misses + 1)
+        self.assertEqual(OOP_RPG._encode_level(SEED, game_map), self.expected)
+        # Поврежденный файл перезаписан исправным
+        self.assertIsNotNone(self.cache.load(SEED, LEVEL, DIFFICULTY))
+
+    def tail_offset(self) -> int:
+        tail_size = OOP_RPG._LEVEL_HEADER.unpack_from(self.data)[-1]
+        return len(self.data) - tail_size
+
+    def test_bad_string_count(self):
+        self.corrupt(self.tail_offset(), b"\xff\xff")
+        self.check_rebuilt()
+
+    def test_bad_rng_state(self):
+        self.corrupt(self.tail_offset() - OOP_RPG._RNG_STATE.size, b"\x09")  # Версия генератора
+        self.check_rebuilt()
+
+    def test_truncated(self):
+        with open(self.path, "wb") as file:
+            file.write(self.data[:len(self.data) // 2])
+        self.check_rebuilt()
+
+    def test_empty(self):
+        open(self.path, "wb").close()
+        self.check_rebuilt()
+        self.assertGreater(os.path.getsize(self.path), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()